@@ -1,8 +1,18 @@
 """Actions to be preformed when triggers are activated"""
 from abc import ABC, abstractmethod
-from jinja2 import Template
+from functools import lru_cache
+from fguard.registry import ACTIONMAP
 from fguard.templates.email import EMAIL_TEMPLATE
 import os
+import subprocess
+
+
+@lru_cache(maxsize=None)
+def _get_email_template():
+    # jinja2 is only imported once an email is formatted
+    from jinja2 import Template
+
+    return Template(EMAIL_TEMPLATE)
 
 
 class BaseAction(ABC):
@@ -11,22 +21,20 @@ class BaseAction(ABC):
     def perform(self, message):
         pass
 
+    def flush(self):
+        """Called once all triggers of a run performed their actions"""
+        pass
+
 
 class StdOutAction(BaseAction):
     """Logs results to standard out"""
 
     def _format_message(self, message):
-        output = "\n" + "".join(["#"]*len(message["title"])) + "\n"
-        output += message["title"] + "\n"
-        output += "".join(["#"]*len(message["title"])) + "\n"
-        output += message["description"] + "\n\n"
-        output += "Details:\n"
-        for key, value in message["details"].items():
-            output += str(key)
-            output += " - "
-            output += str(value)
-            output += "\n"
-        return output
+        border = "#" * len(message["title"])
+        lines = ["", border, message["title"], border, message["description"], ""]
+        lines.append("Details:")
+        lines.extend(f"{key} - {value}" for key, value in message["details"].items())
+        return "\n".join(lines) + "\n"
 
     def perform(self, message):
         print(self._format_message(message))
@@ -36,18 +44,16 @@ class EmailAction(BaseAction):
     """Send email with results"""
 
     FROM = "fguard@cbe.vbc.ac.at"
+    # seconds after which a hanging sendmail is killed
+    TIMEOUT = 60
 
     def _format_message(self, message):
         """Formats email body"""
         # construct details
-        details = ""
-        for key, value in message["details"].items():
-            details += str(key)
-            details += " - "
-            details += str(value)
-            details += "<br>"
-        t = Template(EMAIL_TEMPLATE)
-        return t.render({
+        details = "".join(
+            f"{key} - {value}<br>" for key, value in message["details"].items()
+        )
+        return _get_email_template().render({
             "title": message["title"],
             "description": message["description"],
             "details": details
@@ -68,7 +74,10 @@ class EmailAction(BaseAction):
 
     def perform(self, message):
         body = self.get_mail_body(message)
-        os.system(f"echo '{body}' | sendmail -t {self.recipients}")
-
-
-ACTIONMAP = {"stdout": StdOutAction, "email": EmailAction}
+        subprocess.run(
+            ["sendmail", "-t", *self.recipients.split()],
+            input=body,
+            text=True,
+            timeout=self.TIMEOUT,
+            check=True,
+        )
@@ -0,0 +1,105 @@
+"""Aggregates of directory subtrees.
+
+For every walked directory, the number of files, their total size, the
+newest modification date and a fingerprint of the files below it are
+stored in the directories table of a scan. Fingerprints are sums of
+per-file hashes, so they do not depend on the order in which files were
+found and the fingerprint of the files directly in a directory is the
+fingerprint of its subtree minus those of its subdirectories."""
+import os
+import struct
+import hashlib
+from typing import Dict, Iterable, Mapping, Optional
+from fguard.scanfile import ScanTable, FILE_COLUMNS
+
+AGGREGATE_COLUMNS = (
+    ("file_count", "Q"),
+    ("total_size", "Q"),
+    ("max_modified_date", "d"),
+    ("fingerprint", "Q"),
+)
+# aggregates that are compared to find subtrees with changed files
+COMPARED_AGGREGATES = ("file_count", "total_size", "fingerprint")
+_FINGERPRINT_MODULUS = 1 << 64
+_STATISTICS = struct.Struct("<" + "".join(typecode for _, typecode in FILE_COLUMNS))
+
+
+def get_fingerprint(filename: str, file_info: dict) -> int:
+    """Hashes the path and all statistics of a file. Statistics are packed
+    with the types of the scan format, so files read from scan files
+    have the same fingerprint as freshly scanned ones."""
+    digest = hashlib.blake2b(os.fsencode(filename), digest_size=8)
+    digest.update(_STATISTICS.pack(*(file_info[column] for column, _ in FILE_COLUMNS)))
+    digest.update(file_info.get("checksum") or b"")
+    return int.from_bytes(digest.digest(), "little")
+
+
+def normalize_directory(directory: str) -> str:
+    """Strips trailing separators, which root directories may be given with"""
+    return directory.rstrip("/") or "/"
+
+
+def compute_aggregates(
+    files: Mapping[str, dict], directories: Mapping[str, dict]
+) -> Optional[Dict[str, dict]]:
+    """Returns the directories with the aggregates of their subtrees added.
+    Returns None if files lie outside of the walked directories."""
+    aggregates = {
+        normalize_directory(directory): {
+            "file_count": 0,
+            "total_size": 0,
+            "max_modified_date": 0.0,
+            "fingerprint": 0,
+        }
+        for directory in directories
+    }
+    for filename, file_info in files.items():
+        aggregate = aggregates.get(os.path.dirname(filename))
+        if aggregate is None:
+            return None
+        aggregate["file_count"] += 1
+        aggregate["total_size"] += file_info["size"]
+        aggregate["max_modified_date"] = max(
+            aggregate["max_modified_date"], file_info["modified_date"]
+        )
+        aggregate["fingerprint"] += get_fingerprint(filename, file_info)
+    # subdirectories have longer paths than their parents
+    for directory in sorted(aggregates, key=len, reverse=True):
+        aggregate = aggregates[directory]
+        aggregate["fingerprint"] %= _FINGERPRINT_MODULUS
+        parent = aggregates.get(os.path.dirname(directory))
+        if parent is not None and parent is not aggregate:
+            parent["file_count"] += aggregate["file_count"]
+            parent["total_size"] += aggregate["total_size"]
+            parent["max_modified_date"] = max(
+                parent["max_modified_date"], aggregate["max_modified_date"]
+            )
+            parent["fingerprint"] += aggregate["fingerprint"]
+    return {
+        directory: dict(directory_info, **aggregates[normalize_directory(directory)])
+        for directory, directory_info in directories.items()
+    }
+
+
+def has_aggregates(directories: Mapping[str, dict]) -> bool:
+    if isinstance(directories, ScanTable):
+        return len(directories) > 0 and "fingerprint" in directories.get_columns()
+    first = next(iter(directories.values()), None)
+    return first is not None and "fingerprint" in first
+
+
+def get_own_aggregates(aggregate: dict, subdirectories: Iterable[dict]) -> tuple:
+    """Returns the compared aggregates of the files
+    directly in a directory, excluding its subdirectories"""
+    file_count = aggregate["file_count"]
+    total_size = aggregate["total_size"]
+    fingerprint = aggregate["fingerprint"]
+    for subdirectory in subdirectories:
+        file_count -= subdirectory["file_count"]
+        total_size -= subdirectory["total_size"]
+        fingerprint -= subdirectory["fingerprint"]
+    return file_count, total_size, fingerprint % _FINGERPRINT_MODULUS
+
+
+def is_equal(old_aggregate: dict, new_aggregate: dict) -> bool:
+    return all(old_aggregate[key] == new_aggregate[key] for key in COMPARED_AGGREGATES)
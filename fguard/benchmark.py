@@ -0,0 +1,383 @@
+"""Benchmarks for scanning, storing and checking synthetic scans.
+
+Run with
+
+    python -m fguard.benchmark --files 100000
+
+and compare the printed table, or the file written with --output,
+across versions."""
+import os
+import gc
+import sys
+import json
+import time
+import random
+import statistics
+import subprocess
+import resource
+import tempfile
+import platform
+import tracemalloc
+from datetime import datetime, timedelta
+import click
+from fguard.actions import BaseAction
+from fguard.colllectors import CollectionResult, FlatCollector
+from fguard.compact import CompactFiles
+from fguard.triggers import (
+    FilesMissingTrigger,
+    ExperimentsMissingTrigger,
+    FilesModifiedTrigger,
+    BytesLostTrigger,
+    BytesAddedTrigger,
+    FilesShrunkTrigger,
+    run_triggers,
+)
+
+SYNTHETIC_ROOT = "/groups/synthetic/experiments"
+# seconds within which a fresh interpreter should import the command line interface
+STARTUP_BUDGET = 0.2
+# modules that only the commands using them import
+LAZY_MODULES = (
+    "jinja2",
+    "fguard.colllectors",
+    "fguard.triggers",
+    "fguard.store",
+    "fguard.watch",
+)
+
+
+class NullAction(BaseAction):
+    """Action that does nothing, so only the trigger is measured"""
+
+    def perform(self, message):
+        pass
+
+
+def synthetic_paths(
+    number_files, files_per_experiment=100, depth=1, fan_out=4, root=SYNTHETIC_ROOT
+):
+    """Yields paths in the Experiments_XXXXXX/YYYYYY/ layout.
+    Files of an experiment are spread over depth levels of
+    fan_out subdirectories each."""
+    for number in range(number_files):
+        experiment, index = divmod(number, files_per_experiment)
+        directories = [
+            f"{root}/Experiments_{experiment // 100 * 100:06d}",
+            f"{experiment:06d}",
+        ]
+        for level in range(depth):
+            directories.append(f"dir_{index // fan_out ** level % fan_out}")
+        yield "/".join(directories) + f"/file_{number}.tif"
+
+
+def synthetic_result(number_files, date=None, seed=0, **layout):
+    """Creates a collection result of synthetic paths and statistics"""
+    generator = random.Random(seed)
+    files = {
+        path: {
+            "size": generator.randrange(1 << 30),
+            "modified_date": 1600000000.0 + number,
+            "created_date": 1600000000.0 + number,
+            "user_id": 1000 + number % 7,
+        }
+        for number, path in enumerate(synthetic_paths(number_files, **layout))
+    }
+    return CollectionResult(
+        files, [SYNTHETIC_ROOT], date if date is not None else datetime.utcnow()
+    )
+
+
+def remove_files(
+    result, missing_ratio=0.01, missing_experiments=1, seed=0, modified_ratio=0.0
+):
+    """Creates a newer collection result from which a random
+    fraction of files and the files of whole experiments were removed.
+    A modified_ratio fraction of the remaining files shrinks or grows."""
+    generator = random.Random(seed)
+    experiments = sorted(result.get_experiments())
+    removed_experiments = set(experiments[:missing_experiments])
+    files = {
+        path: file_info
+        for path, file_info in result.get_result().items()
+        if generator.random() >= missing_ratio
+        and not any(f"/{experiment}/" in path for experiment in removed_experiments)
+    }
+    for path in [path for path in files if generator.random() < modified_ratio]:
+        file_info = files[path]
+        shrunk = generator.random() < 0.5
+        files[path] = dict(
+            file_info,
+            size=file_info["size"] // 4 if shrunk else file_info["size"] * 2,
+            modified_date=file_info["modified_date"] + 86400,
+        )
+    return CollectionResult(
+        files, result.get_directories_scanned(), result.get_date() + timedelta(days=1)
+    )
+
+
+def create_tree(directory, number_files, **layout):
+    """Creates empty files of the synthetic layout below directory"""
+    for path in synthetic_paths(number_files, root=directory, **layout):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, "w").close()
+
+
+def measure(name, function, memory=True):
+    """Times a function and, if requested, reruns it
+    under tracemalloc to find its peak memory use"""
+    gc.collect()
+    started = time.perf_counter()
+    function()
+    seconds = time.perf_counter() - started
+    measurement = {"name": name, "seconds": seconds, "peak_bytes": None}
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        function()
+        measurement["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return measurement
+
+
+def measure_startup(repeats=5):
+    """Times importing the command line interface in
+    fresh interpreters and reports the median"""
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import fguard.cli"], check=True)
+        timings.append(time.perf_counter() - started)
+    return {
+        "name": "startup",
+        "seconds": statistics.median(timings),
+        "peak_bytes": None,
+    }
+
+
+def run_benchmarks(
+    number_files,
+    scan_files=10000,
+    workers=(1, 8),
+    missing_ratio=0.01,
+    missing_experiments=1,
+    modified_ratio=0.01,
+    memory=True,
+    **layout,
+):
+    """Runs all benchmarks and returns their measurements"""
+    measurements = [measure_startup()]
+    old_result = synthetic_result(number_files, **layout)
+    new_result = remove_files(
+        old_result, missing_ratio, missing_experiments, modified_ratio=modified_ratio
+    )
+    actions = [NullAction()]
+    with tempfile.TemporaryDirectory() as directory:
+        if scan_files:
+            tree = os.path.join(directory, "tree")
+            create_tree(tree, scan_files, **layout)
+            for worker_number in workers:
+
+                def scan():
+                    collector = FlatCollector(
+                        [tree], log_level="WARNING", workers=worker_number
+                    )
+                    collector.collect_files()
+
+                measurements.append(
+                    measure(
+                        f"scan[{scan_files} files, {worker_number} workers]",
+                        scan,
+                        memory,
+                    )
+                )
+        old_path = os.path.join(directory, "old.scan")
+        new_path = os.path.join(directory, "new.scan")
+        measurements.append(
+            measure("save", lambda: old_result.to_file(old_path), memory)
+        )
+        new_result.to_file(new_path)
+        measurements.append(
+            measure(
+                "save[gzip]",
+                lambda: old_result.to_file(old_path + ".gz", "gzip"),
+                memory,
+            )
+        )
+        measurements.append(
+            measure("load", lambda: CollectionResult.from_file(old_path), memory)
+        )
+        measurements.append(
+            measure(
+                "load[mmap]",
+                lambda: CollectionResult.from_file(old_path, memory_map=True),
+                memory,
+            )
+        )
+        checks = {
+            "files_missing": [FilesMissingTrigger],
+            "experiments_missing": [ExperimentsMissingTrigger],
+            "files_modified": [FilesModifiedTrigger],
+            "bytes_lost": [BytesLostTrigger],
+            "bytes_added": [BytesAddedTrigger],
+            "files_shrunk": [FilesShrunkTrigger],
+        }
+        # the triggers that check all evaluates
+        checks["all"] = [
+            trigger_class
+            for trigger_classes in checks.values()
+            for trigger_class in trigger_classes
+        ]
+        for check_name, trigger_classes in checks.items():
+
+            def check(old, new):
+                triggers = [trigger_class(actions) for trigger_class in trigger_classes]
+                run_triggers(triggers, old, new)
+
+            measurements.append(
+                measure(
+                    f"check {check_name}[memory]",
+                    lambda: check(old_result, new_result),
+                    memory,
+                )
+            )
+
+            def check_files():
+                check(
+                    CollectionResult.from_file(old_path, memory_map=True),
+                    CollectionResult.from_file(new_path, memory_map=True),
+                )
+
+            measurements.append(
+                measure(f"check {check_name}[mmap]", check_files, memory)
+            )
+        # the synthetic scans have no aggregates, so the scan files are split by path
+        old_loaded = CollectionResult.from_file(old_path, memory_map=True)
+        new_loaded = CollectionResult.from_file(new_path, memory_map=True)
+        for worker_number in workers:
+
+            def check_parallel():
+                triggers = [trigger_class(actions) for trigger_class in checks["all"]]
+                run_triggers(triggers, old_loaded, new_loaded, workers=worker_number)
+
+            measurements.append(
+                measure(
+                    f"check all[mmap, {worker_number} workers]",
+                    check_parallel,
+                    memory,
+                )
+            )
+        measurements.append(
+            measure(
+                "compact",
+                lambda: CompactFiles.from_mapping(old_result.get_result()),
+                memory,
+            )
+        )
+    return measurements
+
+
+def _format_bytes(number_bytes):
+    if number_bytes is None:
+        return "-"
+    for unit in ["B", "KiB", "MiB", "GiB"]:
+        if number_bytes < 1024:
+            return f"{number_bytes:.1f} {unit}"
+        number_bytes /= 1024
+    return f"{number_bytes:.1f} TiB"
+
+
+@click.command()
+@click.option(
+    "--files",
+    "number_files",
+    default=100000,
+    help="Number of files in the synthetic scans",
+)
+@click.option(
+    "--filesPerExperiment", default=100, help="Number of files per experiment"
+)
+@click.option("--depth", default=1, help="Directory levels within an experiment")
+@click.option("--fanOut", default=4, help="Subdirectories per directory level")
+@click.option(
+    "--missingRatio", default=0.01, help="Fraction of files missing from the new scan"
+)
+@click.option(
+    "--missingExperiments",
+    default=1,
+    help="Number of experiments missing from the new scan",
+)
+@click.option(
+    "--modifiedRatio",
+    default=0.01,
+    help="Fraction of files that shrink or grow in the new scan",
+)
+@click.option(
+    "--scanFiles",
+    default=10000,
+    help="Number of files created on disk for scan benchmarks, 0 to skip",
+)
+@click.option(
+    "--workers",
+    "workers",
+    default=[1, 8],
+    multiple=True,
+    help="Worker numbers of scan benchmarks",
+)
+@click.option(
+    "--memory/--noMemory", default=True, help="Measure peak memory with tracemalloc"
+)
+@click.option("--output", default=None, help="JSON file to write the results to")
+def main(
+    number_files,
+    filesperexperiment,
+    depth,
+    fanout,
+    missingratio,
+    missingexperiments,
+    modifiedratio,
+    scanfiles,
+    workers,
+    memory,
+    output,
+):
+    """Runs the benchmarks and prints their results"""
+    measurements = run_benchmarks(
+        number_files,
+        scan_files=scanfiles,
+        workers=workers,
+        missing_ratio=missingratio,
+        missing_experiments=missingexperiments,
+        modified_ratio=modifiedratio,
+        memory=memory,
+        files_per_experiment=filesperexperiment,
+        depth=depth,
+        fan_out=fanout,
+    )
+    for measurement in measurements:
+        click.echo(
+            f"{measurement['name']:<45} {measurement['seconds']:>10.3f}s"
+            f" {_format_bytes(measurement['peak_bytes']):>12}"
+        )
+    # ru_maxrss is reported in KiB on Linux
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    click.echo(f"{'max resident memory':<45} {'':>11} {_format_bytes(max_rss):>12}")
+    if measurements[0]["seconds"] > STARTUP_BUDGET:
+        click.echo(f"Startup exceeds its budget of {STARTUP_BUDGET:.3f}s!")
+    if output is not None:
+        with open(output, "w") as f:
+            json.dump(
+                {
+                    "date[utc]": str(datetime.utcnow()),
+                    "python": platform.python_version(),
+                    "files": number_files,
+                    "measurements": measurements,
+                    "max_rss_bytes": max_rss,
+                    "startup_budget_seconds": STARTUP_BUDGET,
+                },
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Checkpoints of scans that are streamed to disk.
+
+Collected files are written to sorted runs, scan files of the files of
+a chunk of directories, whenever a chunk is full. Together with every
+run, the walk frontier, the directories that still need to be listed,
+is saved, so an interrupted scan can continue from the last run. At the
+end, the runs are merged into a single sorted stream of files."""
+import os
+import json
+import heapq
+from collections.abc import ItemsView, Mapping
+from typing import List, Optional
+from fguard.scanfile import ScanTable
+
+CHECKPOINT_FILE = "checkpoint.json"
+CHECKPOINT_VERSION = 1
+
+
+def get_run_path(directory: str, index: int) -> str:
+    return os.path.join(directory, f"run_{index:06d}.scan")
+
+
+def save_checkpoint(directory: str, checkpoint: dict) -> None:
+    """Writes the checkpoint under a temporary name and renames it,
+    so an interruption never leaves a partial checkpoint behind"""
+    file_path = os.path.join(directory, CHECKPOINT_FILE)
+    temporary_path = f"{file_path}.tmp"
+    with open(temporary_path, "w") as f:
+        json.dump(dict(checkpoint, version=CHECKPOINT_VERSION), f)
+    os.replace(temporary_path, file_path)
+
+
+def load_checkpoint(directory: str) -> Optional[dict]:
+    file_path = os.path.join(directory, CHECKPOINT_FILE)
+    if not os.path.exists(file_path):
+        return None
+    with open(file_path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("version") != CHECKPOINT_VERSION:
+        raise ValueError(f"Checkpoint version of {file_path} is not supported!")
+    return checkpoint
+
+
+def remove_checkpoint(directory: str) -> None:
+    """Removes the checkpoint and all runs of a checkpoint directory"""
+    checkpoint = load_checkpoint(directory)
+    if checkpoint is None:
+        return
+    for index in range(checkpoint["runs"]):
+        run_path = get_run_path(directory, index)
+        if os.path.exists(run_path):
+            os.remove(run_path)
+    os.remove(os.path.join(directory, CHECKPOINT_FILE))
+
+
+def _unique(items):
+    """Skips items whose key equals the key of the previous item"""
+    previous_key = None
+    for key, value in items:
+        if key != previous_key:
+            yield key, value
+            previous_key = key
+
+
+class _MergedItems(ItemsView):
+    def __iter__(self):
+        return self._mapping.iter_items()
+
+
+class MergedRuns(Mapping):
+    """Read-only mapping over sorted runs, mappings whose iter_items
+    yields their items sorted. Iteration merges the runs, lookups search
+    them one after another. Directories below several root directories
+    can be contained in several runs, their files are only yielded once."""
+
+    def __init__(self, runs: List[Mapping]) -> None:
+        self.runs = runs
+        self._length = None
+
+    def iter_items(self):
+        """Yields (file, statistics) pairs sorted by file name.
+        Files are counted along the way, so the number of files
+        is known without another pass once all runs were merged."""
+        length = 0
+        for item in _unique(
+            heapq.merge(*(run.iter_items() for run in self.runs), key=lambda x: x[0])
+        ):
+            length += 1
+            yield item
+        self._length = length
+
+    def items(self):
+        return _MergedItems(self)
+
+    def __getitem__(self, key):
+        for run in self.runs:
+            if key in run:
+                return run[key]
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return any(key in run for run in self.runs)
+
+    def __iter__(self):
+        for key, _ in self.iter_items():
+            yield key
+
+    def __len__(self):
+        if self._length is None:
+            self._length = sum(1 for _ in self)
+        return self._length
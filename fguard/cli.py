@@ -1,133 +1,966 @@
-"""Command line interface for dircompare"""
+"""Command line interface for dircompare.
+
+Commands import the modules they use when they run, and actions and
+triggers are looked up in lazy registries, so starting the command line
+interface only imports click and the option choices."""
 import os
 import click
-from datetime import datetime
-from fguard.colllectors import CollectionResult, FlatCollector, DATEFORMAT
-from fguard.triggers import FilesMissingTrigger, ExperimentsMissingTrigger
-from fguard.actions import ACTIONMAP
+from datetime import datetime, timedelta
+from fguard.scanfile import COMPRESSIONS
+from fguard.metrics import METRICS_FORMATS
+from fguard.registry import ACTIONMAP, TRIGGERMAP
 import logging
 
 logging.basicConfig()
 
+# byte thresholds are given in GiB on the command line
+GIB = 1024**3
+
 
 @click.group()
 def cli():
     pass
 
 
-@click.command()
-@click.option("--outputDir", default="./", help="Output directory for scan file")
-@click.option("--logLevel", default="INFO", help="Loglevel of collector")
-@click.argument("root_directories", nargs=-1)
-def scan(root_directories, outputdir, loglevel):
-    collector = FlatCollector(root_directories, log_level=loglevel)
-    collector.collect_files()
-    collector.save(outputdir)
+def _open_store(store_path):
+    from fguard.store import ScanStore
 
+    return ScanStore(store_path)
 
-@cli.group()
-def check():
-    pass
+
+def _load_scan(file_path, memory_map=False):
+    from fguard.colllectors import CollectionResult
+
+    return CollectionResult.from_file(file_path, memory_map=memory_map)
+
+
+def _sorted_scan_files(directory="."):
+    """Lists scan files in a directory, newest first"""
+    from fguard.colllectors import DATEFORMAT
+
+    scan_files = [file for file in os.listdir(directory) if file.endswith(".scan")]
+    return [
+        os.path.join(directory, file)
+        for file in sorted(
+            scan_files,
+            key=lambda x: datetime.strptime(x.split("_")[0], DATEFORMAT),
+            reverse=True,
+        )
+    ]
+
+
+def _get_rules(rules_file, include, exclude, max_depth, one_filesystem):
+    """Combines the rules of a rules file with those given as options"""
+    from fguard.rules import ScanRules
+
+    rules = ScanRules.from_file(rules_file) if rules_file is not None else ScanRules()
+    return ScanRules(
+        include=rules.include + list(include),
+        exclude=rules.exclude + list(exclude),
+        max_depth=max_depth if max_depth is not None else rules.max_depth,
+        one_filesystem=one_filesystem or rules.one_filesystem,
+    )
+
+
+def _parse_shard(shard):
+    """Parses a shard given as index/count"""
+    try:
+        index, count = (int(part) for part in shard.split("/"))
+    except ValueError:
+        raise ValueError(f"Shard {shard} is not given as index/count!")
+    return index, count
 
 
 @click.command()
+@click.option("--outputDir", default="./", help="Output directory for scan file")
+@click.option("--logLevel", default="INFO", help="Loglevel of collector")
+@click.option(
+    "--workers", default=1, help="Number of directories that are listed concurrently"
+)
+@click.option(
+    "--compression",
+    default="none",
+    type=click.Choice(COMPRESSIONS),
+    help="Compression of the scan file",
+)
+@click.option(
+    "--incremental",
+    is_flag=True,
+    help="Only rescan directories that changed since the previous scan",
+)
+@click.option(
+    "--checksum",
+    is_flag=True,
+    help="Compute content checksums, reusing those of unchanged files in the previous scan",
+)
+@click.option(
+    "--previousScan",
+    default=None,
+    help="Scan used by incremental scans and to reuse checksums. Defaults to the newest scan in the output directory",
+)
+@click.option(
+    "--metrics",
+    "metrics_formats",
+    type=click.Choice(METRICS_FORMATS),
+    multiple=True,
+    help="Formats in which scan metrics are written next to the scan file",
+)
 @click.option(
-    "--newScan",
+    "--store",
+    "store_path",
     default=None,
-    help="Defaults to the newest scan in the current working directory",
+    help="Scan store the scan is added to instead of writing a scan file",
 )
 @click.option(
-    "--oldScan",
+    "--shard",
     default=None,
-    help="Defaults to the second newest scan in the current working directory",
+    help="Shard i/n of the top-level subdirectories that is scanned into a partial scan",
 )
 @click.option(
-    "--actions",
-    "action_names",
-    default=["stdout"],
-    help="Actions to be performed when triggers fire",
+    "--include",
     multiple=True,
+    help="Glob or, prefixed with re:, regular expression of files that are kept",
 )
 @click.option(
-    "--threshold",
-    default=50,
-    help="Threshold of missing files above which actions are triggered",
+    "--exclude",
+    multiple=True,
+    help="Glob or, prefixed with re:, regular expression of files and directories that are skipped",
+)
+@click.option(
+    "--maxDepth",
+    default=None,
+    type=int,
+    help="Number of directory levels below the root directories that are walked",
+)
+@click.option(
+    "--oneFilesystem",
+    is_flag=True,
+    help="Do not descend into directories on other filesystems",
+)
+@click.option(
+    "--rules",
+    "rules_file",
+    default=None,
+    help="JSON file with include, exclude, max_depth and one_filesystem rules",
+)
+@click.option(
+    "--checkpointDir",
+    default=None,
+    help="Directory to which collected files and the progress of the scan are streamed",
+)
+@click.option(
+    "--chunkSize",
+    default=1000000,
+    help="Number of files kept in memory before they are written to the checkpoint directory",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Continue the interrupted scan in the checkpoint directory",
+)
+@click.option(
+    "--directoryTimeout",
+    default=None,
+    type=float,
+    help="Seconds after which a directory listing is abandoned and its subtree marked unreachable",
 )
-def missing_files(newscan, oldscan, action_names, threshold):
-    # get actions
+@click.argument("root_directories", nargs=-1)
+def scan(
+    root_directories,
+    outputdir,
+    loglevel,
+    workers,
+    compression,
+    incremental,
+    checksum,
+    previousscan,
+    metrics_formats,
+    store_path,
+    shard,
+    include,
+    exclude,
+    maxdepth,
+    onefilesystem,
+    rules_file,
+    checkpointdir,
+    chunksize,
+    resume,
+    directorytimeout,
+):
+    from fguard.colllectors import FlatCollector
+
+    rules = _get_rules(rules_file, include, exclude, maxdepth, onefilesystem)
+    if shard is not None:
+        shard = _parse_shard(shard)
+        if store_path is not None:
+            raise ValueError("Partial scans need to be merged before they are stored!")
+    previous = None
+    if (incremental or checksum) and store_path is not None and previousscan is None:
+        with _open_store(store_path) as store:
+            latest = store.latest(1)
+            if len(latest) > 0:
+                previous = store.load(latest[0].scan_id)
+            elif incremental:
+                raise ValueError("No previous scan found in store!")
+    elif incremental or checksum:
+        if previousscan is None:
+            scan_files = _sorted_scan_files(outputdir)
+            if len(scan_files) > 0:
+                previousscan = scan_files[0]
+            elif incremental:
+                raise ValueError("No previous scan file found in output directory!")
+        if previousscan is not None:
+            previous = _load_scan(previousscan, memory_map=True)
+    collector = FlatCollector(
+        root_directories,
+        log_level=loglevel,
+        workers=workers,
+        previous=previous,
+        incremental=incremental,
+        checksum=checksum,
+        shard=shard,
+        rules=rules,
+        checkpoint_directory=checkpointdir,
+        chunk_size=chunksize,
+        resume=resume,
+        directory_timeout=directorytimeout,
+    )
+    collector.collect_files()
+    if store_path is not None:
+        with _open_store(store_path) as store:
+            store.add(collector.get_file_stats())
+        collector.save_metrics(outputdir, metrics_formats)
+    else:
+        collector.save(
+            outputdir, compression=compression, metrics_formats=metrics_formats
+        )
+    collector.remove_checkpoint()
+
+
+@click.command()
+@click.option("--outputDir", default="./", help="Output directory for merged scan")
+@click.option(
+    "--compression",
+    default="none",
+    type=click.Choice(COMPRESSIONS),
+    help="Compression of the scan file",
+)
+@click.option(
+    "--maxSkew",
+    default=12.0,
+    help="Maximum time in hours between the scans of the shards",
+)
+@click.option(
+    "--store",
+    "store_path",
+    default=None,
+    help="Scan store the merged scan is added to instead of writing a scan file",
+)
+@click.argument("partial_files", nargs=-1)
+def merge(partial_files, outputdir, compression, maxskew, store_path):
+    """Merges the partial scans of all shards into one scan"""
+    from fguard.merge import merge_results
+
+    result = merge_results(
+        [_load_scan(file_path, memory_map=True) for file_path in partial_files],
+        max_skew=timedelta(hours=maxskew),
+    )
+    if store_path is not None:
+        with _open_store(store_path) as scan_store:
+            scan_store.add(result)
+    else:
+        result.to_file(os.path.join(outputdir, result.get_filename()), compression)
+
+
+@cli.group()
+def check():
+    pass
+
+
+def _get_actions(action_names, timeout, retries, ratelimit, alertstate):
+    """Returns a dispatcher that performs the actions once per run"""
+    from fguard.dispatch import ActionDispatcher
+
     actions = []
     for action_name in action_names:
         if action_name not in ACTIONMAP:
             raise ValueError(f"Action '{action_name}' not registered!")
         actions.append(ACTIONMAP[action_name]())
-    # check scans
+    dispatcher = ActionDispatcher(
+        actions,
+        timeout=timeout,
+        retries=retries,
+        rate_limit=ratelimit * 3600,
+        state_file=alertstate,
+    )
+    return [dispatcher]
+
+
+def _dispatch_options(function):
+    function = click.option(
+        "--alertState",
+        default=".fguard_alerts.json",
+        help="File in which the times of alerts are kept for rate limiting",
+    )(function)
+    function = click.option(
+        "--rateLimit",
+        default=0.0,
+        help="Hours in which repeated alerts for the same experiments are suppressed",
+    )(function)
+    function = click.option(
+        "--retries", default=2, help="Number of retries of failed actions"
+    )(function)
+    function = click.option(
+        "--timeout", default=120.0, help="Seconds after which actions are abandoned"
+    )(function)
+    function = click.option(
+        "--actions",
+        "action_names",
+        default=["stdout"],
+        help="Actions to be performed when triggers fire",
+        multiple=True,
+    )(function)
+    return function
+
+
+def _load_stored_scans(store_path, newscan, oldscan):
+    """Loads the scans performed at or before the dates
+    newscan and oldscan, defaulting to the two newest scans"""
+    with _open_store(store_path) as store:
+        if newscan is None or oldscan is None:
+            scans = store.latest(2)
+            if len(scans) < 2:
+                raise ValueError("Not enough scans found in store!")
+        else:
+            scans = [
+                store.at(datetime.fromisoformat(date)) for date in [newscan, oldscan]
+            ]
+            if None in scans:
+                raise ValueError("No scan found at or before the given date!")
+        return tuple(store.load(scan.scan_id) for scan in scans)
+
+
+def _load_scans(newscan, oldscan, store_path=None):
+    """Loads the new and the old scan, defaulting to the
+    two newest scans in the current working directory"""
+    if store_path is not None:
+        return _load_stored_scans(store_path, newscan, oldscan)
     if newscan is None or oldscan is None:
-        # list scans in current working directory
-        scan_files = [file for file in os.listdir() if file.endswith(".scan")]
+        scan_files = _sorted_scan_files()
         if len(scan_files) < 2:
             raise ValueError("Not enough scan files found in directory!")
-        # sort scans by date
-        date_sorted = sorted(
-            scan_files,
-            key=lambda x: datetime.strptime(x.split("_")[0], DATEFORMAT),
-            reverse=True,
+        newscan, oldscan = scan_files[0], scan_files[1]
+    new_result = _load_scan(newscan, memory_map=True)
+    old_result = _load_scan(oldscan, memory_map=True)
+    return new_result, old_result
+
+
+def _get_triggers(
+    trigger_names,
+    actions,
+    threshold,
+    top_number=10,
+    missing_files_directory=None,
+    bytes_lost=100.0,
+    bytes_added=1024.0,
+    shrink_ratio=0.5,
+):
+    trigger_options = {
+        "files_missing": {
+            "number_threshold": threshold,
+            "top_number": top_number,
+            "output_directory": missing_files_directory,
+        },
+        "files_modified": {"top_number": top_number},
+        "bytes_lost": {
+            "bytes_threshold": round(bytes_lost * GIB),
+            "top_number": top_number,
+        },
+        "bytes_added": {
+            "bytes_threshold": round(bytes_added * GIB),
+            "top_number": top_number,
+        },
+        "files_shrunk": {"ratio_threshold": shrink_ratio, "top_number": top_number},
+    }
+    triggers = []
+    for trigger_name in trigger_names:
+        if trigger_name not in TRIGGERMAP:
+            raise ValueError(f"Trigger '{trigger_name}' not registered!")
+        triggers.append(
+            TRIGGERMAP[trigger_name](
+                actions=actions, **trigger_options.get(trigger_name, {})
+            )
         )
-        new_result = CollectionResult.from_file(date_sorted[0])
-        old_result = CollectionResult.from_file(date_sorted[1])
-    else:
-        new_result = CollectionResult.from_file(newscan)
-        old_result = CollectionResult.from_file(oldscan)
+    return triggers
+
+
+def _scan_options(function):
+    function = _dispatch_options(function)
+    function = click.option(
+        "--oldScan",
+        default=None,
+        help="Defaults to the second newest scan in the current working directory",
+    )(function)
+    function = click.option(
+        "--newScan",
+        default=None,
+        help="Defaults to the newest scan in the current working directory",
+    )(function)
+    function = click.option(
+        "--store",
+        "store_path",
+        default=None,
+        help="Scan store to load scans from, --newScan and --oldScan being dates",
+    )(function)
+    return function
+
+
+def _top_option(function):
+    return click.option(
+        "--top",
+        "top_number",
+        default=10,
+        help="Number of experiments, directories and files listed in alerts",
+    )(function)
+
+
+def _bytes_lost_option(function):
+    return click.option(
+        "--bytesLost",
+        default=100.0,
+        help="GiB of missing files above which actions are triggered",
+    )(function)
+
+
+def _bytes_added_option(function):
+    return click.option(
+        "--bytesAdded",
+        default=1024.0,
+        help="GiB added to a root directory or experiment above which actions are triggered",
+    )(function)
+
+
+def _shrink_ratio_option(function):
+    return click.option(
+        "--shrinkRatio",
+        default=0.5,
+        help="Fraction of their size that modified files need to lose to count as shrunk",
+    )(function)
+
+
+def _missing_files_option(function):
+    return click.option(
+        "--missingFilesDir",
+        default=None,
+        help="Directory to which the full list of missing files is written",
+    )(function)
+
+
+@click.command()
+@_scan_options
+@click.option(
+    "--threshold",
+    default=50,
+    help="Threshold of missing files above which actions are triggered",
+)
+@_top_option
+@_missing_files_option
+def missing_files(
+    newscan,
+    oldscan,
+    action_names,
+    store_path,
+    threshold,
+    top_number,
+    missingfilesdir,
+    **dispatch_options,
+):
+    actions = _get_actions(action_names, **dispatch_options)
+    new_result, old_result = _load_scans(newscan, oldscan, store_path)
+    # do comparison
+    trigger = TRIGGERMAP["files_missing"](
+        actions=actions,
+        number_threshold=threshold,
+        top_number=top_number,
+        output_directory=missingfilesdir,
+    )
+    trigger.inspect(old_result, new_result)
+
+
+@click.command()
+@_scan_options
+def missing_experiments(newscan, oldscan, action_names, store_path, **dispatch_options):
+    actions = _get_actions(action_names, **dispatch_options)
+    new_result, old_result = _load_scans(newscan, oldscan, store_path)
+    # do comparison
+    trigger = TRIGGERMAP["experiments_missing"](actions=actions)
+    trigger.inspect(old_result, new_result)
+
+
+@click.command()
+@_scan_options
+@click.option(
+    "--threshold",
+    default=0,
+    help="Threshold of files with changed content above which actions are triggered",
+)
+@_top_option
+def modified_files(
+    newscan,
+    oldscan,
+    action_names,
+    store_path,
+    threshold,
+    top_number,
+    **dispatch_options,
+):
+    actions = _get_actions(action_names, **dispatch_options)
+    new_result, old_result = _load_scans(newscan, oldscan, store_path)
     # do comparison
-    trigger = FilesMissingTrigger(actions=actions, number_threshold=threshold)
+    trigger = TRIGGERMAP["files_modified"](
+        actions=actions, number_threshold=threshold, top_number=top_number
+    )
+    trigger.inspect(old_result, new_result)
+
+
+@click.command()
+@_scan_options
+@_bytes_lost_option
+@_top_option
+def lost_bytes(
+    newscan,
+    oldscan,
+    action_names,
+    store_path,
+    byteslost,
+    top_number,
+    **dispatch_options,
+):
+    """Checks whether the missing files add up to more than --bytesLost"""
+    actions = _get_actions(action_names, **dispatch_options)
+    new_result, old_result = _load_scans(newscan, oldscan, store_path)
+    trigger = TRIGGERMAP["bytes_lost"](
+        actions=actions, bytes_threshold=round(byteslost * GIB), top_number=top_number
+    )
     trigger.inspect(old_result, new_result)
 
 
 @click.command()
+@_scan_options
+@_bytes_added_option
+@_top_option
+def added_bytes(
+    newscan,
+    oldscan,
+    action_names,
+    store_path,
+    bytesadded,
+    top_number,
+    **dispatch_options,
+):
+    """Checks whether a root or an experiment grew by more than --bytesAdded"""
+    actions = _get_actions(action_names, **dispatch_options)
+    new_result, old_result = _load_scans(newscan, oldscan, store_path)
+    trigger = TRIGGERMAP["bytes_added"](
+        actions=actions, bytes_threshold=round(bytesadded * GIB), top_number=top_number
+    )
+    trigger.inspect(old_result, new_result)
+
+
+@click.command()
+@_scan_options
+@_shrink_ratio_option
+@click.option(
+    "--threshold",
+    default=0,
+    help="Threshold of shrunk files above which actions are triggered",
+)
+@_top_option
+def shrunk_files(
+    newscan,
+    oldscan,
+    action_names,
+    store_path,
+    shrinkratio,
+    threshold,
+    top_number,
+    **dispatch_options,
+):
+    """Checks whether modified files lost more than --shrinkRatio of their size"""
+    actions = _get_actions(action_names, **dispatch_options)
+    new_result, old_result = _load_scans(newscan, oldscan, store_path)
+    trigger = TRIGGERMAP["files_shrunk"](
+        actions=actions,
+        ratio_threshold=shrinkratio,
+        number_threshold=threshold,
+        top_number=top_number,
+    )
+    trigger.inspect(old_result, new_result)
+
+
+@click.command(name="all")
+@_scan_options
+@click.option(
+    "--triggers",
+    "trigger_names",
+    default=list(TRIGGERMAP.keys()),
+    help="Triggers to evaluate, defaults to all registered triggers",
+    multiple=True,
+)
+@click.option(
+    "--threshold",
+    default=50,
+    help="Threshold of missing files above which actions are triggered",
+)
+@_top_option
+@_missing_files_option
+@_bytes_lost_option
+@_bytes_added_option
+@_shrink_ratio_option
+@click.option(
+    "--workers",
+    default=1,
+    help="Number of processes that evaluate partitions of the scans",
+)
+def check_all(
+    newscan,
+    oldscan,
+    action_names,
+    store_path,
+    trigger_names,
+    threshold,
+    top_number,
+    missingfilesdir,
+    byteslost,
+    bytesadded,
+    shrinkratio,
+    workers,
+    **dispatch_options,
+):
+    """Evaluates several triggers in a single pass over both scans"""
+    actions = _get_actions(action_names, **dispatch_options)
+    triggers = _get_triggers(
+        trigger_names,
+        actions,
+        threshold,
+        top_number,
+        missingfilesdir,
+        bytes_lost=byteslost,
+        bytes_added=bytesadded,
+        shrink_ratio=shrinkratio,
+    )
+    from fguard.triggers import run_triggers
+
+    new_result, old_result = _load_scans(newscan, oldscan, store_path)
+    run_triggers(triggers, old_result, new_result, workers=workers)
+
+
+@click.command()
+@_dispatch_options
 @click.option(
-    "--newScan",
+    "--scan",
+    "scan_file",
     default=None,
-    help="Defaults to the newest scan in the current working directory",
+    help="Scan whose files are sampled. Defaults to the newest scan in the current working directory",
 )
 @click.option(
-    "--oldScan",
+    "--store",
+    "store_path",
     default=None,
-    help="Defaults to the second newest scan in the current working directory",
+    help="Scan store whose newest scan is sampled instead of a scan file",
+)
+@click.option(
+    "--threshold",
+    default=0.01,
+    help="Estimated fraction of missing files above which actions are triggered",
+)
+@click.option("--sampleSize", default=10000, help="Number of files that are sampled")
+@click.option(
+    "--confidence", default=0.95, help="Confidence level of the reported bounds"
+)
+@click.option(
+    "--workers", default=8, help="Number of sampled files that are stat'ed concurrently"
 )
 @click.option(
-    "--actions",
-    "action_names",
-    default=["stdout"],
-    help="Actions to be performed when triggers fire",
+    "--seed", default=None, type=int, help="Seed of the sample, random by default"
+)
+@_top_option
+def quick(
+    action_names,
+    scan_file,
+    store_path,
+    threshold,
+    samplesize,
+    confidence,
+    workers,
+    seed,
+    top_number,
+    **dispatch_options,
+):
+    """Estimates the fraction of missing files from a sample of the newest scan"""
+    from fguard.sampling import SampledMissingCheck
+
+    actions = _get_actions(action_names, **dispatch_options)
+    if store_path is not None:
+        with _open_store(store_path) as store:
+            latest = store.latest(1)
+            if len(latest) == 0:
+                raise ValueError("No scan found in store!")
+            result = store.load(latest[0].scan_id)
+    else:
+        if scan_file is None:
+            scan_files = _sorted_scan_files()
+            if len(scan_files) == 0:
+                raise ValueError("No scan file found in directory!")
+            scan_file = scan_files[0]
+        result = _load_scan(scan_file, memory_map=True)
+    check = SampledMissingCheck(
+        actions,
+        ratio_threshold=threshold,
+        sample_size=samplesize,
+        confidence=confidence,
+        workers=workers,
+        top_number=top_number,
+        seed=seed,
+    )
+    check.inspect(result)
+
+
+@click.command()
+@click.option("--outputDir", default="./", help="Output directory for checkpoints")
+@click.option("--logLevel", default="INFO", help="Loglevel of watcher")
+@click.option(
+    "--workers", default=1, help="Number of directories that are listed concurrently"
+)
+@_dispatch_options
+@click.option(
+    "--triggers",
+    "trigger_names",
+    default=list(TRIGGERMAP.keys()),
+    help="Triggers to evaluate, defaults to all registered triggers",
     multiple=True,
 )
-def missing_experiments(newscan, oldscan, action_names):
-    # get actions
-    actions = []
-    for action_name in action_names:
-        if action_name not in ACTIONMAP:
-            raise ValueError(f"Action '{action_name}' not registered!")
-        actions.append(ACTIONMAP[action_name]())
-    # check scans
-    if newscan is None or oldscan is None:
-        # list scans in current working directory
-        scan_files = [file for file in os.listdir() if file.endswith(".scan")]
-        if len(scan_files) < 2:
-            raise ValueError("Not enough scan files found in directory!")
-        # sort scans by date
-        date_sorted = sorted(
-            scan_files,
-            key=lambda x: datetime.strptime(x.split("_")[0], DATEFORMAT),
-            reverse=True,
+@click.option(
+    "--threshold",
+    default=50,
+    help="Threshold of missing files above which actions are triggered",
+)
+@click.option(
+    "--debounce",
+    default=5.0,
+    help="Seconds without events after which changes are evaluated",
+)
+@click.option(
+    "--maxWindow",
+    default=60.0,
+    help="Maximum number of seconds after which changes are evaluated",
+)
+@click.option(
+    "--reconcileInterval",
+    default=3600.0,
+    help="Seconds between incremental rescans of all root directories",
+)
+@click.option(
+    "--checkpointInterval",
+    default=3600.0,
+    help="Seconds between writing the watched state to a scan file",
+)
+@click.option(
+    "--noInotify", is_flag=True, help="Only detect changes with periodic rescans"
+)
+@click.argument("root_directories", nargs=-1)
+def watch(
+    root_directories,
+    outputdir,
+    loglevel,
+    workers,
+    action_names,
+    trigger_names,
+    threshold,
+    debounce,
+    maxwindow,
+    reconcileinterval,
+    checkpointinterval,
+    noinotify,
+    **dispatch_options,
+):
+    from fguard.watch import Watcher
+
+    actions = _get_actions(action_names, **dispatch_options)
+    triggers = _get_triggers(trigger_names, actions, threshold)
+    watcher = Watcher(
+        root_directories,
+        triggers,
+        output_directory=outputdir,
+        debounce=debounce,
+        max_window=maxwindow,
+        reconcile_interval=reconcileinterval,
+        checkpoint_interval=checkpointinterval,
+        use_inotify=not noinotify,
+        log_level=loglevel,
+        workers=workers,
+    )
+    try:
+        watcher.run()
+    finally:
+        watcher.close()
+
+
+@cli.group()
+def store():
+    pass
+
+
+@click.command(name="list")
+@click.argument("store_path")
+def list_scans(store_path):
+    """Lists the scans of a store, oldest first"""
+    with _open_store(store_path) as scan_store:
+        for scan_info in scan_store.list_scans():
+            kind = "full" if scan_info.is_full() else f"delta of {scan_info.base_id}"
+            click.echo(
+                f"{scan_info.scan_id}\t{scan_info.date.isoformat()}"
+                f"\t{scan_info.file_count} files\t{kind}"
+            )
+
+
+@click.command(name="import")
+@click.argument("store_path")
+@click.argument("scan_files", nargs=-1)
+def import_scans(store_path, scan_files):
+    """Adds scan files to a store, oldest first"""
+    results = [_load_scan(file_path) for file_path in scan_files]
+    with _open_store(store_path) as scan_store:
+        for result in sorted(results, key=lambda result: result.get_date()):
+            scan_store.add(result)
+
+
+@click.command()
+@click.option("--date", default=None, help="Defaults to the newest scan")
+@click.option("--outputDir", default="./", help="Output directory for scan file")
+@click.option(
+    "--compression",
+    default="none",
+    type=click.Choice(COMPRESSIONS),
+    help="Compression of the scan file",
+)
+@click.argument("store_path")
+def export(store_path, date, outputdir, compression):
+    """Writes the scan performed at or before date to a scan file"""
+    with _open_store(store_path) as scan_store:
+        if date is None:
+            scans = scan_store.latest(1)
+            scan_info = scans[0] if scans else None
+        else:
+            scan_info = scan_store.at(datetime.fromisoformat(date))
+        if scan_info is None:
+            raise ValueError("No scan found in store!")
+        result = scan_store.load(scan_info.scan_id)
+    result.to_file(os.path.join(outputdir, result.get_filename()), compression)
+
+
+@click.command()
+@click.option("--keepLast", default=None, type=int, help="Number of newest scans kept")
+@click.option(
+    "--keepDays", default=None, type=int, help="Age in days up to which scans are kept"
+)
+@click.argument("store_path")
+def prune(store_path, keeplast, keepdays):
+    """Removes old scans from a store and compacts it"""
+    keep_after = None
+    if keepdays is not None:
+        keep_after = datetime.utcnow() - timedelta(days=keepdays)
+    with _open_store(store_path) as scan_store:
+        removed = scan_store.apply_retention(keep_last=keeplast, keep_after=keep_after)
+    click.echo(f"Removed {len(removed)} scans")
+
+
+@cli.group()
+def history():
+    pass
+
+
+def _format_scan(scan_info):
+    return scan_info.date.isoformat() if scan_info is not None else "never"
+
+
+def _echo_history(file_history, format_state):
+    click.echo(f"first seen: {_format_scan(file_history.first_seen)}")
+    click.echo(f"last seen:  {_format_scan(file_history.last_seen)}")
+    for scan_info, kind, state in file_history.events:
+        details = format_state(state) if state is not None else ""
+        click.echo(f"{_format_scan(scan_info)}\t{kind:<8}\t{details}")
+
+
+@click.command(name="file")
+@click.argument("store_path")
+@click.argument("path")
+def file_history(store_path, path):
+    """Shows when a file was first and last seen and how it changed"""
+
+    def format_state(file_info):
+        modified_date = datetime.utcfromtimestamp(file_info["modified_date"])
+        return f"size {file_info['size']}, modified {modified_date.isoformat()}"
+
+    with _open_store(store_path) as scan_store:
+        _echo_history(scan_store.get_file_history(path), format_state)
+
+
+@click.command(name="experiment")
+@click.argument("store_path")
+@click.argument("experiment_number")
+def experiment_history(store_path, experiment_number):
+    """Shows when an experiment was first and last seen
+    and how its number of files and size changed"""
+
+    def format_state(state):
+        return f"{state[0]} files, {state[1]} bytes"
+
+    with _open_store(store_path) as scan_store:
+        _echo_history(
+            scan_store.get_experiment_history(experiment_number), format_state
         )
-        new_result = CollectionResult.from_file(date_sorted[0])
-        old_result = CollectionResult.from_file(date_sorted[1])
-    else:
-        new_result = CollectionResult.from_file(newscan)
-        old_result = CollectionResult.from_file(oldscan)
-    # do comparison
-    trigger = ExperimentsMissingTrigger(actions=actions)
-    trigger.inspect(old_result, new_result)
+
+
+@click.command(name="scans")
+@click.option("--since", default=None, help="Date of the oldest scan shown")
+@click.option("--until", default=None, help="Date of the newest scan shown")
+@click.argument("store_path")
+def scan_history(store_path, since, until):
+    """Shows the number of files that changed in every scan"""
+    with _open_store(store_path) as scan_store:
+        scans = scan_store.list_scans()
+    for scan_info in scans:
+        if since is not None and scan_info.date < datetime.fromisoformat(since):
+            continue
+        if until is not None and scan_info.date > datetime.fromisoformat(until):
+            continue
+        changes = "first scan"
+        if scan_info.added is not None:
+            changes = (
+                f"{scan_info.added} added\t{scan_info.missing} missing"
+                f"\t{scan_info.modified} modified"
+            )
+        click.echo(
+            f"{_format_scan(scan_info)}\t{scan_info.file_count} files\t{changes}"
+        )
+
 
 cli.add_command(scan)
+cli.add_command(merge)
+cli.add_command(watch)
+history.add_command(file_history)
+history.add_command(experiment_history)
+history.add_command(scan_history)
+store.add_command(list_scans)
+store.add_command(import_scans)
+store.add_command(export)
+store.add_command(prune)
 check.add_command(missing_files)
 check.add_command(missing_experiments)
+check.add_command(modified_files)
+check.add_command(lost_bytes)
+check.add_command(added_bytes)
+check.add_command(shrunk_files)
+check.add_command(check_all)
+check.add_command(quick)
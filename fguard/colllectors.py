@@ -1,21 +1,154 @@
 """Classes for collecting files from a directory tree"""
 import os
+import mmap
+import zlib
+import socket
+import hashlib
 from datetime import datetime
 import pickle
+import itertools
+import time
+import queue
 import logging
-from typing import List
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Optional, Tuple
+from fguard.compact import CompactFiles
+from fguard.checkpoint import (
+    MergedRuns,
+    get_run_path,
+    load_checkpoint,
+    remove_checkpoint,
+    save_checkpoint,
+)
+from fguard.rules import ScanRules
+from fguard.aggregates import (
+    AGGREGATE_COLUMNS,
+    compute_aggregates,
+    has_aggregates,
+    normalize_directory,
+)
+from fguard.experiments import ExperimentIndex
+from fguard.metrics import ScanMetrics
+from fguard.scanfile import (
+    ScanTable,
+    ScanWriter,
+    is_scan_file,
+    read_footer,
+    FILE_COLUMNS,
+    CHECKSUM_COLUMN,
+)
 
 
 DATEFORMAT = "%Y-%m-%dT%H:%M:%S"
+DIRECTORY_COLUMNS = (("modified_date", "d"),)
+CHECKSUM_BUFFER_SIZE = 1 << 20
+# statistics that need to be unchanged to reuse the checksum of a previous scan
+CHECKSUM_KEYS = ("size", "modified_date", "created_date")
+# deadlines of directory listings are at least this multiple of the
+# average listing time of their root directory
+TIMEOUT_FACTOR = 20.0
+# weight of a new listing time in the average of its root directory
+TIMEOUT_SMOOTHING = 0.1
+
+
+def compute_checksum(file_path) -> bytes:
+    """Computes the BLAKE2 digest of a file's content"""
+    digest = hashlib.blake2b(digest_size=16)
+    buffer = bytearray(CHECKSUM_BUFFER_SIZE)
+    view = memoryview(buffer)
+    with open(file_path, "rb", buffering=0) as f:
+        while True:
+            length = f.readinto(buffer)
+            if not length:
+                break
+            digest.update(view[:length])
+    return digest.digest()
+
+
+def _get_file_info(file_stats) -> dict:
+    return {
+        "size": file_stats.st_size,
+        "modified_date": file_stats.st_mtime,
+        "created_date": file_stats.st_ctime,
+        "user_id": file_stats.st_uid,
+    }
+
+
+def get_shard(directory: str, shard_count: int) -> int:
+    """Assigns a directory to a shard. The hash only depends on
+    the path, so every host assigns directories the same way."""
+    return zlib.crc32(os.fsencode(directory)) % shard_count
+
+
+def _sorted_items(mapping):
+    """Iterates (key, value) pairs of a mapping sorted by key"""
+    if isinstance(mapping, (ScanTable, CompactFiles, MergedRuns)):
+        return mapping.iter_items()
+    return iter(sorted(mapping.items(), key=lambda item: item[0]))
+
+
+def _iter_table_children(table, directory):
+    """Yields the (key, value) pairs of a scan table whose keys lie
+    directly in directory. Subtrees of subdirectories are skipped by
+    seeking past them, as "0" follows the separator. The key of the
+    directory itself, e.g. a root given with a trailing separator, is skipped."""
+    prefix = normalize_directory(directory).rstrip("/") + "/"
+    start = prefix
+    while start is not None:
+        seek, start = start, None
+        for key, value in table.iter_items(seek):
+            if not key.startswith(prefix):
+                return
+            if key == prefix:
+                continue
+            separator = key.find("/", len(prefix))
+            if separator < 0:
+                yield key, value
+            else:
+                start = key[:separator] + "0"
+                break
 
 
 class CollectionResult:
     """Represents result of collection"""
 
-    def __init__(self, result, directories_scanned, date):
+    def __init__(
+        self,
+        result,
+        directories_scanned,
+        date,
+        directories=None,
+        experiments=None,
+        shards=None,
+        rules=None,
+        unreachable=None,
+    ):
         self.result = result
         self.directories_scanned = directories_scanned
         self.date = date
+        # statistics of the walked directories, used for incremental scans
+        self.directories = directories if directories is not None else {}
+        # experiment index, built lazily for results that were not loaded from file
+        self.experiments = experiments
+        # index, count, date and host of the shards of partial or merged scans
+        self.shards = shards if shards is not None else []
+        # rules the scan was taken with, empty if all files were scanned
+        self.rules = rules if rules is not None else {}
+        # directories whose listing exceeded its deadline, their subtrees were not scanned
+        self.unreachable = unreachable if unreachable is not None else []
+        # keys grouped by parent directory, built lazily for in-memory results
+        self._children = {}
+
+    def __setstate__(self, state):
+        """Fills attributes missing from scans pickled by earlier versions"""
+        self.directories = {}
+        self.experiments = None
+        self.shards = []
+        self.rules = {}
+        self.unreachable = []
+        self._children = {}
+        self.__dict__.update(state)
 
     def __contains__(self, file_name):
         return file_name in self.result
@@ -29,16 +162,151 @@ class CollectionResult:
     def get_files(self):
         return self.result.keys()
 
+    def get_directories(self):
+        return self.directories
+
+    def get_experiment_index(self) -> ExperimentIndex:
+        if self.experiments is None:
+            self.experiments = ExperimentIndex.from_files(
+                file for file, _ in self.iter_sorted_items()
+            )
+        return self.experiments
+
+    def get_experiments(self):
+        """Returns the experiment numbers of the scanned files"""
+        return self.get_experiment_index().get_experiments()
+
+    def iter_sorted_items(self):
+        """Yields (file, statistics) pairs sorted by file name"""
+        return _sorted_items(self.result)
+
+    def has_aggregates(self):
+        """Whether the walked directories hold aggregates of their subtrees"""
+        return has_aggregates(self.directories)
+
+    def _iter_children(self, name, mapping, directory):
+        if isinstance(mapping, ScanTable):
+            return _iter_table_children(mapping, directory)
+        if isinstance(mapping, CompactFiles):
+            return mapping.iter_directory(directory)
+        if name not in self._children:
+            children = {}
+            for key in sorted(mapping):
+                parent = os.path.dirname(key)
+                # roots with a trailing separator and "/" are their own dirname
+                if parent != normalize_directory(key):
+                    children.setdefault(parent, []).append(key)
+            self._children[name] = children
+        keys = self._children[name].get(normalize_directory(directory), ())
+        return ((key, mapping[key]) for key in keys)
+
+    def iter_directory_files(self, directory):
+        """Yields (file, statistics) pairs of the files directly in a directory"""
+        return self._iter_children("files", self.result, directory)
+
+    def iter_subdirectories(self, directory):
+        """Yields (directory, statistics) pairs of the subdirectories of a directory"""
+        return self._iter_children("directories", self.directories, directory)
+
+    def get_shards(self):
+        return self.shards
+
+    def get_rules(self):
+        return self.rules
+
+    def get_unreachable(self):
+        return self.unreachable
+
+    def is_unreachable(self, path):
+        """Whether a path lies below a directory that could not be scanned"""
+        return any(
+            path.startswith(directory.rstrip("/") + "/") or path == directory
+            for directory in self.unreachable
+        )
+
+    def is_partial(self):
+        """Whether the result only holds a single shard of a sharded scan"""
+        return len(self.shards) == 1 and self.shards[0]["count"] > 1
+
     def get_filename(self):
         number_directories = len(self.directories_scanned)
-        return f"{self.date.strftime(DATEFORMAT)}_{number_directories}_rootdirs.scan"
+        prefix = f"{self.date.strftime(DATEFORMAT)}_{number_directories}_rootdirs"
+        if self.is_partial():
+            shard = self.shards[0]
+            return f"{prefix}_shard{shard['index']}of{shard['count']}.part"
+        return f"{prefix}.scan"
 
     @staticmethod
-    def from_file(file_path):
-        """Load collectionresult from a file"""
+    def from_file(file_path, memory_map=False):
+        """Load collectionresult from a file. Files in the
+        columnar scan format and pickled scans are supported.
+        If memory_map is set, scan files are mapped into memory instead
+        of being read, so lookups and iteration only touch the pages they need."""
+        if is_scan_file(file_path):
+            with open(file_path, "rb") as f:
+                if memory_map:
+                    buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                else:
+                    buffer = f.read()
+            footer = read_footer(buffer)
+            return CollectionResult(
+                ScanTable(buffer, footer),
+                footer["directories_scanned"],
+                datetime.fromisoformat(footer["date"]),
+                # scan files written before directories were recorded lack the table
+                directories=(
+                    ScanTable(buffer, footer, "directories")
+                    if "directories" in footer["tables"]
+                    else {}
+                ),
+                experiments=(
+                    ExperimentIndex(footer["experiments"])
+                    if "experiments" in footer
+                    else None
+                ),
+                shards=footer.get("shards", []),
+                rules=footer.get("rules", {}),
+                unreachable=footer.get("unreachable", []),
+            )
         with open(file_path, "rb") as f:
             return pickle.load(f)
 
+    def to_file(self, file_path, compression="none"):
+        """Write collectionresult to a file in the columnar scan format.
+        The experiment index is built while the files are written."""
+        experiments = ExperimentIndex()
+
+        def index_items():
+            for file, file_info in self.iter_sorted_items():
+                experiments.add(file)
+                yield file, file_info
+
+        items = index_items()
+        first_item = next(items, None)
+        columns = FILE_COLUMNS
+        if first_item is not None and "checksum" in first_item[1]:
+            columns = FILE_COLUMNS + (CHECKSUM_COLUMN,)
+        if first_item is not None:
+            items = itertools.chain([first_item], items)
+        with open(file_path, "wb") as f:
+            writer = ScanWriter(f, compression)
+            writer.write_table("files", items, columns)
+            directory_columns = DIRECTORY_COLUMNS
+            if self.has_aggregates():
+                directory_columns = DIRECTORY_COLUMNS + AGGREGATE_COLUMNS
+            writer.write_table(
+                "directories", _sorted_items(self.directories), directory_columns
+            )
+            writer.close(
+                date=self.date.isoformat(),
+                directories_scanned=list(self.directories_scanned),
+                experiments=experiments.ranges,
+                shards=self.shards,
+                rules=self.rules,
+                unreachable=self.unreachable,
+            )
+        self.experiments = experiments
+
     def get_result(self):
         return self.result
 
@@ -49,13 +317,95 @@ class FlatCollector:
     in a dictionary with the associated values being information
     about the files."""
 
-    def __init__(self, rootDirectories: List[str], log_level: str = "INFO") -> None:
+    def __init__(
+        self,
+        rootDirectories: List[str],
+        log_level: str = "INFO",
+        workers: int = 1,
+        previous: Optional[CollectionResult] = None,
+        incremental: bool = False,
+        checksum: bool = False,
+        shard: Optional[Tuple[int, int]] = None,
+        rules: Optional[ScanRules] = None,
+        checkpoint_directory: Optional[str] = None,
+        chunk_size: int = 1000000,
+        checkpoint_interval: float = 300.0,
+        resume: bool = False,
+        directory_timeout: Optional[float] = None,
+    ) -> None:
         self._checkDirectories(rootDirectories)
+        if workers < 1:
+            raise ValueError("Number of workers needs to be at least 1")
+        if shard is not None and not 0 <= shard[0] < shard[1]:
+            raise ValueError("Shard index needs to be between 0 and the shard count")
+        if incremental and previous is None:
+            raise ValueError("Incremental scans need a previous scan")
+        if resume and checkpoint_directory is None:
+            raise ValueError("Resuming a scan needs a checkpoint directory")
+        if directory_timeout is not None and directory_timeout <= 0:
+            raise ValueError("Directory timeout needs to be positive")
+        rules = rules if rules is not None else ScanRules()
+        if incremental and previous.get_rules() != rules.to_dict():
+            raise ValueError(
+                "Incremental scans need a previous scan with the same rules"
+            )
         self.rootDirectories = rootDirectories
-        self._files = {}
+        self.workers = workers
+        self._files = CompactFiles()
+        self._directories = {}
+        # directories added since the last run was written
+        self._chunk_directories = {}
         self.logger = logging.getLogger()
         self.logger.setLevel(log_level)
         self.result = None
+        # previous scan, used for incremental scans and to reuse checksums
+        self.previous = previous
+        self.incremental = incremental
+        self.checksum = checksum
+        # (index, count) of the shard of top-level subdirectories to scan
+        self.shard = shard
+        self.rules = rules
+        # devices of the root directories, if filesystem boundaries are not crossed
+        self._devices = {}
+        # files are streamed to sorted runs in this directory, if given
+        self.checkpoint_directory = checkpoint_directory
+        self.chunk_size = chunk_size
+        self.checkpoint_interval = checkpoint_interval
+        self.resume = resume
+        self._runs = 0
+        self._last_checkpoint = time.monotonic()
+        # directories are listed in daemon threads with a deadline, if given
+        self.directory_timeout = directory_timeout
+        self._listing_seconds = {}
+        self._unreachable = []
+        self._previous_files = {}
+        self._previous_subdirectories = {}
+        self.metrics = ScanMetrics()
+
+    def _index_previous(self):
+        """Groups files and subdirectories of the previous scan
+        by the directory that contains them"""
+        self._previous_files = {}
+        self._previous_subdirectories = {}
+        if self.previous is None or not self.incremental:
+            return
+        for filename, file_info in self.previous.iter_sorted_items():
+            self._previous_files.setdefault(os.path.dirname(filename), []).append(
+                (filename, file_info)
+            )
+        for directory in self.previous.get_directories():
+            self._previous_subdirectories.setdefault(
+                os.path.dirname(directory), []
+            ).append(directory)
+        # directories that missed their deadline have no entry of their own,
+        # but must still be descended into when their parent is reused
+        for directory in self.previous.get_unreachable():
+            siblings = self._previous_subdirectories.setdefault(
+                os.path.dirname(directory), []
+            )
+            if directory not in siblings:
+                siblings.append(directory)
+                siblings.sort()
 
     def _checkDirectories(self, directories: List[str]) -> None:
         """Checks whether the supplied directories exist and whether
@@ -66,28 +416,419 @@ class FlatCollector:
             if not os.path.isabs(directory):
                 raise ValueError(f"Path {directory} should be supplied as absolute")
 
+    def _scan_directory(self, dirpath, root):
+        """Lists a single directory and returns the statistics
+        of contained files together with the subdirectories to descend into.
+        Follows the semantics of os.walk: symlinks to directories
+        are not followed, symlinks to files are stat'ed through.
+        In incremental scans, the entries of directories whose modification
+        date did not change are copied from the previous scan. Files overwritten
+        in place do not change that date, so with checksums, copied files are
+        stat'ed again and those whose statistics changed are rehashed."""
+        self.logger.debug(f"Collecting from {dirpath}")
+        started = time.perf_counter()
+        stat_latencies = []
+        errors = 0
+        files = {}
+        subdirectories = []
+        try:
+            directory_info = {"modified_date": os.stat(dirpath).st_mtime}
+            previous_info = (
+                self.previous.get_directories().get(dirpath)
+                if self.incremental
+                else None
+            )
+            if (
+                previous_info is not None
+                and previous_info["modified_date"] == directory_info["modified_date"]
+            ):
+                for filename, file_info in self._previous_files.get(dirpath, ()):
+                    if self.checksum:
+                        # checksums of unchanged files are reused from the previous scan
+                        try:
+                            stat_started = time.perf_counter()
+                            file_info = _get_file_info(os.stat(filename))
+                            stat_latencies.append(time.perf_counter() - stat_started)
+                        except OSError as error:
+                            self.logger.warning(f" Could not stat {filename}: {error}")
+                            errors += 1
+                            continue
+                    elif "checksum" in file_info:
+                        file_info = {
+                            key: value
+                            for key, value in file_info.items()
+                            if key != "checksum"
+                        }
+                    files[filename] = file_info
+                subdirectories.extend(self._previous_subdirectories.get(dirpath, ()))
+                self.metrics.record_directory(
+                    root,
+                    dirpath,
+                    time.perf_counter() - started,
+                    len(files),
+                    stat_latencies,
+                    errors=errors,
+                    reused=True,
+                )
+                return files, subdirectories, directory_info
+            iterator = os.scandir(dirpath)
+        except OSError as error:
+            self.logger.warning(f" Could not list {dirpath}: {error}")
+            self.metrics.record_directory(
+                root,
+                dirpath,
+                time.perf_counter() - started,
+                0,
+                stat_latencies,
+                errors=1,
+            )
+            return files, subdirectories, None
+        with iterator:
+            for entry in iterator:
+                try:
+                    if entry.is_dir():
+                        if not entry.is_symlink():
+                            subdirectories.append(entry.path)
+                        continue
+                    # excluded files are never stat'ed
+                    if not self.rules.keep_file(entry.path):
+                        continue
+                    # DirEntry caches the stat result
+                    stat_started = time.perf_counter()
+                    file_stats = entry.stat()
+                    stat_latencies.append(time.perf_counter() - stat_started)
+                except OSError as error:
+                    self.logger.warning(f" Could not stat {entry.path}: {error}")
+                    errors += 1
+                    continue
+                files[entry.path] = _get_file_info(file_stats)
+        self.metrics.record_directory(
+            root,
+            dirpath,
+            time.perf_counter() - started,
+            len(files),
+            stat_latencies,
+            errors=errors,
+        )
+        return files, subdirectories, directory_info
+
+    def _scan(self, dirpath, root):
+        """Scans a directory. Subdirectories are filtered by the rules,
+        so excluded subtrees are never walked, files are filtered while the
+        directory is listed. In sharded scans, root directories only keep
+        the subdirectories of the shard, and their own files if the root
+        directory itself is assigned to the shard."""
+        files, subdirectories, directory_info = self._scan_directory(dirpath, root)
+        if not self.rules.is_empty():
+            subdirectories = [
+                subdirectory
+                for subdirectory in subdirectories
+                if self.rules.descend(subdirectory, root, self._devices.get(root))
+            ]
+        if self.shard is None or dirpath != root:
+            return files, subdirectories, directory_info
+        index, count = self.shard
+        subdirectories = [
+            subdirectory
+            for subdirectory in subdirectories
+            if get_shard(subdirectory, count) == index
+        ]
+        if get_shard(root, count) != index:
+            return {}, subdirectories, None
+        return files, subdirectories, directory_info
+
+    def _add_directory(self, dirpath, files, directory_info):
+        # directories below several root directories are only added once
+        if not self._files.has_directory(dirpath):
+            self._files.add_directory(dirpath, files)
+        if directory_info is not None:
+            self._directories[dirpath] = directory_info
+            self._chunk_directories[dirpath] = directory_info
+
+    def _get_checkpoint(self, frontier):
+        return {
+            "root_directories": list(self.rootDirectories),
+            "rules": self.rules.to_dict(),
+            "shard": list(self.shard) if self.shard is not None else None,
+            "checksum": self.checksum,
+            "runs": self._runs,
+            "frontier": [list(directories) for directories in frontier],
+            "unreachable": self._unreachable,
+        }
+
+    def _write_run(self):
+        """Writes the collected files to the next sorted run
+        and starts a new chunk"""
+        if self.checksum:
+            self._collect_checksums()
+        run = CollectionResult(
+            self._files,
+            self.rootDirectories,
+            datetime.utcnow(),
+            directories=self._chunk_directories,
+        )
+        run.to_file(get_run_path(self.checkpoint_directory, self._runs))
+        self._runs += 1
+        self._files = CompactFiles()
+        self._chunk_directories = {}
+
+    def _checkpoint(self, frontier):
+        """Writes a run and the frontier of the walk if the chunk is full or
+        the checkpoint interval passed. frontier holds the (directory, root)
+        pairs that still need to be listed."""
+        if self.checkpoint_directory is None:
+            return
+        if (
+            len(self._files) < self.chunk_size
+            and time.monotonic() - self._last_checkpoint < self.checkpoint_interval
+        ):
+            return
+        self._write_run()
+        save_checkpoint(self.checkpoint_directory, self._get_checkpoint(frontier))
+        self._last_checkpoint = time.monotonic()
+
+    def _load_checkpoint(self):
+        """Restores the runs and directories of an interrupted
+        scan and returns the frontier of its walk"""
+        checkpoint = load_checkpoint(self.checkpoint_directory)
+        if checkpoint is None:
+            raise ValueError(f"No checkpoint found in {self.checkpoint_directory}")
+        expected = self._get_checkpoint([])
+        for key in ["root_directories", "rules", "shard", "checksum"]:
+            if checkpoint[key] != expected[key]:
+                raise ValueError(f"Checkpoint was taken with a different {key}")
+        self._runs = checkpoint["runs"]
+        self._unreachable = checkpoint.get("unreachable", [])
+        for index in range(self._runs):
+            run = CollectionResult.from_file(
+                get_run_path(self.checkpoint_directory, index), memory_map=True
+            )
+            for directory, directory_info in run.get_directories().items():
+                self._directories[directory] = dict(directory_info)
+        self.logger.info(
+            f" Resuming from {self._runs} runs with"
+            f" {len(checkpoint['frontier'])} directories left"
+        )
+        return [tuple(directories) for directories in checkpoint["frontier"]]
+
+    def _walk_serial(self, frontier):
+        """Walks directories one after another. frontier holds the
+        (directory, root) pairs to walk, the last one being walked first."""
+        stack = list(frontier)
+        while stack:
+            dirpath, root = stack.pop()
+            files, subdirectories, directory_info = self._scan(dirpath, root)
+            self._add_directory(dirpath, files, directory_info)
+            stack.extend(
+                (subdirectory, root) for subdirectory in reversed(subdirectories)
+            )
+            self._checkpoint(stack)
+
+    def _walk_parallel(self, frontier):
+        """Walks directories concurrently. Every directory listing
+        is a separate task, results are merged in the calling thread."""
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = {
+                executor.submit(self._scan, dirpath, root): (dirpath, root)
+                for dirpath, root in frontier
+            }
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    dirpath, root = pending.pop(future)
+                    files, subdirectories, directory_info = future.result()
+                    self._add_directory(dirpath, files, directory_info)
+                    for subdirectory in subdirectories:
+                        future = executor.submit(self._scan, subdirectory, root)
+                        pending[future] = (subdirectory, root)
+                    # listings that finished but were not added yet are redone
+                    self._checkpoint(list(pending.values()))
+
+    def _get_timeout(self, root):
+        """Returns the deadline of a listing, which grows for roots
+        whose directories are slow to list but do respond"""
+        average = self._listing_seconds.get(root)
+        if average is None:
+            return self.directory_timeout
+        return max(self.directory_timeout, TIMEOUT_FACTOR * average)
+
+    def _record_listing(self, root, seconds):
+        average = self._listing_seconds.get(root, seconds)
+        self._listing_seconds[root] = average + TIMEOUT_SMOOTHING * (seconds - average)
+
+    def _scan_into(self, dirpath, root, results):
+        """Scans a directory and puts the outcome into the results queue"""
+        started = time.monotonic()
+        try:
+            outcome = self._scan(dirpath, root)
+        except BaseException as error:
+            outcome = error
+        results.put(((dirpath, root), outcome, time.monotonic() - started))
+
+    def _walk_isolated(self, frontier):
+        """Walks directories with a deadline per listing. Every listing
+        runs in its own daemon thread, at most workers at a time. Listings
+        that miss their deadline are abandoned, their threads may stay blocked
+        in the kernel, and the directory is recorded as unreachable instead
+        of being walked."""
+        results = queue.Queue()
+        stack = list(frontier)
+        deadlines = {}
+        while stack or deadlines:
+            while stack and len(deadlines) < self.workers:
+                dirpath, root = stack.pop()
+                deadlines[(dirpath, root)] = time.monotonic() + self._get_timeout(root)
+                threading.Thread(
+                    target=self._scan_into,
+                    args=(dirpath, root, results),
+                    daemon=True,
+                ).start()
+            try:
+                key, outcome, seconds = results.get(
+                    timeout=max(0.0, min(deadlines.values()) - time.monotonic())
+                )
+            except queue.Empty:
+                now = time.monotonic()
+                for dirpath, root in [
+                    key for key, deadline in deadlines.items() if deadline <= now
+                ]:
+                    del deadlines[(dirpath, root)]
+                    self.logger.warning(
+                        f" Listing {dirpath} exceeded its deadline, marked unreachable"
+                    )
+                    self._unreachable.append(dirpath)
+                    self.metrics.unreachable += 1
+                continue
+            if key not in deadlines:
+                # listing finished after it was abandoned
+                continue
+            del deadlines[key]
+            if isinstance(outcome, BaseException):
+                raise outcome
+            dirpath, root = key
+            files, subdirectories, directory_info = outcome
+            self._record_listing(root, seconds)
+            self._add_directory(dirpath, files, directory_info)
+            stack.extend(
+                (subdirectory, root) for subdirectory in reversed(subdirectories)
+            )
+            # listings that are still running are redone after a resume
+            self._checkpoint(stack + list(deadlines))
+
+    def _compute_checksum(self, filename):
+        try:
+            return compute_checksum(filename)
+        except OSError as error:
+            self.logger.warning(f" Could not read {filename}: {error}")
+            return None
+
+    def _collect_checksums(self):
+        """Adds content checksums to the collected files. Checksums
+        of the previous scan are reused if size, modification and
+        creation date of a file did not change."""
+        if self.previous is not None and self.checkpoint_directory is not None:
+            # chunks are small compared to the previous scan, so files are looked up
+            previous_files = self.previous.get_result()
+            previous_items = (
+                (filename, previous_files[filename])
+                for filename in list(self._files)
+                if filename in previous_files
+            )
+        elif self.previous is not None:
+            previous_items = self.previous.iter_sorted_items()
+        else:
+            previous_items = ()
+        for filename, previous_info in previous_items:
+            file_info = self._files.get(filename)
+            if (
+                file_info is None
+                or previous_info.get("checksum") is None
+                or any(file_info[key] != previous_info[key] for key in CHECKSUM_KEYS)
+            ):
+                continue
+            self._files.set_checksum(filename, previous_info["checksum"])
+        to_compute = [
+            filename
+            for filename, file_info in self._files.items()
+            if file_info.get("checksum") is None
+        ]
+        self.logger.info(f" Computing checksums of {len(to_compute)} files")
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            checksums = executor.map(self._compute_checksum, to_compute)
+            for filename, checksum in zip(to_compute, checksums):
+                self._files.set_checksum(filename, checksum)
+        self.metrics.checksum_seconds += time.perf_counter() - started
+
     def collect_files(self):
         """Walks specified root directories and
         puts found files with associated statistics
         into a flat dictionary"""
         for directory in self.rootDirectories:
             self.logger.info(f" Collecting files from {directory}")
-            for dirpath, dirnames, files in os.walk(directory):
-                self.logger.debug(f"Collecting from {dirpath}")
-                for file in files:
-                    filename = os.path.join(dirpath, file)
-                    file_stats = os.stat(filename)
-                    file_info = {
-                        "size": file_stats.st_size,
-                        "modified_date": file_stats.st_mtime,
-                        "created_date": file_stats.st_ctime,
-                        "user_id": file_stats.st_uid,
-                    }
-                    self._files[filename] = file_info
-        self.logger.info(f" Found {len(self._files.keys())} files")
+        self._index_previous()
+        if self.rules.one_filesystem:
+            self._devices = {
+                directory: os.stat(directory).st_dev
+                for directory in self.rootDirectories
+            }
+        frontier = [
+            (directory, directory) for directory in reversed(self.rootDirectories)
+        ]
+        if self.resume:
+            frontier = self._load_checkpoint()
+        elif self.checkpoint_directory is not None:
+            if load_checkpoint(self.checkpoint_directory) is not None:
+                raise ValueError(
+                    f"Checkpoint found in {self.checkpoint_directory}, resume or remove it"
+                )
+            os.makedirs(self.checkpoint_directory, exist_ok=True)
+        self.metrics.start()
+        if self.directory_timeout is not None:
+            self._walk_isolated(frontier)
+        elif self.workers > 1:
+            self._walk_parallel(frontier)
+        else:
+            self._walk_serial(frontier)
+        if self.checkpoint_directory is not None:
+            self._write_run()
+            save_checkpoint(self.checkpoint_directory, self._get_checkpoint([]))
+            self._files = MergedRuns(
+                [
+                    CollectionResult.from_file(
+                        get_run_path(self.checkpoint_directory, index), memory_map=True
+                    ).get_result()
+                    for index in range(self._runs)
+                ]
+            )
+        elif self.checksum:
+            self._collect_checksums()
+        directories = compute_aggregates(self._files, self._directories)
+        if directories is None:
+            self.logger.warning(" Files outside of walked directories, no aggregates")
+            directories = self._directories
+        self.metrics.finish()
+        self.logger.info(
+            f" Found {len(self._files.keys())} files in {self.metrics.duration:.1f}s"
+            f" ({self.metrics.get_files_per_second():.0f} files/s)"
+        )
         self.result = CollectionResult(
-            self._files, self.rootDirectories, datetime.utcnow()
+            self._files,
+            self.rootDirectories,
+            datetime.utcnow(),
+            directories=directories,
+            rules=self.rules.to_dict(),
+            unreachable=sorted(self._unreachable),
         )
+        if self.shard is not None:
+            self.result.shards = [
+                {
+                    "index": self.shard[0],
+                    "count": self.shard[1],
+                    "date": self.result.get_date().isoformat(),
+                    "host": socket.gethostname(),
+                }
+            ]
 
     def get_file_stats(self):
         """Returns dictionary of file statistics"""
@@ -95,10 +836,24 @@ class FlatCollector:
             raise ValueError("No result, run collection first!")
         return self.result
 
-    def save(self, output_directory):
-        """writes collected files to the output file"""
+    def save(self, output_directory, compression="none", metrics_formats=()):
+        """writes collected files to the output file and
+        the scan metrics in the requested formats next to it"""
         if self.result is None:
             raise ValueError("No result, run collection first!")
         filename = self.result.get_filename()
-        with open(os.path.join(output_directory, filename), "wb") as f:
-            pickle.dump(self.result, f)
+        self.result.to_file(os.path.join(output_directory, filename), compression)
+        self.save_metrics(output_directory, metrics_formats)
+
+    def remove_checkpoint(self):
+        """Removes the checkpoint and the runs once the scan was saved"""
+        if self.checkpoint_directory is not None:
+            remove_checkpoint(self.checkpoint_directory)
+
+    def save_metrics(self, output_directory, metrics_formats=()):
+        """writes the scan metrics in the requested formats"""
+        if self.result is None:
+            raise ValueError("No result, run collection first!")
+        prefix = self.result.get_filename()[: -len(".scan")]
+        for metrics_format in metrics_formats:
+            self.metrics.write(os.path.join(output_directory, prefix), metrics_format)
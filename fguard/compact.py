@@ -0,0 +1,235 @@
+"""Compact in-memory representation of scanned files.
+
+Instead of a dictionary from absolute paths to dictionaries of
+statistics, files are stored grouped by directory: every directory
+path is kept once, file names are concatenated into a single buffer
+and statistics are kept in typed arrays, one per column. Files of a
+directory are stored sorted by name, so they are found by a binary
+search within the rows of their directory."""
+import os
+import sys
+from array import array
+from collections.abc import Mapping
+from typing import Iterable, Iterator, Optional, Tuple
+from fguard.scanfile import CHECKSUM_COLUMN, FILE_COLUMNS
+
+CHECKSUM_WIDTH = int(CHECKSUM_COLUMN[1][:-1])
+# names are decoded like os.fsdecode does
+_ENCODING = sys.getfilesystemencoding()
+_ERRORS = sys.getfilesystemencodeerrors()
+# states of the checksum of a row
+_NO_CHECKSUM, _EMPTY_CHECKSUM, _CHECKSUM = 0, 1, 2
+
+
+def _split(path):
+    directory, separator, name = path.rpartition("/")
+    if not separator:
+        return "", name
+    return directory or "/", name
+
+
+def _join(directory, name):
+    return f"{directory}/{name}" if directory != "/" else f"/{name}"
+
+
+class CompactFiles(Mapping):
+    """Read-only mapping from file paths to statistics that is built
+    directory by directory. Values are created on access."""
+
+    def __init__(self) -> None:
+        self._directories = []
+        self._directory_ids = {}
+        # rows of the files of every directory
+        self._starts = array("Q")
+        self._ends = array("Q")
+        self._names = bytearray()
+        self._name_offsets = array("Q", [0])
+        self._columns = {column: array(typecode) for column, typecode in FILE_COLUMNS}
+        # created when the first checksum is added
+        self._checksums = None
+        self._checksum_states = None
+
+    @classmethod
+    def from_mapping(cls, files: Mapping) -> "CompactFiles":
+        """Creates compact files from a mapping of paths to statistics"""
+        by_directory = {}
+        for path, file_info in files.items():
+            by_directory.setdefault(_split(path)[0], {})[path] = file_info
+        compact_files = cls()
+        for directory, directory_files in by_directory.items():
+            compact_files.add_directory(directory, directory_files)
+        return compact_files
+
+    @classmethod
+    def from_sorted_items(cls, items: Iterable[Tuple[str, dict]]) -> "CompactFiles":
+        """Creates compact files from (path, statistics) pairs sorted by path.
+        A directory is complete once a path outside of it follows, so only
+        the files of the directories on the current path are held."""
+        compact_files = cls()
+        # (directory, prefix, files) of the directories on the current path
+        stack = []
+        for path, file_info in items:
+            directory = _split(path)[0]
+            while stack and not path.startswith(stack[-1][1]):
+                completed, _, completed_files = stack.pop()
+                compact_files.add_directory(completed, completed_files)
+            if not stack or stack[-1][0] != directory:
+                stack.append((directory, directory.rstrip("/") + "/", {}))
+            stack[-1][2][path] = file_info
+        while stack:
+            completed, _, completed_files = stack.pop()
+            compact_files.add_directory(completed, completed_files)
+        return compact_files
+
+    def _create_checksums(self, rows):
+        if self._checksums is None:
+            self._checksums = bytearray(CHECKSUM_WIDTH * rows)
+            self._checksum_states = bytearray(rows)
+
+    def _set_checksum(self, row, checksum):
+        start = row * CHECKSUM_WIDTH
+        if checksum is None:
+            self._checksums[start : start + CHECKSUM_WIDTH] = bytes(CHECKSUM_WIDTH)
+            self._checksum_states[row] = _EMPTY_CHECKSUM
+            return
+        if len(checksum) != CHECKSUM_WIDTH:
+            raise ValueError(f"Checksums need to be {CHECKSUM_WIDTH} bytes long!")
+        self._checksums[start : start + CHECKSUM_WIDTH] = checksum
+        self._checksum_states[row] = _CHECKSUM
+
+    def add_directory(self, directory: str, files: Mapping[str, dict]) -> None:
+        """Adds the files that lie directly in a directory"""
+        directory = directory.rstrip("/") or "/"
+        if not directory.startswith("/"):
+            raise ValueError(f"Path {directory} should be supplied as absolute!")
+        if directory in self._directory_ids:
+            raise ValueError(f"Files of {directory} were already added!")
+        if any(_split(path)[0] != directory for path in files):
+            raise ValueError(f"Files need to lie directly in {directory}!")
+        items = sorted((_split(path)[1], file_info) for path, file_info in files.items())
+        self._directory_ids[directory] = len(self._directories)
+        self._directories.append(directory)
+        self._starts.append(len(self))
+        for name, file_info in items:
+            row = len(self)
+            if "checksum" in file_info:
+                self._create_checksums(row)
+            if self._checksums is not None:
+                self._checksums += bytes(CHECKSUM_WIDTH)
+                self._checksum_states.append(_NO_CHECKSUM)
+                if "checksum" in file_info:
+                    self._set_checksum(row, file_info["checksum"])
+            self._names += os.fsencode(name)
+            self._name_offsets.append(len(self._names))
+            for column, values in self._columns.items():
+                values.append(file_info[column])
+        self._ends.append(len(self))
+
+    def has_directory(self, directory: str) -> bool:
+        return (directory.rstrip("/") or "/") in self._directory_ids
+
+    def _name(self, row):
+        start, end = self._name_offsets[row], self._name_offsets[row + 1]
+        return self._names[start:end].decode(_ENCODING, _ERRORS)
+
+    def _find(self, path) -> int:
+        """Returns the row of a path or -1 if it is not contained"""
+        if not isinstance(path, str):
+            return -1
+        directory, name = _split(path)
+        directory_id = self._directory_ids.get(directory)
+        if directory_id is None:
+            return -1
+        low, high = self._starts[directory_id], self._ends[directory_id]
+        while low < high:
+            middle = (low + high) // 2
+            if self._name(middle) < name:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._ends[directory_id] and self._name(low) == name:
+            return low
+        return -1
+
+    def get_row(self, row) -> dict:
+        """Returns statistics stored in a row"""
+        file_info = {column: values[row] for column, values in self._columns.items()}
+        if self._checksums is not None:
+            state = self._checksum_states[row]
+            if state == _CHECKSUM:
+                start = row * CHECKSUM_WIDTH
+                file_info["checksum"] = bytes(
+                    self._checksums[start : start + CHECKSUM_WIDTH]
+                )
+            elif state == _EMPTY_CHECKSUM:
+                file_info["checksum"] = None
+        return file_info
+
+    def set_checksum(self, path: str, checksum: Optional[bytes]) -> None:
+        """Sets the checksum of a contained file"""
+        row = self._find(path)
+        if row < 0:
+            raise KeyError(path)
+        self._create_checksums(len(self))
+        self._set_checksum(row, checksum)
+
+    def __getitem__(self, path):
+        row = self._find(path)
+        if row < 0:
+            raise KeyError(path)
+        return self.get_row(row)
+
+    def __contains__(self, path):
+        return self._find(path) >= 0
+
+    def __len__(self):
+        return len(self._name_offsets) - 1
+
+    def __iter__(self):
+        for directory_id, directory in enumerate(self._directories):
+            for row in range(self._starts[directory_id], self._ends[directory_id]):
+                yield _join(directory, self._name(row))
+
+    def iter_directory(self, directory: str) -> Iterator[Tuple[str, dict]]:
+        """Yields (path, statistics) pairs of the files directly in a directory"""
+        directory_id = self._directory_ids.get(directory.rstrip("/") or "/")
+        if directory_id is None:
+            return
+        for path, row in self._iter_rows(directory_id):
+            yield path, self.get_row(row)
+
+    def _iter_rows(self, directory_id):
+        directory = self._directories[directory_id]
+        for row in range(self._starts[directory_id], self._ends[directory_id]):
+            yield _join(directory, self._name(row)), row
+
+    def iter_items(self) -> Iterator[Tuple[str, dict]]:
+        """Yields (path, statistics) pairs sorted by path. Directories
+        are visited in the order of their path with a separator appended,
+        the files of their ancestors that sort before them being yielded
+        first, so paths are never sorted as a whole."""
+        prefixes = {
+            directory_id: directory.rstrip("/") + "/"
+            for directory_id, directory in enumerate(self._directories)
+        }
+        # (prefix, rows, next row) of the directories being merged
+        stack = []
+
+        def take_until(entry, end):
+            prefix, rows, pending = entry
+            while pending is not None and (end is None or pending[0] < end):
+                yield pending[0], self.get_row(pending[1])
+                pending = next(rows, None)
+            entry[2] = pending
+
+        for directory_id in sorted(prefixes, key=prefixes.get):
+            prefix = prefixes[directory_id]
+            while stack:
+                if prefix.startswith(stack[-1][0]):
+                    yield from take_until(stack[-1], prefix)
+                    break
+                yield from take_until(stack.pop(), None)
+            rows = self._iter_rows(directory_id)
+            stack.append([prefix, rows, next(rows, None)])
+        while stack:
+            yield from take_until(stack.pop(), None)
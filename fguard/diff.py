@@ -0,0 +1,212 @@
+"""Streaming comparison of two scans.
+
+Both scans are iterated in sorted path order and merged in a single
+linear pass, so memory use does not depend on the number of files.
+If both scans hold directory aggregates, the directory trees are compared
+top-down first and only the files of directories that changed are merged.
+The changes can also be split into consecutive partitions that are
+compared independently, see get_partitions."""
+from typing import Any, Iterator, List, NamedTuple, Optional
+from fguard.aggregates import get_own_aggregates, is_equal
+from fguard.colllectors import CollectionResult
+from fguard.scanfile import ScanTable
+
+MISSING = "missing"
+ADDED = "added"
+MODIFIED = "modified"
+UNCHANGED = "unchanged"
+# files below directories whose listing exceeded its deadline in one of the scans
+NOT_SCANNED = "not_scanned"
+
+
+class FileChange(NamedTuple):
+    """Change of a single file between an old and a new scan.
+    old and new hold the statistics of the file in the
+    respective scan or None if the file is not contained."""
+
+    kind: str
+    path: str
+    old: Optional[Any]
+    new: Optional[Any]
+
+
+def _is_modified(old, new):
+    """Compares statistics of a file. If the scans recorded
+    different statistics, e.g. only one of them has checksums,
+    only the common statistics are compared."""
+    if isinstance(old, dict) and isinstance(new, dict) and old.keys() != new.keys():
+        return any(old[key] != new[key] for key in old.keys() & new.keys())
+    return old != new
+
+
+def _merge(old_items, new_items, include_unchanged):
+    """Merges two iterators of sorted (path, statistics) pairs"""
+    old = next(old_items, None)
+    new = next(new_items, None)
+    while old is not None and new is not None:
+        if old[0] == new[0]:
+            if _is_modified(old[1], new[1]):
+                yield FileChange(MODIFIED, old[0], old[1], new[1])
+            elif include_unchanged:
+                yield FileChange(UNCHANGED, old[0], old[1], new[1])
+            old = next(old_items, None)
+            new = next(new_items, None)
+        elif old[0] < new[0]:
+            yield FileChange(MISSING, old[0], old[1], None)
+            old = next(old_items, None)
+        else:
+            yield FileChange(ADDED, new[0], None, new[1])
+            new = next(new_items, None)
+    while old is not None:
+        yield FileChange(MISSING, old[0], old[1], None)
+        old = next(old_items, None)
+    while new is not None:
+        yield FileChange(ADDED, new[0], None, new[1])
+        new = next(new_items, None)
+
+
+def iter_changed_directories(
+    old_state: CollectionResult, new_state: CollectionResult
+) -> Iterator[str]:
+    """Compares the directory aggregates of two scans top-down and yields
+    the directories whose own files differ. Subtrees with equal aggregates
+    are skipped, so unchanged trees cost one comparison per root. Roots
+    without aggregates, e.g. in partial scans of shards that do not own
+    them, are walked into."""
+    old_directories = old_state.get_directories()
+    new_directories = new_state.get_directories()
+    stack = sorted(set(old_state.get_directories_scanned()), reverse=True)
+    while stack:
+        directory = stack.pop()
+        old = old_directories.get(directory)
+        new = new_directories.get(directory)
+        if old is not None and new is not None and is_equal(old, new):
+            continue
+        old_subdirectories = dict(old_state.iter_subdirectories(directory))
+        new_subdirectories = dict(new_state.iter_subdirectories(directory))
+        if (
+            old is None
+            or new is None
+            or get_own_aggregates(old, old_subdirectories.values())
+            != get_own_aggregates(new, new_subdirectories.values())
+        ):
+            yield directory
+        stack.extend(
+            sorted(old_subdirectories.keys() | new_subdirectories.keys(), reverse=True)
+        )
+
+
+def _can_prune(old_state, new_state, include_unchanged):
+    return (
+        not include_unchanged
+        and old_state.has_aggregates()
+        and new_state.has_aggregates()
+        and sorted(old_state.get_directories_scanned())
+        == sorted(new_state.get_directories_scanned())
+    )
+
+
+def diff_scans(
+    old_state: CollectionResult,
+    new_state: CollectionResult,
+    include_unchanged: bool = False,
+) -> Iterator[FileChange]:
+    """Yields changes between two scans in sorted path order.
+    Files that did not change are only reported if include_unchanged is set.
+    If both scans hold directory aggregates, only changed directories are
+    compared and changes are sorted within each of them."""
+    if _can_prune(old_state, new_state, include_unchanged):
+        for directory in iter_changed_directories(old_state, new_state):
+            yield from _merge(
+                old_state.iter_directory_files(directory),
+                new_state.iter_directory_files(directory),
+                include_unchanged,
+            )
+        return
+    yield from _merge(
+        old_state.iter_sorted_items(), new_state.iter_sorted_items(), include_unchanged
+    )
+
+
+def _iter_range(table, start, stop):
+    for key, value in table.iter_items(start):
+        if stop is not None and key >= stop:
+            return
+        yield key, value
+
+
+def get_partitions(
+    old_state: CollectionResult,
+    new_state: CollectionResult,
+    number: int,
+    include_unchanged: bool = False,
+) -> Optional[List[tuple]]:
+    """Splits the changes yielded by diff_scans into at most number
+    consecutive partitions, which diff_partition compares independently.
+    Pruned comparisons are split into runs of changed directories, all
+    others into ranges of paths. Ranges can only be read without a pass
+    over all files from scan files, so None is returned for other scans."""
+    if _can_prune(old_state, new_state, include_unchanged):
+        directories = list(iter_changed_directories(old_state, new_state))
+        size = max(1, -(-len(directories) // number))
+        return [
+            ("directories", directories[start : start + size])
+            for start in range(0, len(directories), size)
+        ]
+    old_files = old_state.get_result()
+    if not isinstance(old_files, ScanTable) or not isinstance(
+        new_state.get_result(), ScanTable
+    ):
+        return None
+    # the keys at evenly spaced rows of the old scan delimit the ranges
+    boundaries = set()
+    if len(old_files) > 0:
+        boundaries = {
+            old_files.get_key(len(old_files) * index // number)
+            for index in range(1, number)
+        }
+    boundaries = sorted(boundaries)
+    starts = [None] + boundaries
+    stops = boundaries + [None]
+    return [("range", start, stop) for start, stop in zip(starts, stops)]
+
+
+def diff_partition(
+    old_state: CollectionResult,
+    new_state: CollectionResult,
+    partition: tuple,
+    include_unchanged: bool = False,
+) -> Iterator[FileChange]:
+    """Yields the changes of a partition returned by get_partitions in the
+    order of diff_scans, so consecutive partitions yield all its changes"""
+    if partition[0] == "directories":
+        for directory in partition[1]:
+            yield from _merge(
+                old_state.iter_directory_files(directory),
+                new_state.iter_directory_files(directory),
+                include_unchanged,
+            )
+        return
+    _, start, stop = partition
+    yield from _merge(
+        _iter_range(old_state.get_result(), start, stop),
+        _iter_range(new_state.get_result(), start, stop),
+        include_unchanged,
+    )
+
+
+def mark_not_scanned(
+    changes: Iterator[FileChange],
+    old_state: CollectionResult,
+    new_state: CollectionResult,
+) -> Iterator[FileChange]:
+    """Reports files below directories that one of the scans could
+    not list as not scanned instead of as missing or added"""
+    if not old_state.get_unreachable() and not new_state.get_unreachable():
+        yield from changes
+        return
+    for change in changes:
+        state = old_state if change.kind == ADDED else new_state
+        if state.is_unreachable(change.path):
+            change = change._replace(kind=NOT_SCANNED)
+        yield change
@@ -0,0 +1,153 @@
+"""Dispatching of trigger messages to actions"""
+import os
+import json
+import time
+import logging
+import threading
+from typing import Dict, List, Optional
+from fguard.actions import BaseAction
+
+
+def coalesce_messages(messages: List[dict]) -> dict:
+    """Combines the messages of several triggers into one"""
+    if len(messages) == 1:
+        return messages[0]
+    experiments = set()
+    for message in messages:
+        experiments.update(message.get("experiments", []))
+    return {
+        "title": f"{len(messages)} alerts detected!",
+        "description": " ".join(message["description"] for message in messages),
+        "subject": "; ".join(message["subject"] for message in messages),
+        "experiments": sorted(experiments),
+        "details": {
+            f"{message['subject']}: {key}": value
+            for message in messages
+            for key, value in message["details"].items()
+        },
+    }
+
+
+def _get_alert_keys(message):
+    """Keys under which repeated alerts are recognized"""
+    experiments = message.get("experiments") or [""]
+    return [f"{message['subject']}:{experiment}" for experiment in experiments]
+
+
+class ActionDispatcher(BaseAction):
+    """Collects the messages of all triggers of a run and performs the
+    actions once per run with a single coalesced message. Actions run
+    concurrently in daemon threads, are retried on errors and abandoned
+    after timeout seconds, so a hanging action cannot block a check.
+    With a rate_limit, messages are dropped if all of their experiments
+    were already alerted within rate_limit seconds; alert times are kept
+    in state_file so that this holds across runs."""
+
+    def __init__(
+        self,
+        actions: List[BaseAction],
+        timeout: float = 120.0,
+        retries: int = 2,
+        retry_delay: float = 5.0,
+        rate_limit: float = 0.0,
+        state_file: Optional[str] = None,
+    ) -> None:
+        if rate_limit > 0 and state_file is None:
+            raise ValueError("Rate limiting needs a state file!")
+        self.actions = actions
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.rate_limit = rate_limit
+        self.state_file = state_file
+        self.logger = logging.getLogger()
+        self._messages = []
+
+    def perform(self, message):
+        self._messages.append(message)
+
+    def _load_alert_times(self) -> Dict[str, float]:
+        if self.state_file is None or not os.path.exists(self.state_file):
+            return {}
+        with open(self.state_file) as f:
+            return json.load(f)
+
+    def _save_alert_times(self, alert_times):
+        temporary_path = f"{self.state_file}.tmp"
+        with open(temporary_path, "w") as f:
+            json.dump(alert_times, f)
+        os.replace(temporary_path, self.state_file)
+
+    def _perform_with_retries(self, action, message, results):
+        for attempt in range(self.retries + 1):
+            try:
+                action.perform(message)
+                results[id(action)] = True
+                return
+            except Exception as error:
+                self.logger.warning(
+                    f" {type(action).__name__} failed (attempt {attempt + 1}): {error}"
+                )
+                if attempt < self.retries:
+                    time.sleep(self.retry_delay * 2**attempt)
+        results[id(action)] = False
+
+    def dispatch(self, message) -> bool:
+        """Performs all actions concurrently and returns
+        whether at least one of them succeeded"""
+        results = {}
+        threads = [
+            threading.Thread(
+                target=self._perform_with_retries,
+                args=(action, message, results),
+                daemon=True,
+            )
+            for action in self.actions
+        ]
+        deadline = time.monotonic() + self.timeout
+        for thread in threads:
+            thread.start()
+        for action, thread in zip(self.actions, threads):
+            thread.join(max(0.0, deadline - time.monotonic()))
+            if thread.is_alive():
+                self.logger.error(
+                    f" {type(action).__name__} timed out after {self.timeout}s"
+                )
+        return any(results.values())
+
+    def _is_repeated(self, message, alert_times, now):
+        repeated = all(
+            now - alert_times.get(key, float("-inf")) < self.rate_limit
+            for key in _get_alert_keys(message)
+        )
+        if repeated:
+            self.logger.info(f" Suppressed repeated alert: {message['subject']}")
+        return repeated
+
+    def flush(self) -> Optional[dict]:
+        """Dispatches the messages collected since the last flush
+        and returns the coalesced message, if any was dispatched"""
+        messages, self._messages = self._messages, []
+        alert_times = self._load_alert_times() if self.rate_limit > 0 else {}
+        now = time.time()
+        if self.rate_limit > 0:
+            messages = [
+                message
+                for message in messages
+                if not self._is_repeated(message, alert_times, now)
+            ]
+        if not messages:
+            return None
+        message = coalesce_messages(messages)
+        if self.dispatch(message) and self.rate_limit > 0:
+            for sent_message in messages:
+                for key in _get_alert_keys(sent_message):
+                    alert_times[key] = now
+            self._save_alert_times(
+                {
+                    key: alert_time
+                    for key, alert_time in alert_times.items()
+                    if now - alert_time < self.rate_limit
+                }
+            )
+        return message
@@ -0,0 +1,59 @@
+"""Extraction of experiment numbers from file paths"""
+import os
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+EXPERIMENT_NUMBER = r"Experiments_(\d{6})/(\d{6})/"
+_EXPERIMENT_PATTERN = re.compile(EXPERIMENT_NUMBER)
+
+
+@lru_cache(maxsize=4096)
+def _get_directory_experiment(directory: str) -> Optional[str]:
+    matched_experiment = _EXPERIMENT_PATTERN.search(directory + "/")
+    if matched_experiment is None:
+        return None
+    return matched_experiment.group(2)
+
+
+def get_experiment_number(file: str) -> Optional[str]:
+    """Extracts the experiment number from a file path.
+    The pattern always ends with a separator, so it only depends on the
+    directory of the file and is matched once per directory."""
+    return _get_directory_experiment(os.path.dirname(file))
+
+
+class ExperimentIndex:
+    """Maps experiment numbers to the ranges of rows
+    that the files of an experiment occupy in a sorted scan"""
+
+    def __init__(self, ranges: Optional[Dict[str, List[List[int]]]] = None) -> None:
+        self.ranges = ranges if ranges is not None else {}
+        self._row = 0
+
+    @staticmethod
+    def from_files(sorted_files: Iterable[str]) -> "ExperimentIndex":
+        index = ExperimentIndex()
+        for file in sorted_files:
+            index.add(file)
+        return index
+
+    def add(self, file: str) -> None:
+        """Adds the next file of a sorted scan"""
+        experiment_number = get_experiment_number(file)
+        if experiment_number is not None:
+            ranges = self.ranges.setdefault(experiment_number, [])
+            if ranges and ranges[-1][1] == self._row:
+                ranges[-1][1] += 1
+            else:
+                ranges.append([self._row, self._row + 1])
+        self._row += 1
+
+    def get_experiments(self):
+        return self.ranges.keys()
+
+    def get_file_counts(self) -> Dict[str, int]:
+        return {
+            experiment_number: sum(stop - start for start, stop in ranges)
+            for experiment_number, ranges in self.ranges.items()
+        }
@@ -0,0 +1,120 @@
+"""Merging of partial scans of sharded roots into a single scan.
+
+The files of the shards are sorted, so they are merged as streams
+instead of being loaded into memory, and the merged scan reads them
+from the shards when it is written."""
+import heapq
+import logging
+from datetime import timedelta
+from typing import List
+from fguard.aggregates import compute_aggregates
+from fguard.checkpoint import MergedRuns
+from fguard.colllectors import CollectionResult
+from fguard.compact import CompactFiles
+from fguard.scanfile import ScanTable
+
+# number of conflicting paths listed in errors
+LISTED_CONFLICTS = 10
+
+
+def _check_shards(results):
+    """Checks that the partial scans cover every shard of the same roots once"""
+    for result in results:
+        if not result.is_partial():
+            raise ValueError("Only partial scans can be merged!")
+    counts = {result.get_shards()[0]["count"] for result in results}
+    if len(counts) > 1:
+        raise ValueError(
+            f"Partial scans have different shard counts {sorted(counts)}!"
+        )
+    roots = {tuple(sorted(result.get_directories_scanned())) for result in results}
+    if len(roots) > 1:
+        raise ValueError("Partial scans have different root directories!")
+    if any(result.get_rules() != results[0].get_rules() for result in results):
+        raise ValueError("Partial scans were taken with different rules!")
+    indices = [result.get_shards()[0]["index"] for result in results]
+    duplicates = sorted({index for index in indices if indices.count(index) > 1})
+    if duplicates:
+        raise ValueError(f"Shards {duplicates} are contained more than once!")
+    missing = sorted(set(range(counts.pop())) - set(indices))
+    if missing:
+        raise ValueError(f"Shards {missing} are missing!")
+
+
+def _get_sorted_files(result):
+    """Returns the files of a shard as a mapping that iterates its items sorted"""
+    files = result.get_result()
+    if isinstance(files, (ScanTable, CompactFiles, MergedRuns)):
+        return files
+    return CompactFiles.from_mapping(files)
+
+
+def _find_conflicts(results):
+    """Merges the sorted files of the shards and returns
+    the paths that are contained with different statistics"""
+    conflicts = []
+    previous_file = previous_info = None
+    for file, file_info in heapq.merge(
+        *(result.iter_sorted_items() for result in results), key=lambda x: x[0]
+    ):
+        if file == previous_file and dict(file_info) != dict(previous_info):
+            conflicts.append(file)
+        previous_file, previous_info = file, file_info
+    return conflicts
+
+
+def _merge_mapping(merged, mapping, conflicts):
+    """Adds entries to merged and records paths whose entries differ"""
+    for key, value in mapping.items():
+        previous = merged.get(key)
+        if previous is None:
+            merged[key] = value
+        elif previous != value:
+            conflicts.append(key)
+
+
+def merge_results(
+    results: List[CollectionResult], max_skew: timedelta = timedelta(hours=12)
+) -> CollectionResult:
+    """Merges the partial scans of all shards into one scan. Entries that
+    are contained in several shards with different statistics and shards
+    that were scanned more than max_skew apart are rejected. The merged
+    scan is dated by its newest shard and keeps the dates of all shards."""
+    logger = logging.getLogger()
+    _check_shards(results)
+    results = sorted(results, key=lambda result: result.get_shards()[0]["index"])
+    dates = [result.get_date() for result in results]
+    skew = max(dates) - min(dates)
+    if skew > max_skew:
+        raise ValueError(f"Shards were scanned {skew} apart, more than {max_skew}!")
+    conflicts = _find_conflicts(results)
+    directories = {}
+    for result in results:
+        _merge_mapping(
+            directories,
+            {
+                directory: {"modified_date": directory_info["modified_date"]}
+                for directory, directory_info in result.get_directories().items()
+            },
+            conflicts,
+        )
+    if conflicts:
+        raise ValueError(
+            f"{len(conflicts)} paths differ between shards, e.g. "
+            f"{', '.join(conflicts[:LISTED_CONFLICTS])}!"
+        )
+    # only the statistics stored in the columns of the files table are kept
+    files = MergedRuns([_get_sorted_files(result) for result in results])
+    aggregates = compute_aggregates(files, directories)
+    logger.info(f" Merged {len(results)} shards with {len(files)} files")
+    return CollectionResult(
+        files,
+        results[0].get_directories_scanned(),
+        max(dates),
+        directories=aggregates if aggregates is not None else directories,
+        shards=[result.get_shards()[0] for result in results],
+        rules=results[0].get_rules(),
+        unreachable=sorted(
+            {directory for result in results for directory in result.get_unreachable()}
+        ),
+    )
@@ -0,0 +1,289 @@
+"""Instrumentation of scans"""
+import os
+import json
+import time
+import heapq
+import threading
+from bisect import bisect_left
+from datetime import datetime, timezone
+from typing import List, Sequence
+
+STAT_LATENCY_BUCKETS = (1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3, 0.01, 0.05, 0.1, 0.5, 1.0)
+DIRECTORY_SECONDS_BUCKETS = (1e-4, 1e-3, 0.01, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0, 300.0)
+METRICS_FORMATS = ("json", "prometheus")
+
+
+class Histogram:
+    """Histogram with fixed upper bucket bounds"""
+
+    def __init__(self, bounds: Sequence[float]) -> None:
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def observe_many(self, values: List[float]) -> None:
+        for value in values:
+            self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += sum(values)
+        self.count += len(values)
+
+    def cumulative(self):
+        """Returns (upper bound, cumulative count) pairs,
+        the last bound being infinity"""
+        total = 0
+        result = []
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def to_dict(self):
+        return {
+            "buckets": {str(bound): count for bound, count in self.cumulative()},
+            "sum": self.sum,
+            "count": self.count,
+        }
+
+
+def _escape_label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _write_atomically(file_path, content):
+    """Writes a file under a temporary name and renames it,
+    so readers like the node exporter never see partial files"""
+    temporary_path = f"{file_path}.tmp"
+    with open(temporary_path, "w") as f:
+        f.write(content)
+    os.replace(temporary_path, file_path)
+
+
+class ScanMetrics:
+    """Collects timings of a scan. Directories are recorded
+    from worker threads, so recording is guarded by a lock
+    and only done once per directory."""
+
+    def __init__(self, slowest_number: int = 10) -> None:
+        self.slowest_number = slowest_number
+        self._lock = threading.Lock()
+        self.started = None
+        self._started_counter = None
+        self.duration = None
+        self.files = 0
+        self.directories = 0
+        self.directories_reused = 0
+        self.errors = 0
+        self.unreachable = 0
+        self.checksum_seconds = 0.0
+        self.roots = {}
+        self.stat_latency = Histogram(STAT_LATENCY_BUCKETS)
+        self.directory_seconds = Histogram(DIRECTORY_SECONDS_BUCKETS)
+        self._slowest = []
+
+    def start(self):
+        self.started = datetime.utcnow()
+        self._started_counter = time.perf_counter()
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._started_counter
+
+    def record_directory(
+        self,
+        root: str,
+        dirpath: str,
+        seconds: float,
+        files: int,
+        stat_latencies: List[float],
+        reused: bool = False,
+        errors: int = 0,
+    ):
+        """Records the listing of a single directory"""
+        with self._lock:
+            self.files += files
+            self.directories += 1
+            self.directories_reused += reused
+            self.errors += errors
+            root_metrics = self.roots.setdefault(
+                root,
+                {"files": 0, "directories": 0, "busy_seconds": 0.0, "seconds": 0.0},
+            )
+            root_metrics["files"] += files
+            root_metrics["directories"] += 1
+            root_metrics["busy_seconds"] += seconds
+            root_metrics["seconds"] = time.perf_counter() - self._started_counter
+            self.stat_latency.observe_many(stat_latencies)
+            self.directory_seconds.observe(seconds)
+            entry = (seconds, dirpath, files)
+            if len(self._slowest) < self.slowest_number:
+                heapq.heappush(self._slowest, entry)
+            elif entry > self._slowest[0]:
+                heapq.heapreplace(self._slowest, entry)
+
+    def get_slowest_directories(self):
+        return [
+            {"path": dirpath, "seconds": seconds, "files": files}
+            for seconds, dirpath, files in sorted(self._slowest, reverse=True)
+        ]
+
+    def _get_timestamp(self):
+        if self.started is None:
+            return 0
+        return self.started.replace(tzinfo=timezone.utc).timestamp()
+
+    def get_files_per_second(self):
+        if not self.duration:
+            return 0.0
+        return self.files / self.duration
+
+    def to_dict(self):
+        return {
+            "started[utc]": str(self.started),
+            "duration_seconds": self.duration,
+            "files": self.files,
+            "files_per_second": self.get_files_per_second(),
+            "directories": self.directories,
+            "directories_reused": self.directories_reused,
+            "errors": self.errors,
+            "unreachable": self.unreachable,
+            "checksum_seconds": self.checksum_seconds,
+            "roots": self.roots,
+            "stat_latency_seconds": self.stat_latency.to_dict(),
+            "directory_seconds": self.directory_seconds.to_dict(),
+            "slowest_directories": self.get_slowest_directories(),
+        }
+
+    def to_prometheus(self):
+        """Formats metrics in the Prometheus text exposition format"""
+        lines = []
+
+        def add(name, kind, description, samples):
+            lines.append(f"# HELP fguard_scan_{name} {description}")
+            lines.append(f"# TYPE fguard_scan_{name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(
+                    f'{key}="{_escape_label(str(label))}"' for key, label in labels
+                )
+                suffix = f"{{{label_text}}}" if label_text else ""
+                lines.append(f"fguard_scan_{name}{suffix} {value}")
+
+        def add_histogram(name, description, histogram):
+            lines.append(f"# HELP fguard_scan_{name} {description}")
+            lines.append(f"# TYPE fguard_scan_{name} histogram")
+            for bound, count in histogram.cumulative():
+                bound_text = "+Inf" if bound == float("inf") else str(bound)
+                lines.append(f'fguard_scan_{name}_bucket{{le="{bound_text}"}} {count}')
+            lines.append(f"fguard_scan_{name}_sum {histogram.sum}")
+            lines.append(f"fguard_scan_{name}_count {histogram.count}")
+
+        add(
+            "timestamp_seconds",
+            "gauge",
+            "Start of the scan",
+            [((), self._get_timestamp())],
+        )
+        add(
+            "duration_seconds",
+            "gauge",
+            "Duration of the scan",
+            [((), self.duration or 0)],
+        )
+        add("files", "gauge", "Number of files found", [((), self.files)])
+        add(
+            "files_per_second",
+            "gauge",
+            "Files found per second",
+            [((), self.get_files_per_second())],
+        )
+        add(
+            "directories",
+            "gauge",
+            "Number of directories walked",
+            [((), self.directories)],
+        )
+        add(
+            "directories_reused",
+            "gauge",
+            "Number of directories taken from the previous scan",
+            [((), self.directories_reused)],
+        )
+        add(
+            "errors",
+            "gauge",
+            "Number of directories and files that could not be read",
+            [((), self.errors)],
+        )
+        add(
+            "unreachable",
+            "gauge",
+            "Number of directories whose listing exceeded its deadline",
+            [((), self.unreachable)],
+        )
+        add(
+            "checksum_seconds",
+            "gauge",
+            "Time spent computing checksums",
+            [((), self.checksum_seconds)],
+        )
+        add(
+            "root_files",
+            "gauge",
+            "Number of files found per root directory",
+            [
+                ((("root", root),), values["files"])
+                for root, values in self.roots.items()
+            ],
+        )
+        add(
+            "root_seconds",
+            "gauge",
+            "Time until the last directory of a root directory was walked",
+            [
+                ((("root", root),), values["seconds"])
+                for root, values in self.roots.items()
+            ],
+        )
+        add(
+            "root_busy_seconds",
+            "gauge",
+            "Summed listing time of the directories of a root directory",
+            [
+                ((("root", root),), values["busy_seconds"])
+                for root, values in self.roots.items()
+            ],
+        )
+        add_histogram(
+            "stat_latency_seconds", "Latency of stat calls", self.stat_latency
+        )
+        add_histogram(
+            "directory_seconds",
+            "Time to list and stat a directory",
+            self.directory_seconds,
+        )
+        add(
+            "slowest_directory_seconds",
+            "gauge",
+            "Slowest directories of the scan",
+            [
+                ((("path", entry["path"]),), entry["seconds"])
+                for entry in self.get_slowest_directories()
+            ],
+        )
+        return "\n".join(lines) + "\n"
+
+    def write(self, file_path_prefix: str, metrics_format: str) -> str:
+        """Writes the metrics next to a scan file and returns the file path"""
+        if metrics_format == "json":
+            file_path = f"{file_path_prefix}.metrics.json"
+            _write_atomically(file_path, json.dumps(self.to_dict(), indent=2))
+        elif metrics_format == "prometheus":
+            file_path = f"{file_path_prefix}.prom"
+            _write_atomically(file_path, self.to_prometheus())
+        else:
+            raise ValueError(f"Metrics format '{metrics_format}' not supported!")
+        return file_path
@@ -0,0 +1,44 @@
+"""Registries of actions and triggers by name.
+
+Entries name the module and class that implement them and are only
+imported when they are looked up, so commands that do not perform
+actions or evaluate triggers do not pay for importing them."""
+import importlib
+from collections.abc import Mapping
+
+
+class LazyMap(Mapping):
+    """Read-only mapping of names to classes given as "module:class".
+    The module of an entry is imported on its first lookup."""
+
+    def __init__(self, entries: dict) -> None:
+        self._entries = dict(entries)
+
+    def __getitem__(self, name):
+        module_name, class_name = self._entries[name].split(":")
+        return getattr(importlib.import_module(module_name), class_name)
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+ACTIONMAP = LazyMap(
+    {
+        "stdout": "fguard.actions:StdOutAction",
+        "email": "fguard.actions:EmailAction",
+    }
+)
+
+TRIGGERMAP = LazyMap(
+    {
+        "files_missing": "fguard.triggers:FilesMissingTrigger",
+        "experiments_missing": "fguard.triggers:ExperimentsMissingTrigger",
+        "files_modified": "fguard.triggers:FilesModifiedTrigger",
+        "bytes_lost": "fguard.triggers:BytesLostTrigger",
+        "bytes_added": "fguard.triggers:BytesAddedTrigger",
+        "files_shrunk": "fguard.triggers:FilesShrunkTrigger",
+    }
+)
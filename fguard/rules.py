@@ -0,0 +1,123 @@
+"""Rules restricting which parts of the root directories are scanned.
+
+Patterns are globs, or regular expressions if prefixed with "re:".
+Globs without a separator are matched against the name of a file or
+directory, all other patterns against its absolute path. Excluded
+directories are not descended into, includes restrict the files that
+are kept. Rules are stored with the scan, so checks only compare scans
+taken with the same rules."""
+import os
+import re
+import json
+import fnmatch
+from typing import Iterable, Optional
+
+REGEX_PREFIX = "re:"
+
+
+def _compile(patterns):
+    """Combines patterns into one expression matched against
+    names and one matched against paths"""
+    name_expressions = []
+    path_expressions = []
+    for pattern in patterns:
+        if pattern.startswith(REGEX_PREFIX):
+            path_expressions.append(f"(?:{pattern[len(REGEX_PREFIX):]})")
+        elif "/" in pattern:
+            path_expressions.append(rf"\A{fnmatch.translate(pattern)}")
+        else:
+            name_expressions.append(fnmatch.translate(pattern))
+    return (
+        re.compile("|".join(name_expressions)) if name_expressions else None,
+        re.compile("|".join(path_expressions)) if path_expressions else None,
+    )
+
+
+def _matches(expressions, path):
+    name_expression, path_expression = expressions
+    if name_expression is not None and name_expression.match(os.path.basename(path)):
+        return True
+    return path_expression is not None and path_expression.search(path) is not None
+
+
+class ScanRules:
+    """Include and exclude patterns, a maximum depth below the root
+    directories and whether filesystem boundaries are crossed"""
+
+    def __init__(
+        self,
+        include: Iterable[str] = (),
+        exclude: Iterable[str] = (),
+        max_depth: Optional[int] = None,
+        one_filesystem: bool = False,
+    ) -> None:
+        if max_depth is not None and max_depth < 0:
+            raise ValueError("Maximum depth needs to be at least 0!")
+        self.include = sorted(set(include))
+        self.exclude = sorted(set(exclude))
+        self.max_depth = max_depth
+        self.one_filesystem = one_filesystem
+        try:
+            self._include = _compile(self.include)
+            self._exclude = _compile(self.exclude)
+        except re.error as error:
+            raise ValueError(f"Invalid pattern: {error}!")
+
+    @staticmethod
+    def from_dict(rules: dict) -> "ScanRules":
+        return ScanRules(
+            include=rules.get("include", ()),
+            exclude=rules.get("exclude", ()),
+            max_depth=rules.get("max_depth"),
+            one_filesystem=rules.get("one_filesystem", False),
+        )
+
+    @staticmethod
+    def from_file(file_path) -> "ScanRules":
+        """Reads rules from a JSON file with the keys include,
+        exclude, max_depth and one_filesystem"""
+        with open(file_path) as f:
+            rules = json.load(f)
+        unknown = set(rules) - {"include", "exclude", "max_depth", "one_filesystem"}
+        if unknown:
+            raise ValueError(f"Unknown rules {sorted(unknown)} in {file_path}!")
+        return ScanRules.from_dict(rules)
+
+    def to_dict(self) -> dict:
+        """Returns the rules that are set, so scans
+        without rules are recorded with an empty dict"""
+        rules = {}
+        if self.include:
+            rules["include"] = self.include
+        if self.exclude:
+            rules["exclude"] = self.exclude
+        if self.max_depth is not None:
+            rules["max_depth"] = self.max_depth
+        if self.one_filesystem:
+            rules["one_filesystem"] = True
+        return rules
+
+    def is_empty(self) -> bool:
+        return not self.to_dict()
+
+    def keep_file(self, path: str) -> bool:
+        if _matches(self._exclude, path):
+            return False
+        return not self.include or _matches(self._include, path)
+
+    def descend(self, path: str, root: str, device: Optional[int] = None) -> bool:
+        """Whether a subdirectory of a walked directory is walked.
+        device is the device of the root directory if filesystem
+        boundaries are not crossed."""
+        if self.max_depth is not None:
+            depth = path.count("/") - root.rstrip("/").count("/")
+            if depth > self.max_depth:
+                return False
+        if _matches(self._exclude, path):
+            return False
+        if self.one_filesystem and device is not None:
+            try:
+                return os.stat(path, follow_symlinks=False).st_dev == device
+            except OSError:
+                return False
+        return True
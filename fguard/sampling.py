@@ -0,0 +1,305 @@
+"""Quick checks that estimate the fraction of missing files from a sample.
+
+Instead of rescanning, a stratified random sample of the files of the
+last full scan is stat'ed. Every experiment is a stratum and the files
+outside of experiments form another one. Within a stratum, files are
+sampled systematically in sorted path order, which keeps the files of a
+directory together, so the sample is spread over the directories of the
+stratum in proportion to their number of files. The missing fraction is
+estimated with the stratified estimator and bounded with the Wilson
+score interval for the effective sample size of the stratified design."""
+import os
+import math
+import random
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from statistics import NormalDist
+from typing import Dict, List, Optional, Tuple
+from fguard.actions import BaseAction
+from fguard.colllectors import CollectionResult
+from fguard.scanfile import ScanTable
+
+# stratum of the files that do not belong to an experiment
+OTHER_FILES = "other"
+# files sampled per stratum at least, so the variance of every stratum can be estimated
+MINIMUM_STRATUM_SAMPLE = 2
+
+
+def get_strata(result: CollectionResult) -> Dict[str, List[Tuple[int, int]]]:
+    """Returns the row ranges of the files of every experiment
+    and of the remaining files in the sorted scan"""
+    strata = {
+        experiment: [(start, stop) for start, stop in ranges]
+        for experiment, ranges in result.get_experiment_index().ranges.items()
+    }
+    other = []
+    position = 0
+    for start, stop in sorted(row for ranges in strata.values() for row in ranges):
+        if start > position:
+            other.append((position, start))
+        position = stop
+    count = len(result.get_result())
+    if position < count:
+        other.append((position, count))
+    if other:
+        strata[OTHER_FILES] = other
+    return strata
+
+
+def _distribute(weights, number):
+    """Splits number in proportion to weights, giving the units left
+    after rounding down to the largest remainders"""
+    total = sum(weights.values())
+    if total == 0 or number <= 0:
+        return {key: 0 for key in weights}
+    shares = {key: number * weight / total for key, weight in weights.items()}
+    parts = {key: math.floor(share) for key, share in shares.items()}
+    left = number - sum(parts.values())
+    for key in sorted(shares, key=lambda key: parts[key] - shares[key])[:left]:
+        parts[key] += 1
+    return parts
+
+
+def allocate(counts: Dict[str, int], sample_size: int) -> Dict[str, int]:
+    """Allocates sample_size files to the strata in proportion to their
+    number of files, with at least MINIMUM_STRATUM_SAMPLE files per stratum.
+    If the minimum of all strata exceeds sample_size, files are allocated
+    in proportion only and small strata may not be sampled."""
+    minimums = {
+        stratum: min(count, MINIMUM_STRATUM_SAMPLE) for stratum, count in counts.items()
+    }
+    if sum(minimums.values()) > sample_size:
+        return _distribute(counts, min(sample_size, sum(counts.values())))
+    extra = _distribute(
+        {stratum: count - minimums[stratum] for stratum, count in counts.items()},
+        min(sample_size, sum(counts.values())) - sum(minimums.values()),
+    )
+    return {stratum: minimums[stratum] + extra[stratum] for stratum in counts}
+
+
+def _systematic_rows(ranges, sample_number, generator):
+    """Picks sample_number rows evenly spaced from a random offset"""
+    step = sum(stop - start for start, stop in ranges) / sample_number
+    offset = generator.random()
+    rows = []
+    ranges = iter(ranges)
+    start, stop = next(ranges)
+    skipped = 0
+    for index in range(sample_number):
+        position = int((index + offset) * step)
+        while position - skipped >= stop - start:
+            skipped += stop - start
+            start, stop = next(ranges)
+        rows.append(start + position - skipped)
+    return rows
+
+
+def estimate_ratio(
+    strata: Dict[str, Tuple[int, int, int]], confidence: float = 0.95
+) -> Tuple[float, float, float]:
+    """Estimates the fraction of missing files and its confidence bounds.
+    strata maps each stratum to its number of files, the number of
+    sampled files that could be checked and the number of those that
+    were missing. The estimate only covers strata with checked files,
+    the files of all others could be missing or not, so they widen the
+    bounds by their share of all files."""
+    checked = [values for values in strata.values() if values[1] > 0]
+    total = sum(count for count, _, _ in checked)
+    if total == 0:
+        raise ValueError("No sampled file could be checked!")
+    unknown = 1 - total / sum(count for count, _, _ in strata.values())
+    ratio = 0.0
+    variance = 0.0
+    for count, sample_number, missing_number in checked:
+        weight = count / total
+        stratum_ratio = missing_number / sample_number
+        ratio += weight * stratum_ratio
+        if sample_number > 1:
+            variance += (
+                weight**2
+                * (1 - sample_number / count)
+                * stratum_ratio
+                * (1 - stratum_ratio)
+                / (sample_number - 1)
+            )
+    if all(sample_number == count for count, sample_number, _ in checked):
+        return ratio, (1 - unknown) * ratio, (1 - unknown) * ratio + unknown
+    if variance > 0:
+        effective_number = ratio * (1 - ratio) / variance
+    else:
+        effective_number = sum(sample_number for _, sample_number, _ in checked)
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    denominator = 1 + z**2 / effective_number
+    center = (ratio + z**2 / (2 * effective_number)) / denominator
+    half_width = (
+        z
+        * math.sqrt(
+            ratio * (1 - ratio) / effective_number + z**2 / (4 * effective_number**2)
+        )
+        / denominator
+    )
+    lower = max(0.0, center - half_width)
+    upper = min(1.0, center + half_width)
+    return ratio, (1 - unknown) * lower, (1 - unknown) * upper + unknown
+
+
+def _is_missing(path):
+    """Returns whether a file is missing or None if it could not be checked"""
+    try:
+        os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return True
+    except OSError:
+        return None
+    return False
+
+
+def _get_top(counts, top_number):
+    return dict(counts.most_common(top_number))
+
+
+class SampledMissingCheck:
+    """Will perform actions when the estimated fraction of missing
+    files of a scan exceeds ratio_threshold. A stratified sample of at most
+    sample_size files of the scan is stat'ed by workers threads. Messages
+    list the top_number experiments and directories with the most missing
+    files in the sample."""
+
+    def __init__(
+        self,
+        actions: List[BaseAction],
+        ratio_threshold: float = 0.01,
+        sample_size: int = 10000,
+        confidence: float = 0.95,
+        workers: int = 8,
+        top_number: int = 10,
+        seed: Optional[int] = None,
+    ):
+        if sample_size < 1:
+            raise ValueError("Sample size needs to be at least 1!")
+        if not 0 < confidence < 1:
+            raise ValueError("Confidence needs to be between 0 and 1!")
+        self.actions = actions
+        self.ratio_threshold = ratio_threshold
+        self.sample_size = sample_size
+        self.confidence = confidence
+        self.workers = workers
+        self.top_number = top_number
+        self.seed = seed
+        self.logger = logging.getLogger()
+
+    def sample(self, result: CollectionResult) -> List[Tuple[str, str]]:
+        """Returns (stratum, file) pairs of a stratified sample of the scan.
+        Rows of scan files are decoded individually, so only the pages
+        of the sampled files are read."""
+        files = result.get_result()
+        if isinstance(files, ScanTable):
+            get_key = files.get_key
+        else:
+            get_key = [file for file, _ in result.iter_sorted_items()].__getitem__
+        strata = get_strata(result)
+        counts = {
+            stratum: sum(stop - start for start, stop in ranges)
+            for stratum, ranges in strata.items()
+        }
+        allocation = allocate(counts, self.sample_size)
+        unsampled = sum(
+            1 for sample_number in allocation.values() if sample_number == 0
+        )
+        if unsampled:
+            self.logger.warning(
+                f" {unsampled} of {len(counts)} strata are too small to be sampled"
+                f" with a sample size of {self.sample_size}"
+            )
+        generator = random.Random(self.seed)
+        sample = []
+        for stratum, sample_number in allocation.items():
+            if sample_number == 0:
+                continue
+            for row in _systematic_rows(strata[stratum], sample_number, generator):
+                sample.append((stratum, get_key(row)))
+        return sample
+
+    def _construct_message(self, result, file_number, estimate, sampled):
+        ratio, lower, upper = estimate
+        return {
+            "title": "Missing files estimated!",
+            "description": f"An estimated {ratio:.2%} of the {file_number} files of a scan performed at {result.get_date()} are missing, between {lower:.2%} and {upper:.2%} with {self.confidence:.0%} confidence. {self.missing_files_number} of {sampled} sampled files were missing in {len(self.experiments_affected)} experiments.",
+            "subject": "Missing files estimated",
+            "experiments": sorted(self.experiments_affected),
+            "details": {
+                "estimated_missing_ratio": ratio,
+                "missing_ratio_lower_bound": lower,
+                "missing_ratio_upper_bound": upper,
+                "confidence": self.confidence,
+                "estimated_missing_file_number": round(ratio * file_number),
+                "sampled_file_number": sampled,
+                "missing_sample_number": self.missing_files_number,
+                "unchecked_sample_number": self.unchecked_files_number,
+                "unsampled_file_number": self.unsampled_files_number,
+                "experiments_affected_number": len(self.experiments_affected),
+                "experiments_affected": _get_top(
+                    self.experiments_affected, self.top_number
+                ),
+                "directories_affected_number": len(self.directories_affected),
+                "directories_affected": _get_top(
+                    self.directories_affected, self.top_number
+                ),
+                "directories_scanned": result.get_directories_scanned(),
+                "date[utc]": str(result.get_date()),
+            },
+        }
+
+    def inspect(self, result: CollectionResult) -> dict:
+        """Checks a sample of the files of the scan, performs the
+        actions if the estimate exceeds the threshold and returns the message"""
+        if result.is_partial():
+            raise ValueError("Quick checks need a full scan!")
+        if len(result.get_result()) == 0:
+            raise ValueError("Scan does not contain any files!")
+        sample = self.sample(result)
+        strata = get_strata(result)
+        counts = {
+            stratum: [sum(stop - start for start, stop in ranges), 0, 0]
+            for stratum, ranges in strata.items()
+        }
+        self.missing_files_number = 0
+        self.unchecked_files_number = 0
+        self.experiments_affected = Counter()
+        self.directories_affected = Counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            outcomes = executor.map(_is_missing, [file for _, file in sample])
+            for (stratum, file), missing in zip(sample, outcomes):
+                if missing is None:
+                    self.unchecked_files_number += 1
+                    continue
+                counts[stratum][1] += 1
+                if not missing:
+                    continue
+                counts[stratum][2] += 1
+                self.missing_files_number += 1
+                self.directories_affected[os.path.dirname(file)] += 1
+                if stratum != OTHER_FILES:
+                    self.experiments_affected[stratum] += 1
+        self.unsampled_files_number = sum(
+            count for count, checked, _ in counts.values() if checked == 0
+        )
+        estimate = estimate_ratio(
+            {stratum: tuple(values) for stratum, values in counts.items()},
+            self.confidence,
+        )
+        self.logger.info(
+            f" Estimated {estimate[0]:.2%} missing files"
+            f" ({estimate[1]:.2%} to {estimate[2]:.2%}) from {len(sample)} files"
+        )
+        message = {}
+        if estimate[0] > self.ratio_threshold:
+            message = self._construct_message(
+                result, len(result.get_result()), estimate, len(sample)
+            )
+            for action in self.actions:
+                action.perform(message)
+        for action in self.actions:
+            action.flush()
+        return message
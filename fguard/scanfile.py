@@ -0,0 +1,366 @@
+"""Versioned columnar file format for scan results.
+
+A scan file starts with a short magic header, followed by sections
+that are aligned to 8 bytes and a JSON footer describing them:
+
+    MAGIC VERSION | section | section | ... | footer | footer length, TRAILER
+
+Every table consists of a key section, holding the sorted keys
+prefix-compressed with a full key every RESTART_INTERVAL entries,
+a restarts section with the offsets of those full keys and one
+fixed-width column section per statistic. Sections can be
+compressed individually with gzip or zstd.
+
+Columns are either numeric, described by a typecode of the array
+module, or fixed-width byte strings, described by e.g. "16s". Byte
+string columns store missing values as zeros.
+"""
+import os
+import sys
+import json
+import zlib
+import struct
+from array import array
+from collections.abc import Mapping
+
+
+MAGIC = b"FGSCAN"
+VERSION = 1
+HEADER = struct.Struct("<6sH")
+TRAILER = struct.Struct("<Q8s")
+TRAILER_MAGIC = b"FGSCANFT"
+ENTRY = struct.Struct("<HH")
+RESTART_INTERVAL = 64
+COMPRESSIONS = ("none", "gzip", "zstd")
+FILE_COLUMNS = (
+    ("size", "q"),
+    ("modified_date", "d"),
+    ("created_date", "d"),
+    ("user_id", "q"),
+)
+CHECKSUM_COLUMN = ("checksum", "16s")
+_CHUNK_SIZE = 1 << 20
+
+
+def _import_zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError(
+            "You need to install the 'zstandard' package to use zstd compression"
+        )
+    return zstandard
+
+
+def _get_compressor(compression):
+    if compression == "none":
+        return None
+    if compression == "gzip":
+        return zlib.compressobj(6, zlib.DEFLATED, 31)
+    if compression == "zstd":
+        return _import_zstandard().ZstdCompressor().compressobj()
+    raise ValueError(f"Compression '{compression}' not supported!")
+
+
+def _decompress(data, compression):
+    if compression == "gzip":
+        return zlib.decompress(data, 31)
+    if compression == "zstd":
+        return _import_zstandard().ZstdDecompressor().decompressobj().decompress(data)
+    raise ValueError(f"Compression '{compression}' not supported!")
+
+
+def _common_prefix_length(first, second):
+    length = min(len(first), len(second))
+    index = 0
+    while index < length and first[index] == second[index]:
+        index += 1
+    return index
+
+
+def _is_bytes_column(typecode):
+    return typecode.endswith("s")
+
+
+class _BytesColumnValues:
+    """Collects values of a fixed-width byte string column"""
+
+    def __init__(self, typecode):
+        self.width = int(typecode[:-1])
+        self._data = bytearray()
+        self._empty = bytes(self.width)
+
+    def append(self, value):
+        if value is None:
+            value = self._empty
+        if len(value) != self.width:
+            raise ValueError(f"Value needs to be {self.width} bytes long!")
+        self._data += value
+
+    def byteswap(self):
+        pass
+
+    def tobytes(self):
+        return bytes(self._data)
+
+
+class _BytesColumn:
+    """Read access to a fixed-width byte string column"""
+
+    def __init__(self, data, start, end, typecode):
+        self._data = data
+        self._start = start
+        self.width = int(typecode[:-1])
+        self._empty = bytes(self.width)
+
+    def __getitem__(self, row):
+        position = self._start + row * self.width
+        value = bytes(self._data[position : position + self.width])
+        return None if value == self._empty else value
+
+
+def is_scan_file(file_path):
+    """Checks whether a file is stored in the columnar scan format"""
+    with open(file_path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class ScanWriter:
+    """Writes tables of sorted keys and associated
+    statistics to a file object in a streaming fashion"""
+
+    def __init__(self, file_object, compression: str = "none") -> None:
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Compression '{compression}' not supported!")
+        self._file = file_object
+        self.compression = compression
+        self._tables = {}
+        self._file.write(HEADER.pack(MAGIC, VERSION))
+        self._offset = HEADER.size
+
+    def _write(self, data):
+        self._file.write(data)
+        self._offset += len(data)
+
+    def _write_section(self, chunks):
+        """Writes chunks of bytes as a single aligned section
+        and returns its offset and length"""
+        self._write(bytes(-self._offset % 8))
+        start = self._offset
+        compressor = _get_compressor(self.compression)
+        for chunk in chunks:
+            self._write(compressor.compress(chunk) if compressor else chunk)
+        if compressor:
+            self._write(compressor.flush())
+        return [start, self._offset - start]
+
+    @staticmethod
+    def _column_bytes(values):
+        if sys.byteorder != "little":
+            values.byteswap()
+        return values.tobytes()
+
+    def write_table(self, name, items, columns=FILE_COLUMNS):
+        """Writes (key, info) pairs that are sorted by key.
+        Statistics are taken from info for every column."""
+        values = {
+            column: _BytesColumnValues(typecode)
+            if _is_bytes_column(typecode)
+            else array(typecode)
+            for column, typecode in columns
+        }
+        restarts = array("Q")
+        count = 0
+
+        def encode_keys():
+            nonlocal count
+            buffer = bytearray()
+            position = 0
+            previous_key = None
+            previous = b""
+            for key, info in items:
+                if previous_key is not None and key <= previous_key:
+                    raise ValueError("Keys need to be unique and sorted!")
+                encoded = os.fsencode(key)
+                if count % RESTART_INTERVAL == 0:
+                    shared = 0
+                    restarts.append(position)
+                else:
+                    shared = _common_prefix_length(previous, encoded)
+                suffix = encoded[shared:]
+                buffer += ENTRY.pack(shared, len(suffix))
+                buffer += suffix
+                position += ENTRY.size + len(suffix)
+                for column, column_values in values.items():
+                    column_values.append(info.get(column))
+                previous_key = key
+                previous = encoded
+                count += 1
+                if len(buffer) > _CHUNK_SIZE:
+                    yield bytes(buffer)
+                    buffer.clear()
+            yield bytes(buffer)
+
+        sections = {"keys": self._write_section(encode_keys())}
+        sections["restarts"] = self._write_section([self._column_bytes(restarts)])
+        for column, column_values in values.items():
+            sections[column] = self._write_section([self._column_bytes(column_values)])
+        self._tables[name] = {
+            "count": count,
+            "restart_interval": RESTART_INTERVAL,
+            "columns": dict(columns),
+            "sections": sections,
+        }
+
+    def close(self, **metadata):
+        """Writes the footer with the given metadata"""
+        footer = {
+            "version": VERSION,
+            "compression": self.compression,
+            "tables": self._tables,
+            **metadata,
+        }
+        encoded = json.dumps(footer).encode("utf-8")
+        self._write(encoded)
+        self._write(TRAILER.pack(len(encoded), TRAILER_MAGIC))
+
+
+def read_footer(buffer):
+    """Reads the footer of a scan file held in a buffer"""
+    magic, version = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a scan file!")
+    if version > VERSION:
+        raise ValueError(f"Scan file version {version} is not supported!")
+    footer_length, trailer_magic = TRAILER.unpack_from(buffer, len(buffer) - TRAILER.size)
+    if trailer_magic != TRAILER_MAGIC:
+        raise ValueError("Scan file is truncated!")
+    end = len(buffer) - TRAILER.size
+    return json.loads(bytes(buffer[end - footer_length : end]).decode("utf-8"))
+
+
+class ScanTable(Mapping):
+    """Read-only mapping of sorted keys to statistics
+    backed by a buffer holding a scan file.
+    Lookups are binary searches over the restart keys,
+    iteration decodes one block of keys after another."""
+
+    def __init__(self, buffer, footer, name="files") -> None:
+        description = footer["tables"][name]
+        self._compression = footer["compression"]
+        self._count = description["count"]
+        self._interval = description["restart_interval"]
+        sections = description["sections"]
+        self._keys, self._keys_start, self._keys_end = self._section(
+            buffer, sections["keys"]
+        )
+        self._restarts = self._column(buffer, sections["restarts"], "Q")
+        self._columns = {
+            column: self._column(buffer, sections[column], typecode)
+            for column, typecode in description["columns"].items()
+        }
+
+    def _section(self, buffer, section):
+        offset, length = section
+        if self._compression == "none":
+            return buffer, offset, offset + length
+        data = _decompress(buffer[offset : offset + length], self._compression)
+        return data, 0, len(data)
+
+    def _column(self, buffer, section, typecode):
+        data, start, end = self._section(buffer, section)
+        if _is_bytes_column(typecode):
+            return _BytesColumn(data, start, end, typecode)
+        if sys.byteorder == "little":
+            return memoryview(data)[start:end].cast(typecode)
+        values = array(typecode)
+        values.frombytes(data[start:end])
+        values.byteswap()
+        return values
+
+    def __len__(self):
+        return self._count
+
+    def _restart_key(self, block):
+        position = self._keys_start + self._restarts[block]
+        _, length = ENTRY.unpack_from(self._keys, position)
+        position += ENTRY.size
+        return os.fsdecode(self._keys[position : position + length])
+
+    def _iter_block(self, block):
+        """Yields row numbers and keys of a block"""
+        keys = self._keys
+        position = self._keys_start + self._restarts[block]
+        if block + 1 < len(self._restarts):
+            end = self._keys_start + self._restarts[block + 1]
+        else:
+            end = self._keys_end
+        row = block * self._interval
+        key = b""
+        while position < end:
+            shared, length = ENTRY.unpack_from(keys, position)
+            position += ENTRY.size
+            key = key[:shared] + keys[position : position + length]
+            position += length
+            yield row, os.fsdecode(key)
+            row += 1
+
+    def _find(self, key):
+        """Returns the row of a key or -1 if it is not contained"""
+        if len(self._restarts) == 0 or key < self._restart_key(0):
+            return -1
+        for row, candidate in self._iter_block(self._find_block(key)):
+            if candidate == key:
+                return row
+            if candidate > key:
+                break
+        return -1
+
+    def get_key(self, row):
+        """Returns the key stored in a row, decoding only its block"""
+        if not 0 <= row < self._count:
+            raise IndexError(row)
+        for candidate, key in self._iter_block(row // self._interval):
+            if candidate == row:
+                return key
+
+    def get_row(self, row):
+        """Returns statistics stored in a row"""
+        return {column: values[row] for column, values in self._columns.items()}
+
+    def __getitem__(self, key):
+        row = self._find(key)
+        if row < 0:
+            raise KeyError(key)
+        return self.get_row(row)
+
+    def __contains__(self, key):
+        return isinstance(key, str) and self._find(key) >= 0
+
+    def __iter__(self):
+        for block in range(len(self._restarts)):
+            for _, key in self._iter_block(block):
+                yield key
+
+    def get_columns(self):
+        return tuple(self._columns.keys())
+
+    def _find_block(self, key):
+        """Returns the last block whose restart key is not greater than key"""
+        low, high = 0, len(self._restarts)
+        while low < high:
+            middle = (low + high) // 2
+            if key < self._restart_key(middle):
+                high = middle
+            else:
+                low = middle + 1
+        return max(low - 1, 0)
+
+    def iter_items(self, start=None):
+        """Yields (key, statistics) pairs in sorted order,
+        starting at the first key not less than start"""
+        first_block = 0 if start is None else self._find_block(start)
+        for block in range(first_block, len(self._restarts)):
+            for row, key in self._iter_block(block):
+                if start is None or key >= start:
+                    yield key, self.get_row(row)
@@ -0,0 +1,518 @@
+"""SQLite-backed store for the history of scans.
+
+Every scan is saved as the changes against the previous scan of the store.
+Every full_interval scans, and whenever the store is empty, a scan is saved
+in full, which bounds the number of deltas that have to be replayed to
+rebuild a snapshot. The rows of these scans are merged in path order, so
+snapshots are built as compact files and new scans are compared with the
+newest snapshot as its rows are read. Scans are found through an index on
+their date.
+
+Deltas are indexed by path and the file counts of every experiment are
+stored with each scan, so the history of a file or an experiment is
+answered without rebuilding any snapshot."""
+import json
+import heapq
+import sqlite3
+from datetime import datetime
+from typing import List, NamedTuple, Optional
+from fguard.colllectors import CollectionResult
+from fguard.compact import CompactFiles
+from fguard.diff import ADDED, MISSING, MODIFIED
+from fguard.experiments import get_experiment_number
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    id INTEGER PRIMARY KEY,
+    date TEXT NOT NULL,
+    directories_scanned TEXT NOT NULL,
+    base_id INTEGER REFERENCES scans(id),
+    file_count INTEGER NOT NULL,
+    added INTEGER,
+    missing INTEGER,
+    modified INTEGER,
+    rules TEXT,
+    unreachable TEXT
+);
+CREATE INDEX IF NOT EXISTS scans_date ON scans(date);
+CREATE INDEX IF NOT EXISTS scans_base ON scans(base_id);
+CREATE TABLE IF NOT EXISTS files (
+    scan_id INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    removed INTEGER NOT NULL,
+    size INTEGER,
+    modified_date REAL,
+    created_date REAL,
+    user_id INTEGER,
+    checksum BLOB,
+    PRIMARY KEY (scan_id, path)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS files_path ON files(path);
+CREATE TABLE IF NOT EXISTS directories (
+    scan_id INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    removed INTEGER NOT NULL,
+    modified_date REAL,
+    PRIMARY KEY (scan_id, path)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS experiments (
+    experiment TEXT NOT NULL,
+    scan_id INTEGER NOT NULL,
+    file_count INTEGER NOT NULL,
+    total_size INTEGER NOT NULL,
+    PRIMARY KEY (experiment, scan_id)
+) WITHOUT ROWID;
+"""
+SCAN_COLUMNS = (
+    "id, date, directories_scanned, base_id, file_count, added, missing, modified,"
+    " rules, unreachable"
+)
+# columns added to the scans table after the first version of the store,
+# added to existing stores when they are opened
+ADDED_SCAN_COLUMNS = (("rules", "TEXT"), ("unreachable", "TEXT"))
+TABLES = ("files", "directories", "experiments")
+FILE_FIELDS = ("size", "modified_date", "created_date", "user_id", "checksum")
+DIRECTORY_FIELDS = ("modified_date",)
+
+
+class ScanInfo:
+    """Entry of the scan index"""
+
+    def __init__(
+        self,
+        scan_id,
+        date,
+        directories_scanned,
+        base_id,
+        file_count,
+        added=None,
+        missing=None,
+        modified=None,
+        rules=None,
+        unreachable=None,
+    ):
+        self.scan_id = scan_id
+        self.date = date
+        self.directories_scanned = directories_scanned
+        self.base_id = base_id
+        self.file_count = file_count
+        # changes against the previous scan, None for the first scan
+        self.added = added
+        self.missing = missing
+        self.modified = modified
+        # rules the scan was taken with, empty if all files were scanned
+        self.rules = rules if rules is not None else {}
+        # directories whose listing exceeded its deadline, their subtrees were not scanned
+        self.unreachable = unreachable if unreachable is not None else []
+
+    def is_full(self):
+        return self.base_id is None
+
+    @staticmethod
+    def from_row(row):
+        return ScanInfo(
+            row[0],
+            datetime.fromisoformat(row[1]),
+            json.loads(row[2]),
+            *row[3:8],
+            rules=json.loads(row[8]) if row[8] is not None else None,
+            unreachable=json.loads(row[9]) if row[9] is not None else None,
+        )
+
+
+class History(NamedTuple):
+    """History of a file or an experiment. Events are (scan, kind, state)
+    tuples of the scans in which the state changed, oldest first."""
+
+    first_seen: Optional[ScanInfo]
+    last_seen: Optional[ScanInfo]
+    events: list
+
+
+def _get_history(states):
+    """Summarizes the states of a file or an experiment in
+    consecutive scans, None marking scans it was absent from"""
+    first_seen = last_seen = None
+    events = []
+    previous = None
+    for scan, state in states:
+        if state is not None:
+            first_seen = first_seen or scan
+            last_seen = scan
+        if previous is None and state is not None:
+            events.append((scan, ADDED, state))
+        elif previous is not None and state is None:
+            events.append((scan, MISSING, None))
+        elif previous is not None and state != previous:
+            events.append((scan, MODIFIED, state))
+        previous = state
+    return History(first_seen, last_seen, events)
+
+
+def _get_fields(table):
+    return FILE_FIELDS if table == "files" else DIRECTORY_FIELDS
+
+
+def _to_row(info, fields):
+    return [info.get(field) for field in fields]
+
+
+def _from_row(row, fields):
+    info = {}
+    for field, value in zip(fields, row):
+        if field == "checksum":
+            if value is not None:
+                info[field] = bytes(value)
+        else:
+            info[field] = value
+    return info
+
+
+def _iter_changes(old_items, new_items, fields):
+    """Merges two iterators of sorted (path, info) pairs into (kind, path, info)
+    changes. Unlike diff_scans, all stored fields are compared, so entries
+    that gained or lost a checksum are stored as modified."""
+    old = next(old_items, None)
+    new = next(new_items, None)
+    while old is not None or new is not None:
+        if new is None or (old is not None and old[0] < new[0]):
+            yield MISSING, old[0], None
+            old = next(old_items, None)
+        elif old is None or new[0] < old[0]:
+            yield ADDED, new[0], new[1]
+            new = next(new_items, None)
+        else:
+            if _to_row(old[1], fields) != _to_row(new[1], fields):
+                yield MODIFIED, new[0], new[1]
+            old = next(old_items, None)
+            new = next(new_items, None)
+
+
+class ScanStore:
+    """Stores scans as deltas in an SQLite database"""
+
+    def __init__(self, file_path: str, full_interval: int = 30) -> None:
+        self.file_path = file_path
+        self.full_interval = full_interval
+        self.connection = sqlite3.connect(file_path)
+        self.connection.executescript(SCHEMA)
+        self._add_columns()
+
+    def _add_columns(self):
+        """Adds columns that stores created by earlier versions lack"""
+        columns = {
+            row[1] for row in self.connection.execute("PRAGMA table_info(scans)")
+        }
+        with self.connection:
+            for column, column_type in ADDED_SCAN_COLUMNS:
+                if column not in columns:
+                    self.connection.execute(
+                        f"ALTER TABLE scans ADD COLUMN {column} {column_type}"
+                    )
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # index
+
+    def list_scans(self) -> List[ScanInfo]:
+        """Returns all scans, oldest first"""
+        rows = self.connection.execute(
+            f"SELECT {SCAN_COLUMNS} FROM scans ORDER BY date, id"
+        )
+        return [ScanInfo.from_row(row) for row in rows]
+
+    def get_scan(self, scan_id: int) -> ScanInfo:
+        row = self.connection.execute(
+            f"SELECT {SCAN_COLUMNS} FROM scans WHERE id = ?",
+            (scan_id,),
+        ).fetchone()
+        if row is None:
+            raise ValueError(f"Scan {scan_id} not found in store!")
+        return ScanInfo.from_row(row)
+
+    def latest(self, number: int = 2) -> List[ScanInfo]:
+        """Returns the newest scans, newest first"""
+        rows = self.connection.execute(
+            f"SELECT {SCAN_COLUMNS} FROM scans ORDER BY date DESC, id DESC LIMIT ?",
+            (number,),
+        )
+        return [ScanInfo.from_row(row) for row in rows]
+
+    def at(self, date: datetime) -> Optional[ScanInfo]:
+        """Returns the newest scan performed at or before date"""
+        row = self.connection.execute(
+            f"SELECT {SCAN_COLUMNS} FROM scans"
+            " WHERE date <= ? ORDER BY date DESC, id DESC LIMIT 1",
+            (date.isoformat(),),
+        ).fetchone()
+        return ScanInfo.from_row(row) if row is not None else None
+
+    # snapshots
+
+    def _get_chain(self, scan_id):
+        """Returns the ids of the scans whose changes make
+        up a snapshot, starting with the full scan"""
+        chain = []
+        current = scan_id
+        while current is not None:
+            chain.append(current)
+            current = self.get_scan(current).base_id
+        return list(reversed(chain))
+
+    def _replay(self, scan_id, table, fields):
+        """Yields the (path, info) pairs of a snapshot sorted by path. The rows
+        of every scan of the chain are read in path order and merged, the
+        newest row of a path taking precedence, so no snapshot is held."""
+        columns = ", ".join(fields)
+
+        def iter_rows(position, chain_id):
+            for row in self.connection.execute(
+                f"SELECT path, removed, {columns} FROM {table}"
+                " WHERE scan_id = ? ORDER BY path",
+                (chain_id,),
+            ):
+                yield row[0], -position, row
+
+        chain = self._get_chain(scan_id)
+        previous_path = None
+        for path, _, row in heapq.merge(
+            *(iter_rows(position, chain_id) for position, chain_id in enumerate(chain))
+        ):
+            if path == previous_path:
+                continue
+            previous_path = path
+            if not row[1]:
+                yield path, _from_row(row[2:], fields)
+
+    def load(self, scan_id: int) -> CollectionResult:
+        """Rebuilds the snapshot of a scan"""
+        scan = self.get_scan(scan_id)
+        return CollectionResult(
+            CompactFiles.from_sorted_items(self._replay(scan_id, "files", FILE_FIELDS)),
+            scan.directories_scanned,
+            scan.date,
+            directories=dict(self._replay(scan_id, "directories", DIRECTORY_FIELDS)),
+            rules=scan.rules,
+            unreachable=scan.unreachable,
+        )
+
+    # writing
+
+    def _needs_full(self, base: Optional[ScanInfo]):
+        if base is None:
+            return True
+        return len(self._get_chain(base.scan_id)) >= self.full_interval
+
+    def _insert_changes(self, scan_id, table, fields, changes):
+        placeholders = ", ".join(["?"] * (len(fields) + 3))
+        self.connection.executemany(
+            f"INSERT OR REPLACE INTO {table} VALUES ({placeholders})",
+            (
+                (
+                    (scan_id, path, 0, *_to_row(info, fields))
+                    if info is not None
+                    else (scan_id, path, 1, *[None] * len(fields))
+                )
+                for path, info in changes
+            ),
+        )
+
+    @staticmethod
+    def _get_rows(changes):
+        """Turns changes into (path, info) rows, None marking removed entries"""
+        for kind, path, info in changes:
+            yield path, None if kind == MISSING else info
+
+    def _insert_experiments(self, scan_id, result):
+        experiments = {}
+        for path, info in result.iter_sorted_items():
+            experiment_number = get_experiment_number(path)
+            if experiment_number is not None:
+                counts = experiments.setdefault(experiment_number, [0, 0])
+                counts[0] += 1
+                counts[1] += info.get("size") or 0
+        self.connection.executemany(
+            "INSERT INTO experiments VALUES (?, ?, ?, ?)",
+            (
+                (experiment_number, scan_id, file_count, total_size)
+                for experiment_number, (file_count, total_size) in experiments.items()
+            ),
+        )
+
+    def add(self, result: CollectionResult) -> int:
+        """Saves a scan as delta against the newest scan of the store"""
+        latest = self.latest(1)
+        base = latest[0] if latest else None
+        full = self._needs_full(base)
+        file_changes = directory_changes = None
+        counts = [None, None, None]
+        if base is not None:
+            # the new scan is compared with the rows of the newest snapshot
+            # as they are read, only the changes are held
+            file_changes = list(
+                _iter_changes(
+                    self._replay(base.scan_id, "files", FILE_FIELDS),
+                    result.iter_sorted_items(),
+                    FILE_FIELDS,
+                )
+            )
+            directory_changes = list(
+                _iter_changes(
+                    self._replay(base.scan_id, "directories", DIRECTORY_FIELDS),
+                    iter(sorted(result.get_directories().items())),
+                    DIRECTORY_FIELDS,
+                )
+            )
+            kinds = [kind for kind, _, _ in file_changes]
+            counts = [kinds.count(kind) for kind in [ADDED, MISSING, MODIFIED]]
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO scans (date, directories_scanned, base_id, file_count,"
+                " added, missing, modified, rules, unreachable)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    result.get_date().isoformat(),
+                    json.dumps(list(result.get_directories_scanned())),
+                    None if full else base.scan_id,
+                    len(result.get_result()),
+                    *counts,
+                    json.dumps(result.get_rules()),
+                    json.dumps(list(result.get_unreachable())),
+                ),
+            )
+            scan_id = cursor.lastrowid
+            if full:
+                files = result.iter_sorted_items()
+                directories = result.get_directories().items()
+            else:
+                files = self._get_rows(file_changes)
+                directories = self._get_rows(directory_changes)
+            self._insert_changes(scan_id, "files", FILE_FIELDS, files)
+            self._insert_changes(scan_id, "directories", DIRECTORY_FIELDS, directories)
+            self._insert_experiments(scan_id, result)
+        return scan_id
+
+    # history
+
+    def get_file_history(self, path: str) -> History:
+        """Returns when a file was first and last seen and how it changed"""
+        rows = {
+            row[0]: None if row[1] else _from_row(row[2:], FILE_FIELDS)
+            for row in self.connection.execute(
+                f"SELECT scan_id, removed, {', '.join(FILE_FIELDS)}"
+                " FROM files WHERE path = ?",
+                (path,),
+            )
+        }
+        scans = self.list_scans()
+        states = {}
+        # bases were added before the scans based on them
+        for scan in sorted(scans, key=lambda scan: scan.scan_id):
+            if scan.scan_id in rows:
+                states[scan.scan_id] = rows[scan.scan_id]
+            elif scan.is_full():
+                states[scan.scan_id] = None
+            else:
+                states[scan.scan_id] = states[scan.base_id]
+        return _get_history([(scan, states[scan.scan_id]) for scan in scans])
+
+    def get_experiment_history(self, experiment_number: str) -> History:
+        """Returns when an experiment was first and last seen and how
+        its number of files and total size changed, states being
+        (file count, total size) tuples"""
+        rows = {
+            row[0]: (row[1], row[2])
+            for row in self.connection.execute(
+                "SELECT scan_id, file_count, total_size"
+                " FROM experiments WHERE experiment = ?",
+                (experiment_number,),
+            )
+        }
+        return _get_history(
+            [(scan, rows.get(scan.scan_id)) for scan in self.list_scans()]
+        )
+
+    # retention
+
+    def _make_full(self, scan_id):
+        snapshot = self.load(scan_id)
+        for table in ["files", "directories"]:
+            self.connection.execute(
+                f"DELETE FROM {table} WHERE scan_id = ?", (scan_id,)
+            )
+        self._insert_changes(
+            scan_id, "files", FILE_FIELDS, snapshot.iter_sorted_items()
+        )
+        self._insert_changes(
+            scan_id,
+            "directories",
+            DIRECTORY_FIELDS,
+            snapshot.get_directories().items(),
+        )
+        self.connection.execute(
+            "UPDATE scans SET base_id = NULL WHERE id = ?", (scan_id,)
+        )
+
+    def remove(self, scan_id: int) -> None:
+        """Removes a scan. Changes of the scan are folded
+        into the scans that are based on it."""
+        scan = self.get_scan(scan_id)
+        children = [
+            row[0]
+            for row in self.connection.execute(
+                "SELECT id FROM scans WHERE base_id = ?", (scan_id,)
+            )
+        ]
+        with self.connection:
+            for child in children:
+                if scan.is_full():
+                    self._make_full(child)
+                    continue
+                for table in ["files", "directories"]:
+                    # changes of the child take precedence
+                    self.connection.execute(
+                        f"INSERT OR IGNORE INTO {table}"
+                        f" SELECT ?, path, removed, {', '.join(_get_fields(table))}"
+                        f" FROM {table} WHERE scan_id = ?",
+                        (child, scan_id),
+                    )
+                self.connection.execute(
+                    "UPDATE scans SET base_id = ? WHERE id = ?", (scan.base_id, child)
+                )
+            for table in TABLES:
+                self.connection.execute(
+                    f"DELETE FROM {table} WHERE scan_id = ?", (scan_id,)
+                )
+            self.connection.execute("DELETE FROM scans WHERE id = ?", (scan_id,))
+
+    def apply_retention(
+        self, keep_last: Optional[int] = None, keep_after: Optional[datetime] = None
+    ) -> List[int]:
+        """Removes scans that are neither among the keep_last newest
+        nor performed after keep_after and compacts the database"""
+        scans = self.list_scans()
+        keep = set()
+        if keep_last is not None:
+            keep.update(scan.scan_id for scan in scans[-keep_last:] if keep_last > 0)
+        if keep_after is not None:
+            keep.update(scan.scan_id for scan in scans if scan.date > keep_after)
+        if keep_last is None and keep_after is None:
+            return []
+        removed = []
+        for scan in scans:
+            if scan.scan_id not in keep:
+                self.remove(scan.scan_id)
+                removed.append(scan.scan_id)
+        self.compact()
+        return removed
+
+    def compact(self):
+        """Gives space of removed scans back to the filesystem"""
+        self.connection.execute("VACUUM")
@@ -0,0 +1,153 @@
+"""Tests for directory aggregates and the top-down comparison of scans"""
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from fguard.aggregates import compute_aggregates
+from fguard.colllectors import CollectionResult, FlatCollector
+from fguard.diff import diff_scans, iter_changed_directories, _merge
+
+
+def _write(file_path, content="x"):
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, "w") as f:
+        f.write(content)
+
+
+class TestAggregates(unittest.TestCase):
+    """Test suite for aggregates computed at scan time"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.directory.name, "root")
+        for path in ["a/1", "a/2", "a/b/3", "a/b0/4", "c/5", "6"]:
+            _write(os.path.join(self.root, path), "x" * len(path))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _scan(self):
+        collector = FlatCollector([self.root], log_level="WARNING")
+        collector.collect_files()
+        return collector.get_file_stats()
+
+    def _save_and_load(self, result, name):
+        file_path = os.path.join(self.directory.name, name)
+        result.to_file(file_path)
+        return CollectionResult.from_file(file_path, memory_map=True)
+
+    def test_aggregates_computed(self):
+        """Tests whether aggregates sum up the subtrees"""
+        result = self._scan()
+        directories = result.get_directories()
+        self.assertEqual(directories[self.root]["file_count"], 6)
+        self.assertEqual(directories[os.path.join(self.root, "a")]["file_count"], 4)
+        self.assertEqual(directories[os.path.join(self.root, "a")]["total_size"], 17)
+        loaded = self._save_and_load(result, "old.scan")
+        self.assertTrue(loaded.has_aggregates())
+        self.assertEqual(
+            dict(loaded.get_directories()[self.root]), directories[self.root]
+        )
+
+    def test_children_skip_subtrees(self):
+        """Tests whether only direct children are listed from scan files"""
+        loaded = self._save_and_load(self._scan(), "old.scan")
+        directory = os.path.join(self.root, "a")
+        self.assertEqual(
+            [path for path, _ in loaded.iter_directory_files(directory)],
+            [os.path.join(directory, "1"), os.path.join(directory, "2")],
+        )
+        self.assertEqual(
+            [path for path, _ in loaded.iter_subdirectories(directory)],
+            [os.path.join(directory, "b"), os.path.join(directory, "b0")],
+        )
+
+    def test_unchanged_trees_skipped(self):
+        """Tests whether no directory is descended into if nothing changed"""
+        old_result = self._save_and_load(self._scan(), "old.scan")
+        new_result = self._scan()
+        self.assertEqual(list(iter_changed_directories(old_result, new_result)), [])
+        self.assertEqual(list(diff_scans(old_result, new_result)), [])
+
+    def test_pruned_diff_complete(self):
+        """Tests whether comparing changed directories finds all changes"""
+        old_result = self._scan()
+        os.remove(os.path.join(self.root, "a/b/3"))
+        os.rename(os.path.join(self.root, "c/5"), os.path.join(self.root, "c/7"))
+        _write(os.path.join(self.root, "a/b0/4"), "changed")
+        _write(os.path.join(self.root, "d/8"))
+        new_result = self._scan()
+        expected = list(
+            _merge(
+                old_result.iter_sorted_items(),
+                new_result.iter_sorted_items(),
+                False,
+            )
+        )
+        self.assertEqual(len(expected), 5)
+        for old_state, new_state in [
+            (old_result, new_result),
+            (
+                self._save_and_load(old_result, "old.scan"),
+                self._save_and_load(new_result, "new.scan"),
+            ),
+        ]:
+            self.assertEqual(
+                sorted(diff_scans(old_state, new_state)),
+                sorted(expected),
+            )
+            self.assertNotIn(
+                os.path.join(self.root, "a"),
+                list(iter_changed_directories(old_state, new_state)),
+            )
+
+    def test_root_not_own_subdirectory(self):
+        """Tests whether roots given with a trailing separator and "/"
+        are not listed as their own subdirectory"""
+        collector = FlatCollector([self.root + "/"], log_level="WARNING")
+        collector.collect_files()
+        old_result = collector.get_file_stats()
+        os.remove(os.path.join(self.root, "a/b/3"))
+        collector = FlatCollector([self.root + "/"], log_level="WARNING")
+        collector.collect_files()
+        new_result = collector.get_file_stats()
+        info = {"size": 1, "modified_date": 1.0, "created_date": 1.0, "user_id": 1}
+        directories = {"/": {"modified_date": 1.0}, "/x": {"modified_date": 1.0}}
+        old_top = CollectionResult(
+            {"/a": info, "/x/b": info},
+            ["/"],
+            datetime.now(),
+            directories=compute_aggregates({"/a": info, "/x/b": info}, directories),
+        )
+        new_top = CollectionResult(
+            {"/a": info},
+            ["/"],
+            datetime.now(),
+            directories=compute_aggregates({"/a": info}, directories),
+        )
+        for old_state, new_state, root, missing in [
+            (old_result, new_result, self.root + "/", os.path.join(self.root, "a/b/3")),
+            (
+                self._save_and_load(old_result, "old.scan"),
+                self._save_and_load(new_result, "new.scan"),
+                self.root + "/",
+                os.path.join(self.root, "a/b/3"),
+            ),
+            (old_top, new_top, "/", "/x/b"),
+            (
+                self._save_and_load(old_top, "old_top.scan"),
+                self._save_and_load(new_top, "new_top.scan"),
+                "/",
+                "/x/b",
+            ),
+        ]:
+            self.assertNotIn(
+                root, [path for path, _ in old_state.iter_subdirectories(root)]
+            )
+            self.assertEqual(
+                [change.path for change in diff_scans(old_state, new_state)], [missing]
+            )
+
+
+if __name__ == "__main__":
+    res = unittest.main(verbosity=3, exit=False)
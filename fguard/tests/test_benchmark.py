@@ -0,0 +1,73 @@
+"""Tests for the benchmark suite"""
+import sys
+import subprocess
+import unittest
+from fguard.benchmark import (
+    synthetic_result,
+    remove_files,
+    run_benchmarks,
+    LAZY_MODULES,
+)
+from fguard.registry import ACTIONMAP, TRIGGERMAP
+from fguard.actions import StdOutAction
+from fguard.triggers import FilesMissingTrigger
+
+
+class TestBenchmark(unittest.TestCase):
+    """Test suite for synthetic scans and benchmarks"""
+
+    def test_synthetic_layout(self):
+        """Tests whether synthetic paths follow the experiment layout"""
+        result = synthetic_result(1000, files_per_experiment=100, depth=2, fan_out=3)
+        self.assertEqual(len(result.get_result()), 1000)
+        self.assertEqual(len(result.get_experiments()), 10)
+        self.assertEqual(
+            set(result.get_experiment_index().get_file_counts().values()), {100}
+        )
+
+    def test_files_removed(self):
+        """Tests whether files and whole experiments are removed"""
+        result = synthetic_result(1000)
+        newer = remove_files(result, missing_ratio=0.1, missing_experiments=2)
+        self.assertEqual(len(newer.get_experiments()), 8)
+        self.assertLess(len(newer.get_result()), 800)
+        self.assertGreater(newer.get_date(), result.get_date())
+        modified = remove_files(result, missing_ratio=0, modified_ratio=0.5)
+        self.assertEqual(len(modified.get_result()), 900)
+        changed = sum(
+            file_info["size"] != result.get_result()[path]["size"]
+            for path, file_info in modified.get_result().items()
+        )
+        self.assertGreater(changed, 300)
+        self.assertLess(changed, 600)
+
+    def test_benchmarks_run(self):
+        """Tests whether all benchmarks run at a small scale"""
+        measurements = run_benchmarks(200, scan_files=50, workers=(1, 2), memory=False)
+        names = [measurement["name"] for measurement in measurements]
+        self.assertIn("load[mmap]", names)
+        self.assertIn("check all[mmap]", names)
+        for check_name in ["bytes_lost", "bytes_added", "files_shrunk"]:
+            self.assertIn(f"check {check_name}[mmap]", names)
+        self.assertIn("startup", names)
+
+    def test_startup_lazy(self):
+        """Tests whether the command line interface defers heavy imports"""
+        loaded = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import sys, fguard.cli; print(' '.join(sys.modules))",
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.split()
+        self.assertEqual([module for module in LAZY_MODULES if module in loaded], [])
+        self.assertIs(TRIGGERMAP["files_missing"], FilesMissingTrigger)
+        self.assertIs(ACTIONMAP["stdout"], StdOutAction)
+        self.assertIn("files_shrunk", list(TRIGGERMAP))
+
+
+if __name__ == "__main__":
+    res = unittest.main(verbosity=3, exit=False)
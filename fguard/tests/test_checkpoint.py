@@ -0,0 +1,132 @@
+"""Tests for checkpointed scans"""
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from fguard.checkpoint import MergedRuns
+from fguard.colllectors import FlatCollector
+from fguard.rules import ScanRules
+
+
+class Interrupted(Exception):
+    pass
+
+
+class InterruptedCollector(FlatCollector):
+    """Collector that fails after listing a number of directories"""
+
+    def __init__(self, *args, listings=3, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.listings = listings
+
+    def _scan(self, dirpath, root):
+        if self.listings == 0:
+            raise Interrupted(dirpath)
+        self.listings -= 1
+        return super()._scan(dirpath, root)
+
+
+class TestCheckpoints(unittest.TestCase):
+    """Test suite for scans streamed to checkpoints"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.directory.name, "root")
+        self.checkpoint_directory = os.path.join(self.directory.name, "checkpoint")
+        for directory in ["a", "a/b", "a/b/c", "d", "e/f"]:
+            for number in range(3):
+                file_path = os.path.join(self.root, directory, f"{number}.txt")
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                with open(file_path, "w") as f:
+                    f.write(directory * number)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _scan(self, collector_class=FlatCollector, **options):
+        collector = collector_class([self.root], log_level="WARNING", **options)
+        collector.collect_files()
+        return collector
+
+    def _assert_equal(self, result, expected):
+        self.assertEqual(
+            [(file, dict(info)) for file, info in result.iter_sorted_items()],
+            [(file, dict(info)) for file, info in expected.iter_sorted_items()],
+        )
+        self.assertEqual(
+            {path: dict(info) for path, info in result.get_directories().items()},
+            expected.get_directories(),
+        )
+
+    def test_chunked_scan_complete(self):
+        """Tests whether scans streamed to runs equal scans kept in memory"""
+        expected = self._scan().get_file_stats()
+        for workers in [1, 4]:
+            # files are counted while the runs are merged for the aggregates
+            with patch.object(MergedRuns, "__iter__", side_effect=AssertionError):
+                collector = self._scan(
+                    checkpoint_directory=self.checkpoint_directory,
+                    chunk_size=4,
+                    workers=workers,
+                    checksum=True,
+                )
+                result = collector.get_file_stats()
+                self.assertEqual(len(result.get_result()), 15)
+            self.assertGreater(len(os.listdir(self.checkpoint_directory)), 2)
+            self._assert_equal(
+                result, self._scan(workers=workers, checksum=True).get_file_stats()
+            )
+            self.assertEqual(
+                result.get_directories()[self.root]["fingerprint"],
+                self._scan(checksum=True)
+                .get_file_stats()
+                .get_directories()[self.root]["fingerprint"],
+            )
+            collector.save(self.directory.name)
+            collector.remove_checkpoint()
+            self.assertEqual(os.listdir(self.checkpoint_directory), [])
+        self.assertIn(os.path.join(self.root, "a", "b", "1.txt"), expected)
+
+    def test_interrupted_scan_resumed(self):
+        """Tests whether an interrupted scan continues from its checkpoint"""
+        expected = self._scan().get_file_stats()
+        for workers in [1, 4]:
+            with self.assertRaises(Interrupted):
+                self._scan(
+                    InterruptedCollector,
+                    checkpoint_directory=self.checkpoint_directory,
+                    chunk_size=1,
+                    workers=workers,
+                )
+            with self.assertRaises(ValueError):
+                self._scan(checkpoint_directory=self.checkpoint_directory)
+            with self.assertRaises(ValueError):
+                self._scan(
+                    checkpoint_directory=self.checkpoint_directory,
+                    resume=True,
+                    rules=ScanRules(exclude=["d"]),
+                )
+            # every run lists three directories before it is interrupted again
+            collector = None
+            resumed = 0
+            while collector is None and resumed < 10:
+                resumed += 1
+                try:
+                    collector = self._scan(
+                        InterruptedCollector,
+                        checkpoint_directory=self.checkpoint_directory,
+                        chunk_size=1,
+                        resume=True,
+                        workers=workers,
+                    )
+                except Interrupted:
+                    pass
+            self.assertIsNotNone(collector)
+            if workers == 1:
+                self.assertEqual(resumed, 2)
+            self._assert_equal(collector.get_file_stats(), expected)
+            collector.remove_checkpoint()
+
+
+if __name__ == "__main__":
+    res = unittest.main(verbosity=3, exit=False)
@@ -1,7 +1,8 @@
 """tests for the analyzer classes"""
 import unittest
 import os
-from fguard.colllectors import FlatCollector
+import tempfile
+from fguard.colllectors import CollectionResult, FlatCollector, compute_checksum
 
 
 class TestFlatCollector(unittest.TestCase):
@@ -50,6 +51,174 @@ class TestFlatCollector(unittest.TestCase):
         )
         self.assertEqual(set(result.get_result().keys()), expected_keys)
 
+    def test_parallel_walk_matches_serial_walk(self):
+        """Tests whether walking with multiple workers finds the same files"""
+        directory = os.path.dirname(os.path.abspath(__file__))
+        test_dirs = [
+            os.path.join(directory, "testfiles"),
+            os.path.join(directory, "testfiles2"),
+        ]
+        serial = FlatCollector(test_dirs)
+        serial.collect_files()
+        parallel = FlatCollector(test_dirs, workers=4)
+        parallel.collect_files()
+        self.assertEqual(
+            parallel.get_file_stats().get_result(), serial.get_file_stats().get_result()
+        )
+
+    def test_invalid_worker_number_rejected(self):
+        """Tests whether a worker number below one is rejected"""
+        directory = os.path.dirname(os.path.abspath(__file__))
+        test_dir = os.path.join(directory, "testfiles")
+        badcall = lambda: FlatCollector([test_dir], workers=0)
+        self.assertRaises(ValueError, badcall)
+
+
+class TestIncrementalCollection(unittest.TestCase):
+    """Testsuite for incremental scans"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = self.directory.name
+        os.makedirs(os.path.join(self.root, "a", "b"))
+        os.makedirs(os.path.join(self.root, "c"))
+        for name in ["a/1.txt", "a/b/2.txt", "c/3.txt"]:
+            with open(os.path.join(self.root, name), "w") as f:
+                f.write(name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _collect(self, previous=None):
+        collector = FlatCollector(
+            [self.root], previous=previous, incremental=previous is not None
+        )
+        collector.collect_files()
+        return collector.get_file_stats()
+
+    def test_directories_recorded(self):
+        """Tests whether modification dates of walked directories are recorded"""
+        result = self._collect()
+        self.assertEqual(
+            set(result.get_directories().keys()),
+            {
+                self.root,
+                os.path.join(self.root, "a"),
+                os.path.join(self.root, "a", "b"),
+                os.path.join(self.root, "c"),
+            },
+        )
+
+    def test_unchanged_directories_copied(self):
+        """Tests whether entries of unchanged directories are taken from the previous scan"""
+        previous = self._collect()
+        filename = os.path.join(self.root, "a", "b", "2.txt")
+        # collected files are read-only, so the previous scan is edited as a dict
+        previous.result = dict(previous.get_result())
+        previous.get_result()[filename] = dict(
+            previous.get_result()[filename], user_id=-1
+        )
+        result = self._collect(previous)
+        self.assertEqual(result.get_result()[filename]["user_id"], -1)
+
+    def test_changed_directories_rescanned(self):
+        """Tests whether incremental scans equal full scans after changes"""
+        previous = self._collect()
+        with open(os.path.join(self.root, "a", "b", "4.txt"), "w") as f:
+            f.write("new")
+        os.remove(os.path.join(self.root, "c", "3.txt"))
+        os.makedirs(os.path.join(self.root, "c", "d"))
+        # make modification dates differ on filesystems with coarse timestamps
+        for directory in ["a/b", "c"]:
+            path = os.path.join(self.root, directory)
+            os.utime(path, (0, os.stat(path).st_mtime + 10))
+        incremental = self._collect(previous)
+        full = self._collect()
+        self.assertEqual(incremental.get_result(), full.get_result())
+        self.assertEqual(incremental.get_directories(), full.get_directories())
+        self.assertIn(os.path.join(self.root, "a", "b", "4.txt"), incremental)
+
+
+class TestChecksumCollection(unittest.TestCase):
+    """Testsuite for content checksums"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = self.directory.name
+        self.filename = os.path.join(self.root, "1.txt")
+        with open(self.filename, "w") as f:
+            f.write("content")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _collect(self, previous=None):
+        collector = FlatCollector([self.root], previous=previous, checksum=True)
+        collector.collect_files()
+        return collector.get_file_stats()
+
+    def test_checksums_computed(self):
+        """Tests whether checksums of file contents are collected"""
+        result = self._collect()
+        self.assertEqual(
+            result.get_result()[self.filename]["checksum"],
+            compute_checksum(self.filename),
+        )
+        self.assertEqual(len(result.get_result()[self.filename]["checksum"]), 16)
+
+    def test_checksums_of_unchanged_files_reused(self):
+        """Tests whether checksums are reused if statistics did not change"""
+        previous = self._collect()
+        previous.result = dict(previous.get_result())
+        previous.get_result()[self.filename]["checksum"] = bytes(range(16))
+        result = self._collect(previous)
+        self.assertEqual(
+            result.get_result()[self.filename]["checksum"], bytes(range(16))
+        )
+
+    def test_checksums_of_changed_files_computed(self):
+        """Tests whether checksums are computed if statistics changed"""
+        previous = self._collect()
+        previous.result = dict(previous.get_result())
+        previous.get_result()[self.filename]["checksum"] = bytes(range(16))
+        previous.get_result()[self.filename]["size"] += 1
+        result = self._collect(previous)
+        self.assertEqual(
+            result.get_result()[self.filename]["checksum"],
+            compute_checksum(self.filename),
+        )
+
+    def test_overwritten_files_rehashed_incrementally(self):
+        """Tests whether incremental scans rehash files that were overwritten
+        in place, which does not change the modification date of their directory"""
+        previous = self._collect()
+        directory_date = os.stat(self.root).st_mtime
+        with open(self.filename, "w") as f:
+            f.write("changed content")
+        os.utime(self.root, (directory_date, directory_date))
+        collector = FlatCollector(
+            [self.root], previous=previous, incremental=True, checksum=True
+        )
+        collector.collect_files()
+        result = collector.get_file_stats()
+        self.assertEqual(collector.metrics.directories_reused, 1)
+        self.assertEqual(
+            result.get_result()[self.filename]["checksum"],
+            compute_checksum(self.filename),
+        )
+        self.assertNotEqual(
+            result.get_result()[self.filename]["checksum"],
+            previous.get_result()[self.filename]["checksum"],
+        )
+
+    def test_checksums_stored_in_scan(self):
+        """Tests whether checksums are written to scan files"""
+        result = self._collect()
+        file_path = os.path.join(self.root, "test.scan")
+        result.to_file(file_path)
+        loaded = CollectionResult.from_file(file_path)
+        self.assertEqual(dict(loaded.get_result()), result.get_result())
+
 
 if __name__ == "__main__":
     res = unittest.main(verbosity=3, exit=False)
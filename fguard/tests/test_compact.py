@@ -0,0 +1,112 @@
+"""Tests for the compact in-memory representation of files"""
+import gc
+import unittest
+import tracemalloc
+from fguard.compact import CompactFiles
+
+
+def _info(number):
+    return {
+        "size": number,
+        "modified_date": float(number),
+        "created_date": float(number),
+        "user_id": 1000,
+    }
+
+
+class TestCompactFiles(unittest.TestCase):
+    """Test suite for compact files"""
+
+    def setUp(self):
+        paths = [
+            "/1",
+            "/a/b.txt",
+            "/a/b/c",
+            "/a/b0",
+            "/a/b/d/e",
+            "/a/b-c/f",
+            "/a/é",
+            "/z/y",
+        ]
+        self.files = {path: _info(number) for number, path in enumerate(paths)}
+
+    def test_mapping(self):
+        """Tests whether lookups return the statistics of contained files"""
+        compact_files = CompactFiles.from_mapping(self.files)
+        self.assertEqual(len(compact_files), len(self.files))
+        self.assertEqual(dict(compact_files), self.files)
+        self.assertIn("/a/b0", compact_files)
+        self.assertNotIn("/a/b", compact_files)
+        self.assertNotIn("/a/b1", compact_files)
+        self.assertNotIn("b0", compact_files)
+        self.assertEqual(
+            list(compact_files.iter_directory("/a/")),
+            [(path, self.files[path]) for path in ["/a/b.txt", "/a/b0", "/a/é"]],
+        )
+
+    def test_items_sorted(self):
+        """Tests whether items are yielded sorted by path"""
+        compact_files = CompactFiles.from_mapping(self.files)
+        self.assertEqual(list(compact_files.iter_items()), sorted(self.files.items()))
+
+    def test_built_from_sorted_items(self):
+        """Tests whether compact files are built from a stream of sorted items"""
+        compact_files = CompactFiles.from_sorted_items(iter(sorted(self.files.items())))
+        self.assertEqual(dict(compact_files), self.files)
+        self.assertEqual(list(compact_files.iter_items()), sorted(self.files.items()))
+        self.assertEqual(
+            [path for path, _ in compact_files.iter_directory("/a")],
+            ["/a/b.txt", "/a/b0", "/a/é"],
+        )
+
+    def test_checksums(self):
+        """Tests whether missing, empty and set checksums are kept apart"""
+        compact_files = CompactFiles()
+        compact_files.add_directory("/a", {"/a/1": _info(1)})
+        compact_files.add_directory(
+            "/b", {"/b/2": dict(_info(2), checksum=b"x" * 16), "/b/3": _info(3)}
+        )
+        compact_files.set_checksum("/a/1", None)
+        self.assertIsNone(compact_files["/a/1"]["checksum"])
+        self.assertEqual(compact_files["/b/2"]["checksum"], b"x" * 16)
+        self.assertNotIn("checksum", compact_files["/b/3"])
+        with self.assertRaises(ValueError):
+            compact_files.set_checksum("/b/3", b"x")
+
+    def test_invalid_directories_rejected(self):
+        """Tests whether directories can only be added once with their own files"""
+        compact_files = CompactFiles()
+        compact_files.add_directory("/a", {"/a/1": _info(1)})
+        with self.assertRaises(ValueError):
+            compact_files.add_directory("/a/", {})
+        with self.assertRaises(ValueError):
+            compact_files.add_directory("/b", {"/b/c/1": _info(1)})
+        with self.assertRaises(ValueError):
+            compact_files.add_directory("b", {"b/1": _info(1)})
+
+    def test_memory_reduced(self):
+        """Tests whether compact files need a fraction of the memory of dicts"""
+
+        def create_files():
+            return {
+                f"/groups/experiments/Experiments_{number // 10000:06d}"
+                f"/{number // 100:06d}/file_{number}.tif": _info(number)
+                for number in range(20000)
+            }
+
+        def measure(create):
+            gc.collect()
+            tracemalloc.start()
+            files = create()
+            size = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            del files
+            return size
+
+        dict_size = measure(create_files)
+        compact_size = measure(lambda: CompactFiles.from_mapping(create_files()))
+        self.assertLess(compact_size * 5, dict_size)
+
+
+if __name__ == "__main__":
+    res = unittest.main(verbosity=3, exit=False)
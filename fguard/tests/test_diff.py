@@ -0,0 +1,72 @@
+"""Tests for the streaming diff engine"""
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from fguard.colllectors import CollectionResult
+from fguard.diff import diff_scans, FileChange, MISSING, ADDED, MODIFIED, UNCHANGED
+
+
+class TestDiffScans(unittest.TestCase):
+    """Test suite for comparing two scans"""
+
+    def setUp(self):
+        old_files = {"/a": 1, "/b": 2, "/c": 3, "/e": 5}
+        new_files = {"/b": 2, "/c": 4, "/d": 4, "/f": 6}
+        self.old_result = CollectionResult(
+            old_files, directories_scanned=["/"], date=datetime.now()
+        )
+        self.new_result = CollectionResult(
+            new_files, directories_scanned=["/"], date=datetime.now()
+        )
+
+    def test_changes_found(self):
+        """Tests whether missing, added and modified files are found in order"""
+        changes = list(diff_scans(self.old_result, self.new_result))
+        self.assertEqual(
+            changes,
+            [
+                FileChange(MISSING, "/a", 1, None),
+                FileChange(MODIFIED, "/c", 3, 4),
+                FileChange(ADDED, "/d", None, 4),
+                FileChange(MISSING, "/e", 5, None),
+                FileChange(ADDED, "/f", None, 6),
+            ],
+        )
+
+    def test_unchanged_files_included(self):
+        """Tests whether unchanged files are reported on request"""
+        changes = list(
+            diff_scans(self.old_result, self.new_result, include_unchanged=True)
+        )
+        self.assertIn(FileChange(UNCHANGED, "/b", 2, 2), changes)
+        self.assertEqual(len(changes), 6)
+
+    def test_scan_files_compared(self):
+        """Tests whether scans loaded from files are compared like in-memory scans"""
+        info = {"size": 1, "modified_date": 1.0, "created_date": 1.0, "user_id": 1}
+        changed_info = dict(info, size=2)
+        old_result = CollectionResult(
+            {"/a/1": info, "/a/2": info, "/b/1": info},
+            directories_scanned=["/"],
+            date=datetime.now(),
+        )
+        new_result = CollectionResult(
+            {"/a/2": changed_info, "/b/1": info, "/b/2": info},
+            directories_scanned=["/"],
+            date=datetime.now(),
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            old_path = os.path.join(directory, "old.scan")
+            old_result.to_file(old_path)
+            changes = list(
+                diff_scans(CollectionResult.from_file(old_path), new_result)
+            )
+        self.assertEqual(
+            [(change.kind, change.path) for change in changes],
+            [(MISSING, "/a/1"), (MODIFIED, "/a/2"), (ADDED, "/b/2")],
+        )
+
+
+if __name__ == "__main__":
+    res = unittest.main(verbosity=3, exit=False)
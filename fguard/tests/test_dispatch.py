@@ -0,0 +1,122 @@
+"""Tests for dispatching messages to actions"""
+import os
+import time
+import tempfile
+import threading
+import unittest
+from datetime import datetime
+from unittest.mock import MagicMock
+from fguard.actions import BaseAction
+from fguard.colllectors import CollectionResult
+from fguard.dispatch import ActionDispatcher
+from fguard.triggers import FilesMissingTrigger, ExperimentsMissingTrigger, run_triggers
+
+
+def _message(subject, experiments):
+    return {
+        "title": subject,
+        "description": f"{subject}.",
+        "subject": subject,
+        "experiments": experiments,
+        "details": {"number": len(experiments)},
+    }
+
+
+class FailingAction(BaseAction):
+    """Action that fails a number of times before it succeeds"""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.messages = []
+
+    def perform(self, message):
+        if self.failures > 0:
+            self.failures -= 1
+            raise OSError("sendmail not reachable")
+        self.messages.append(message)
+
+
+class HangingAction(BaseAction):
+    """Action that blocks until it is released"""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def perform(self, message):
+        self.release.wait()
+
+
+class TestActionDispatcher(unittest.TestCase):
+    """Test suite for the action dispatcher"""
+
+    def test_messages_coalesced(self):
+        """Tests whether messages of several triggers are sent once per run"""
+        action = MagicMock()
+        dispatcher = ActionDispatcher([action])
+        new_result = CollectionResult(
+            {"/Experiments_004200/004211/a": 1}, ["/"], datetime.now()
+        )
+        old_result = CollectionResult(
+            {
+                "/Experiments_004200/004211/a": 1,
+                "/Experiments_004200/004211/b": 1,
+                "/Experiments_004200/004212/c": 1,
+            },
+            ["/"],
+            datetime.now(),
+        )
+        triggers = [
+            FilesMissingTrigger([dispatcher], number_threshold=0),
+            ExperimentsMissingTrigger([dispatcher]),
+        ]
+        run_triggers(triggers, old_result, new_result)
+        action.perform.assert_called_once()
+        message = action.perform.call_args[0][0]
+        self.assertEqual(
+            message["subject"], "Missing files detected; Missing experiments detected"
+        )
+        self.assertEqual(message["experiments"], ["004211", "004212"])
+        self.assertEqual(
+            message["details"]["Missing files detected: missing_file_number"], 2
+        )
+
+    def test_failed_actions_retried(self):
+        """Tests whether failing actions are retried"""
+        action = FailingAction(failures=2)
+        dispatcher = ActionDispatcher([action], retries=2, retry_delay=0)
+        dispatcher.perform(_message("Missing files detected", ["000001"]))
+        self.assertIsNotNone(dispatcher.flush())
+        self.assertEqual(len(action.messages), 1)
+
+    def test_hanging_action_abandoned(self):
+        """Tests whether a hanging action does not block other actions"""
+        hanging_action = HangingAction()
+        action = MagicMock()
+        dispatcher = ActionDispatcher([hanging_action, action], timeout=0.2)
+        dispatcher.perform(_message("Missing files detected", ["000001"]))
+        started = time.monotonic()
+        dispatcher.flush()
+        self.assertLess(time.monotonic() - started, 5)
+        action.perform.assert_called_once()
+        hanging_action.release.set()
+
+    def test_repeated_alerts_rate_limited(self):
+        """Tests whether alerts for the same experiments are
+        suppressed across runs while new experiments are sent"""
+        with tempfile.TemporaryDirectory() as directory:
+            state_file = os.path.join(directory, "alerts.json")
+            action = MagicMock()
+            for experiments in [["000001"], ["000001"], ["000001", "000002"]]:
+                dispatcher = ActionDispatcher(
+                    [action], rate_limit=3600, state_file=state_file
+                )
+                dispatcher.perform(_message("Missing files detected", experiments))
+                dispatcher.flush()
+        self.assertEqual(
+            [call[0][0]["experiments"] for call in action.perform.call_args_list],
+            [["000001"], ["000001", "000002"]],
+        )
+
+
+if __name__ == "__main__":
+    res = unittest.main(verbosity=3, exit=False)
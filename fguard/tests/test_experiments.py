@@ -0,0 +1,74 @@
+"""Tests for experiment number extraction"""
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from fguard.colllectors import CollectionResult
+from fguard.experiments import ExperimentIndex, get_experiment_number
+
+
+class TestExperimentNumbers(unittest.TestCase):
+    """Test suite for experiment numbers and the experiment index"""
+
+    def test_experiment_number_extracted(self):
+        """Tests whether experiment numbers are extracted from paths"""
+        self.assertEqual(
+            get_experiment_number(
+                "/groups/gerlich/experiments/Experiments_004200/004211/test3"
+            ),
+            "004211",
+        )
+        self.assertEqual(
+            get_experiment_number(
+                "/groups/gerlich/experiments/Experiments_004200/004211/a/b/test3"
+            ),
+            "004211",
+        )
+        self.assertIsNone(
+            get_experiment_number(
+                "/groups/gerlich/experiments/Experiments_0000/004211/test3"
+            )
+        )
+        self.assertIsNone(get_experiment_number("test1"))
+
+    def test_index_ranges(self):
+        """Tests whether files of experiments are mapped to row ranges"""
+        index = ExperimentIndex.from_files(
+            [
+                "/a/Experiments_004200/004211/1",
+                "/a/Experiments_004200/004211/2",
+                "/a/Experiments_004200/004212/1",
+                "/a/other",
+                "/b/Experiments_004200/004211/3",
+            ]
+        )
+        self.assertEqual(
+            index.ranges, {"004211": [[0, 2], [4, 5]], "004212": [[2, 3]]}
+        )
+        self.assertEqual(index.get_file_counts(), {"004211": 3, "004212": 1})
+
+    def test_index_stored_in_scan(self):
+        """Tests whether the experiment index is stored in scan files"""
+        info = {"size": 1, "modified_date": 1.0, "created_date": 1.0, "user_id": 1}
+        result = CollectionResult(
+            {
+                "/a/Experiments_004200/004212/1": info,
+                "/a/Experiments_004200/004211/1": info,
+                "/a/other": info,
+            },
+            directories_scanned=["/a"],
+            date=datetime.now(),
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, "test.scan")
+            result.to_file(file_path)
+            loaded = CollectionResult.from_file(file_path)
+        self.assertEqual(
+            loaded.get_experiment_index().ranges,
+            {"004211": [[0, 1]], "004212": [[1, 2]]},
+        )
+        self.assertEqual(set(loaded.get_experiments()), {"004211", "004212"})
+
+
+if __name__ == "__main__":
+    res = unittest.main(verbosity=3, exit=False)
@@ -0,0 +1,155 @@
+"""Tests for sharded scans and merging partial scans"""
+import os
+import itertools
+import tempfile
+import unittest
+from datetime import timedelta
+from fguard.checkpoint import MergedRuns
+from fguard.colllectors import CollectionResult, FlatCollector, get_shard
+from fguard.diff import diff_scans, MISSING
+from fguard.merge import merge_results
+
+
+def _write(file_path, content="x"):
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, "w") as f:
+        f.write(content)
+
+
+class TestMerge(unittest.TestCase):
+    """Test suite for sharded scans"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.directory.name, "root")
+        for path in ["a/1", "a/b/2", "c/3", "d/4", "e/f/5", "g/6", "7"]:
+            _write(os.path.join(self.root, path), "x" * len(path))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _scan(self, shard=None):
+        collector = FlatCollector([self.root], log_level="WARNING", shard=shard)
+        collector.collect_files()
+        return collector.get_file_stats()
+
+    def _scan_shards(self, count=3):
+        results = []
+        for index in range(count):
+            result = self._scan(shard=(index, count))
+            file_path = os.path.join(self.directory.name, result.get_filename())
+            result.to_file(file_path)
+            results.append(CollectionResult.from_file(file_path))
+        return results
+
+    def test_shards_partition_files(self):
+        """Tests whether every file is scanned in exactly one shard"""
+        results = self._scan_shards()
+        files = [file for result in results for file in result.get_files()]
+        self.assertEqual(sorted(files), sorted(self._scan().get_files()))
+        for index, result in enumerate(results):
+            self.assertTrue(result.is_partial())
+            self.assertTrue(result.get_filename().endswith(f"_shard{index}of3.part"))
+            for file in result.get_files():
+                top_level = os.path.join(
+                    self.root, os.path.relpath(file, self.root).split(os.sep)[0]
+                )
+                if os.path.dirname(file) != self.root:
+                    self.assertEqual(get_shard(top_level, 3), index)
+
+    def test_merge_equals_full_scan(self):
+        """Tests whether merged shards equal a scan of the whole tree"""
+        full_result = self._scan()
+        merged = merge_results(self._scan_shards())
+        self.assertFalse(merged.is_partial())
+        self.assertTrue(merged.get_filename().endswith(".scan"))
+        self.assertEqual([shard["index"] for shard in merged.get_shards()], [0, 1, 2])
+        self.assertEqual(
+            {file: dict(file_info) for file, file_info in merged.iter_sorted_items()},
+            {
+                file: dict(file_info)
+                for file, file_info in full_result.iter_sorted_items()
+            },
+        )
+        self.assertEqual(
+            merged.get_directories()[self.root]["fingerprint"],
+            full_result.get_directories()[self.root]["fingerprint"],
+        )
+        # files are streamed from the shards instead of being loaded
+        self.assertIsInstance(merged.get_result(), MergedRuns)
+        file_path = os.path.join(self.directory.name, merged.get_filename())
+        merged.to_file(file_path)
+        self.assertEqual(
+            [file for file, _ in CollectionResult.from_file(file_path).iter_sorted_items()],
+            sorted(full_result.get_files()),
+        )
+
+    def test_incomplete_shards_rejected(self):
+        """Tests whether missing and duplicate shards are rejected"""
+        results = self._scan_shards()
+        with self.assertRaises(ValueError):
+            merge_results(results[:2])
+        with self.assertRaises(ValueError):
+            merge_results(results + results[:1])
+        with self.assertRaises(ValueError):
+            merge_results([self._scan()])
+
+    def test_conflicts_rejected(self):
+        """Tests whether files scanned with different statistics are rejected"""
+        results = self._scan_shards()
+        # shards depend on the path of the temporary directory and may be empty
+        file, file_info = next(
+            itertools.chain(*(result.iter_sorted_items() for result in results[1:]))
+        )
+        files = dict(results[0].iter_sorted_items())
+        files[file] = dict(file_info, size=file_info["size"] + 1)
+        results[0] = CollectionResult(
+            files,
+            results[0].get_directories_scanned(),
+            results[0].get_date(),
+            shards=results[0].get_shards(),
+        )
+        with self.assertRaises(ValueError):
+            merge_results(results)
+
+    def test_partial_scans_compared(self):
+        """Tests whether changes between partial scans of a shard
+        that does not own the root directory are found"""
+        top_level = [
+            os.path.join(self.root, name)
+            for name in os.listdir(self.root)
+            if os.path.isdir(os.path.join(self.root, name))
+        ]
+        # shards depend on the path of the temporary directory
+        count, index = next(
+            (count, get_shard(directory, count))
+            for count in itertools.count(2)
+            for directory in top_level
+            if get_shard(directory, count) != get_shard(self.root, count)
+        )
+        old = self._scan(shard=(index, count))
+        removed = sorted(old.get_files())
+        for file in removed:
+            os.remove(file)
+        new = self._scan(shard=(index, count))
+        results = []
+        for name, result in [("old", old), ("new", new)]:
+            file_path = os.path.join(self.directory.name, name, result.get_filename())
+            os.makedirs(os.path.dirname(file_path))
+            result.to_file(file_path)
+            results.append(CollectionResult.from_file(file_path))
+        self.assertNotIn(self.root, results[0].get_directories())
+        changes = list(diff_scans(*results))
+        self.assertEqual([change.path for change in changes], removed)
+        self.assertEqual({change.kind for change in changes}, {MISSING})
+
+    def test_skew_rejected(self):
+        """Tests whether shards scanned too far apart are rejected"""
+        results = self._scan_shards()
+        results[0].date -= timedelta(days=1)
+        with self.assertRaises(ValueError):
+            merge_results(results)
+
+
+if __name__ == "__main__":
+    res = unittest.main(verbosity=3, exit=False)
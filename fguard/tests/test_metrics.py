@@ -0,0 +1,73 @@
+"""Tests for scan instrumentation"""
+import os
+import json
+import tempfile
+import unittest
+from fguard.colllectors import FlatCollector
+from fguard.metrics import Histogram, ScanMetrics
+
+
+class TestHistogram(unittest.TestCase):
+    """Test suite for histograms"""
+
+    def test_cumulative_counts(self):
+        """Tests whether bucket counts are cumulative"""
+        histogram = Histogram([1.0, 2.0])
+        histogram.observe_many([0.5, 1.0, 1.5, 3.0])
+        self.assertEqual(
+            histogram.cumulative(), [(1.0, 2), (2.0, 3), (float("inf"), 4)]
+        )
+        self.assertEqual(histogram.sum, 6.0)
+        self.assertEqual(histogram.count, 4)
+
+
+class TestScanMetrics(unittest.TestCase):
+    """Test suite for scan metrics"""
+
+    def setUp(self):
+        directory = os.path.dirname(os.path.abspath(__file__))
+        self.test_dirs = [
+            os.path.join(directory, "testfiles"),
+            os.path.join(directory, "testfiles2"),
+        ]
+
+    def test_scan_recorded(self):
+        """Tests whether files and directories of a scan are recorded"""
+        collector = FlatCollector(self.test_dirs, workers=2)
+        collector.collect_files()
+        metrics = collector.metrics
+        self.assertEqual(metrics.files, 6)
+        self.assertEqual(metrics.directories, 3)
+        self.assertEqual(metrics.stat_latency.count, 6)
+        self.assertEqual(metrics.roots[self.test_dirs[0]]["files"], 3)
+        self.assertEqual(metrics.roots[self.test_dirs[1]]["files"], 3)
+        self.assertEqual(len(metrics.get_slowest_directories()), 3)
+
+    def test_slowest_directories_bounded(self):
+        """Tests whether only the slowest directories are kept"""
+        metrics = ScanMetrics(slowest_number=2)
+        metrics.start()
+        for number in range(5):
+            metrics.record_directory("/", f"/{number}", float(number), 1, [])
+        self.assertEqual(
+            [entry["path"] for entry in metrics.get_slowest_directories()],
+            ["/4", "/3"],
+        )
+
+    def test_metrics_written(self):
+        """Tests whether metrics are written next to the scan file"""
+        collector = FlatCollector(self.test_dirs)
+        collector.collect_files()
+        with tempfile.TemporaryDirectory() as directory:
+            collector.save(directory, metrics_formats=["json", "prometheus"])
+            prefix = collector.get_file_stats().get_filename()[: -len(".scan")]
+            with open(os.path.join(directory, f"{prefix}.metrics.json")) as f:
+                self.assertEqual(json.load(f)["files"], 6)
+            with open(os.path.join(directory, f"{prefix}.prom")) as f:
+                lines = f.read().splitlines()
+        self.assertIn("fguard_scan_files 6", lines)
+        self.assertIn('fguard_scan_stat_latency_seconds_bucket{le="+Inf"} 6', lines)
+
+
+if __name__ == "__main__":
+    res = unittest.main(verbosity=3, exit=False)
@@ -0,0 +1,105 @@
+"""Tests for rules restricting scans"""
+import os
+import json
+import tempfile
+import unittest
+from unittest.mock import patch
+from fguard.colllectors import CollectionResult, FlatCollector
+from fguard.rules import ScanRules
+from fguard.triggers import FilesMissingTrigger
+
+
+class TestScanRules(unittest.TestCase):
+    """Test suite for scan rules"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.directory.name, "root")
+        for path in [
+            "a/1.tif",
+            "a/2.log",
+            "a/.snapshot/3.tif",
+            "a/b/4.tif",
+            "a/b/c/5.tif",
+            "scratch/6.tif",
+            "7.tif",
+        ]:
+            file_path = os.path.join(self.root, path)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            open(file_path, "w").close()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _scan(self, rules=None, **options):
+        collector = FlatCollector(
+            [self.root], log_level="WARNING", rules=rules, **options
+        )
+        collector.collect_files()
+        return collector.get_file_stats()
+
+    def _relative_files(self, result):
+        return sorted(os.path.relpath(file, self.root) for file in result.get_files())
+
+    def test_excluded_directories_pruned(self):
+        """Tests whether excluded directories are not walked"""
+        rules = ScanRules(exclude=[".snapshot", "*.log", f"re:^{self.root}/scratch$"])
+        collector = FlatCollector([self.root], log_level="WARNING", rules=rules)
+        with patch("os.scandir", wraps=os.scandir) as scandir_mock:
+            collector.collect_files()
+        result = collector.get_file_stats()
+        # excluded files are not stat'ed
+        self.assertEqual(collector.metrics.stat_latency.count, 4)
+        self.assertEqual(
+            self._relative_files(result),
+            ["7.tif", "a/1.tif", "a/b/4.tif", "a/b/c/5.tif"],
+        )
+        listed = [call[0][0] for call in scandir_mock.call_args_list]
+        self.assertNotIn(os.path.join(self.root, "a", ".snapshot"), listed)
+        self.assertNotIn(os.path.join(self.root, "scratch"), listed)
+
+    def test_includes_and_depth(self):
+        """Tests whether includes restrict files and the depth limits walking"""
+        rules = ScanRules(include=["*.tif"], max_depth=2)
+        result = self._scan(rules)
+        self.assertEqual(
+            self._relative_files(result),
+            ["7.tif", "a/.snapshot/3.tif", "a/1.tif", "a/b/4.tif", "scratch/6.tif"],
+        )
+        self.assertNotIn(
+            os.path.join(self.root, "a", "b", "c"), result.get_directories()
+        )
+
+    def test_other_filesystems_skipped(self):
+        """Tests whether directories on other devices are not descended into"""
+        rules = ScanRules(one_filesystem=True)
+        self.assertTrue(rules.descend(os.path.join(self.root, "a"), self.root, None))
+        self.assertFalse(rules.descend(os.path.join(self.root, "a"), self.root, -1))
+        self.assertEqual(len(self._scan(rules).get_files()), 7)
+
+    def test_rules_recorded(self):
+        """Tests whether rules are stored with the scan and compared by checks"""
+        rules_path = os.path.join(self.directory.name, "rules.json")
+        with open(rules_path, "w") as f:
+            json.dump({"exclude": ["scratch"], "max_depth": 3}, f)
+        result = self._scan(ScanRules.from_file(rules_path))
+        file_path = os.path.join(self.directory.name, "new.scan")
+        result.to_file(file_path)
+        loaded = CollectionResult.from_file(file_path)
+        self.assertEqual(loaded.get_rules(), {"exclude": ["scratch"], "max_depth": 3})
+        with self.assertRaises(ValueError):
+            FilesMissingTrigger([]).inspect(self._scan(), loaded)
+        with self.assertRaises(ValueError):
+            self._scan(previous=loaded, incremental=True)
+        self.assertEqual(
+            self._scan(
+                ScanRules.from_dict(loaded.get_rules()),
+                previous=loaded,
+                incremental=True,
+            ).get_rules(),
+            loaded.get_rules(),
+        )
+
+
+if __name__ == "__main__":
+    res = unittest.main(verbosity=3, exit=False)
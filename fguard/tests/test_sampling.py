@@ -0,0 +1,131 @@
+"""Tests for quick checks of sampled files"""
+import os
+import tempfile
+import unittest
+from collections import Counter
+from fguard.colllectors import CollectionResult, FlatCollector
+from fguard.sampling import (
+    SampledMissingCheck,
+    OTHER_FILES,
+    allocate,
+    estimate_ratio,
+    get_strata,
+)
+
+
+class TestSampling(unittest.TestCase):
+    """Test suite for stratified samples and their estimates"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.directory.name, "root")
+        experiments = os.path.join(self.root, "Experiments_004200")
+        self.files = []
+        for directory, number in [
+            (os.path.join(experiments, "004201", "a"), 30),
+            (os.path.join(experiments, "004202", "a"), 10),
+            (os.path.join(experiments, "004202", "b"), 20),
+            (os.path.join(self.root, "other"), 20),
+        ]:
+            os.makedirs(directory)
+            for index in range(number):
+                file_path = os.path.join(directory, f"{index:02d}.tif")
+                open(file_path, "w").close()
+                self.files.append(file_path)
+        collector = FlatCollector([self.root], log_level="WARNING")
+        collector.collect_files()
+        self.result = collector.get_file_stats()
+        self.scan_path = os.path.join(self.directory.name, "old.scan")
+        self.result.to_file(self.scan_path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_sample_stratified(self):
+        """Tests whether samples cover every stratum in proportion to its files"""
+        loaded = CollectionResult.from_file(self.scan_path, memory_map=True)
+        strata = get_strata(loaded)
+        self.assertEqual(strata[OTHER_FILES], [(60, 80)])
+        self.assertEqual(
+            allocate({"004201": 30, "004202": 30, OTHER_FILES: 20, "004203": 1}, 8),
+            {"004201": 3, "004202": 2, OTHER_FILES: 2, "004203": 1},
+        )
+        # many small strata do not raise the sample above its size
+        allocation = allocate({f"{number:06d}": 3 for number in range(100)}, 10)
+        self.assertEqual(sum(allocation.values()), 10)
+        self.assertEqual(sum(allocate({"004201": 30, "004202": 3}, 100).values()), 33)
+        check = SampledMissingCheck([], sample_size=16, seed=3)
+        sample = check.sample(loaded)
+        self.assertEqual(sample, check.sample(self.result))
+        self.assertEqual(
+            Counter(stratum for stratum, _ in sample),
+            {"004201": 6, "004202": 6, OTHER_FILES: 4},
+        )
+        # the files of 004202 are spread over both of its directories
+        self.assertEqual(
+            Counter(
+                os.path.basename(os.path.dirname(file))
+                for stratum, file in sample
+                if stratum == "004202"
+            ),
+            {"a": 2, "b": 4},
+        )
+        self.assertEqual(
+            [loaded.get_result().get_key(row) for row in range(80)], sorted(self.files)
+        )
+
+    def test_missing_estimated(self):
+        """Tests whether missing files are estimated within the bounds"""
+        loaded = CollectionResult.from_file(self.scan_path, memory_map=True)
+        self.assertEqual(SampledMissingCheck([], seed=0).inspect(loaded), {})
+        for file_path in self.files[:15]:
+            os.remove(file_path)
+        message = SampledMissingCheck([], sample_size=80, seed=0).inspect(loaded)
+        details = message["details"]
+        self.assertEqual(details["estimated_missing_ratio"], 15 / 80)
+        self.assertEqual(details["missing_ratio_lower_bound"], 15 / 80)
+        self.assertEqual(details["missing_sample_number"], 15)
+        self.assertEqual(details["unsampled_file_number"], 0)
+        self.assertEqual(message["experiments"], ["004201"])
+        for seed in range(5):
+            message = SampledMissingCheck([], sample_size=20, seed=seed).inspect(loaded)
+            details = message["details"]
+            self.assertLessEqual(details["missing_ratio_lower_bound"], 15 / 80)
+            self.assertGreaterEqual(details["missing_ratio_upper_bound"], 15 / 80)
+            # systematic samples of 7 of the 30 files hit 3 or 4 of the first 15
+            self.assertIn(details["experiments_affected"]["004201"], [3, 4])
+        self.assertEqual(
+            SampledMissingCheck([], ratio_threshold=0.5, seed=0).inspect(loaded), {}
+        )
+
+    def test_estimate_ratio(self):
+        """Tests the stratified estimate and its confidence bounds"""
+        ratio, lower, upper = estimate_ratio(
+            {"a": (1000, 100, 10), "b": (1000, 100, 0)}
+        )
+        self.assertAlmostEqual(ratio, 0.05)
+        self.assertLess(lower, 0.05)
+        self.assertGreater(upper, 0.05)
+        self.assertGreater(lower, 0.0)
+        wider = estimate_ratio({"a": (1000, 100, 10), "b": (1000, 100, 0)}, 0.99)
+        self.assertLess(wider[1], lower)
+        self.assertEqual(estimate_ratio({"a": (10, 10, 2)}), (0.2,) * 3)
+        # files of strata without checked files may all be missing or none of them
+        ratio, lower, upper = estimate_ratio({"a": (10, 10, 2), "b": (5, 0, 0)})
+        self.assertAlmostEqual(ratio, 0.2)
+        self.assertAlmostEqual(lower, 2 / 15)
+        self.assertAlmostEqual(upper, 7 / 15)
+        narrow = estimate_ratio({"a": (1000, 100, 10), "b": (1000, 100, 0)})
+        wide = estimate_ratio(
+            {"a": (1000, 100, 10), "b": (1000, 100, 0), "c": (1000, 0, 0)}
+        )
+        self.assertLess(wide[1], narrow[1])
+        self.assertGreater(wide[2], 1 / 3)
+        with self.assertRaises(ValueError):
+            estimate_ratio({"a": (10, 0, 0)})
+        with self.assertRaises(ValueError):
+            SampledMissingCheck([], confidence=1.0)
+
+
+if __name__ == "__main__":
+    res = unittest.main(verbosity=3, exit=False)
@@ -0,0 +1,161 @@
+"""Tests for the columnar scan file format"""
+import os
+import json
+import pickle
+import tempfile
+import unittest
+from datetime import datetime
+from fguard.colllectors import CollectionResult
+from fguard.scanfile import ScanTable, TRAILER, TRAILER_MAGIC, is_scan_file
+
+
+def _make_result(number_files=200):
+    files = {
+        f"/groups/gerlich/experiments/Experiments_004200/{number // 10:06d}/file_{number}.tif": {
+            "size": number * 1024,
+            "modified_date": 1600000000.5 + number,
+            "created_date": 1600000000.25 + number,
+            "user_id": 1000 + number % 3,
+        }
+        for number in range(number_files)
+    }
+    return CollectionResult(
+        files, directories_scanned=["/groups/gerlich"], date=datetime(2021, 3, 1, 12)
+    )
+
+
+def _edit_footer(file_path, edit):
+    """Rewrites the footer of a scan file, e.g. to mimic files of earlier versions"""
+    with open(file_path, "rb") as f:
+        buffer = f.read()
+    footer_length, _ = TRAILER.unpack_from(buffer, len(buffer) - TRAILER.size)
+    end = len(buffer) - TRAILER.size
+    footer = json.loads(buffer[end - footer_length : end])
+    edit(footer)
+    encoded = json.dumps(footer).encode("utf-8")
+    with open(file_path, "wb") as f:
+        f.write(buffer[: end - footer_length])
+        f.write(encoded)
+        f.write(TRAILER.pack(len(encoded), TRAILER_MAGIC))
+
+
+class TestScanFile(unittest.TestCase):
+    """Test suite for writing and reading scan files"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.directory.name, "test.scan")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_roundtrip(self):
+        """Tests whether a written scan is read back identically"""
+        result = _make_result()
+        result.to_file(self.file_path)
+        loaded = CollectionResult.from_file(self.file_path)
+        self.assertIsInstance(loaded.get_result(), ScanTable)
+        self.assertEqual(dict(loaded.get_result()), result.get_result())
+        self.assertEqual(loaded.get_date(), result.get_date())
+        self.assertEqual(loaded.get_directories_scanned(), ["/groups/gerlich"])
+
+    def test_memory_mapped_roundtrip(self):
+        """Tests whether a memory mapped scan is read back identically"""
+        result = _make_result()
+        result.to_file(self.file_path)
+        loaded = CollectionResult.from_file(self.file_path, memory_map=True)
+        self.assertEqual(dict(loaded.get_result()), result.get_result())
+        self.assertIn(next(iter(result.get_files())), loaded)
+        self.assertNotIn("/groups/gerlich/experiments/missing", loaded)
+
+    def test_memory_mapped_gzip_roundtrip(self):
+        """Tests whether compressed scans can be loaded with memory mapping"""
+        result = _make_result()
+        result.to_file(self.file_path, compression="gzip")
+        loaded = CollectionResult.from_file(self.file_path, memory_map=True)
+        self.assertEqual(dict(loaded.get_result()), result.get_result())
+
+    def test_gzip_roundtrip(self):
+        """Tests whether compressed scans are read back identically"""
+        result = _make_result()
+        result.to_file(self.file_path, compression="gzip")
+        loaded = CollectionResult.from_file(self.file_path)
+        self.assertEqual(dict(loaded.get_result()), result.get_result())
+
+    def test_files_sorted_and_contained(self):
+        """Tests iteration order and membership tests"""
+        result = _make_result()
+        result.to_file(self.file_path)
+        loaded = CollectionResult.from_file(self.file_path)
+        self.assertEqual(list(loaded.get_files()), sorted(result.get_files()))
+        for file in result.get_files():
+            self.assertIn(file, loaded)
+        self.assertNotIn("/groups/gerlich/experiments/missing", loaded)
+        self.assertNotIn("/", loaded)
+        self.assertNotIn("/zzz", loaded)
+
+    def test_empty_scan(self):
+        """Tests whether scans without files can be written"""
+        result = CollectionResult({}, directories_scanned=[], date=datetime.now())
+        result.to_file(self.file_path)
+        loaded = CollectionResult.from_file(self.file_path)
+        self.assertEqual(len(loaded.get_result()), 0)
+        self.assertNotIn("/test", loaded)
+
+    def test_pickled_scan_loaded(self):
+        """Tests whether scans in the old pickle format can still be loaded"""
+        result = _make_result(10)
+        # pickles of the original CollectionResult only hold these attributes
+        legacy = CollectionResult.__new__(CollectionResult)
+        legacy.__dict__.update(
+            result=dict(result.get_result()),
+            directories_scanned=result.get_directories_scanned(),
+            date=result.get_date(),
+        )
+        with open(self.file_path, "wb") as f:
+            pickle.dump(legacy, f)
+        self.assertFalse(is_scan_file(self.file_path))
+        loaded = CollectionResult.from_file(self.file_path)
+        self.assertEqual(loaded.get_result(), result.get_result())
+        self.assertEqual(loaded.get_directories(), {})
+        self.assertEqual(loaded.get_shards(), [])
+        self.assertEqual(loaded.get_rules(), {})
+        self.assertEqual(loaded.get_unreachable(), [])
+        self.assertFalse(loaded.has_aggregates())
+        self.assertEqual(loaded.get_experiments(), result.get_experiments())
+        self.assertEqual(list(loaded.iter_directory_files("/groups/gerlich")), [])
+        loaded.to_file(self.file_path)
+        self.assertEqual(
+            dict(CollectionResult.from_file(self.file_path).get_result()),
+            result.get_result(),
+        )
+
+    def test_scan_without_directories_loaded(self):
+        """Tests whether scan files written before directories
+        were recorded are loaded without aggregates"""
+        result = _make_result(10)
+        result.to_file(self.file_path)
+        _edit_footer(self.file_path, lambda footer: footer["tables"].pop("directories"))
+        loaded = CollectionResult.from_file(self.file_path)
+        self.assertEqual(dict(loaded.get_result()), result.get_result())
+        self.assertEqual(loaded.get_directories(), {})
+        self.assertFalse(loaded.has_aggregates())
+
+    def test_scan_without_experiments_loaded(self):
+        """Tests whether the experiment index of scan files written
+        before it was stored is built from the files"""
+        result = _make_result(30)
+        result.to_file(self.file_path)
+        _edit_footer(self.file_path, lambda footer: footer.pop("experiments"))
+        loaded = CollectionResult.from_file(self.file_path)
+        self.assertEqual(loaded.get_experiments(), result.get_experiments())
+
+    def test_unknown_compression_rejected(self):
+        """Tests whether unknown compressions are rejected"""
+        result = _make_result(10)
+        badcall = lambda: result.to_file(self.file_path, compression="lzma")
+        self.assertRaises(ValueError, badcall)
+
+
+if __name__ == "__main__":
+    res = unittest.main(verbosity=3, exit=False)
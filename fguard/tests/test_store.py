@@ -0,0 +1,288 @@
+"""Tests for the scan store"""
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from fguard.colllectors import CollectionResult
+from fguard.compact import CompactFiles
+from fguard.diff import (
+    diff_scans,
+    mark_not_scanned,
+    ADDED,
+    MISSING,
+    MODIFIED,
+    NOT_SCANNED,
+)
+from fguard.store import ScanStore
+
+
+def _info(size, checksum=None):
+    info = {
+        "size": size,
+        "modified_date": 1.0,
+        "created_date": 1.0,
+        "user_id": 1000,
+    }
+    if checksum is not None:
+        info["checksum"] = checksum
+    return info
+
+
+class TestScanStore(unittest.TestCase):
+    """Test suite for storing scans as deltas"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = ScanStore(
+            os.path.join(self.directory.name, "scans.db"), full_interval=3
+        )
+        self.start = datetime(2021, 3, 1)
+        self.results = [
+            CollectionResult(
+                {"/a": _info(1), "/b": _info(2, b"\x01" * 16)},
+                ["/"],
+                self.start,
+                directories={"/": {"modified_date": 1.0}},
+            ),
+            CollectionResult(
+                {"/b": _info(3, b"\x02" * 16), "/c": _info(4)},
+                ["/"],
+                self.start + timedelta(days=1),
+                directories={"/": {"modified_date": 2.0}},
+            ),
+            CollectionResult(
+                {"/b": _info(3, b"\x02" * 16), "/d": _info(5)},
+                ["/"],
+                self.start + timedelta(days=2),
+                directories={"/": {"modified_date": 3.0}},
+            ),
+            CollectionResult(
+                {"/d": _info(5)},
+                ["/"],
+                self.start + timedelta(days=3),
+                directories={"/": {"modified_date": 4.0}},
+            ),
+        ]
+        self.scan_ids = [self.store.add(result) for result in self.results]
+
+    def tearDown(self):
+        self.store.close()
+        self.directory.cleanup()
+
+    def assertSnapshot(self, scan_id, result):
+        snapshot = self.store.load(scan_id)
+        self.assertEqual(snapshot.get_result(), result.get_result())
+        self.assertEqual(snapshot.get_directories(), result.get_directories())
+        self.assertEqual(snapshot.get_date(), result.get_date())
+
+    def test_snapshots_rebuilt(self):
+        """Tests whether every stored scan is rebuilt from its deltas"""
+        for scan_id, result in zip(self.scan_ids, self.results):
+            self.assertSnapshot(scan_id, result)
+
+    def test_deltas_stored(self):
+        """Tests whether only changes are stored and full
+        scans are inserted every full_interval scans"""
+        scans = self.store.list_scans()
+        self.assertEqual(
+            [scan.base_id for scan in scans], [None] + self.scan_ids[:2] + [None]
+        )
+        rows = self.store.connection.execute(
+            "SELECT path FROM files WHERE scan_id = ? ORDER BY path",
+            (self.scan_ids[2],),
+        ).fetchall()
+        self.assertEqual(rows, [("/c",), ("/d",)])
+
+    def test_nested_snapshots_rebuilt(self):
+        """Tests whether snapshots of nested directories are rebuilt from
+        deltas read in path order, files of parents sorting around subtrees"""
+        date = self.results[-1].get_date()
+        paths = ["/x/a.txt", "/x/a/b", "/x/a/c/d", "/x/a0", "/x/é", "/y"]
+        results = [
+            CollectionResult(
+                {path: _info(size) for size, path in enumerate(paths[: 3 + day])},
+                ["/"],
+                date + timedelta(days=day + 1),
+            )
+            for day in range(3)
+        ]
+        for result in results:
+            scan_id = self.store.add(result)
+            snapshot = self.store.load(scan_id)
+            self.assertIsInstance(snapshot.get_result(), CompactFiles)
+            self.assertEqual(
+                list(snapshot.iter_sorted_items()), list(result.iter_sorted_items())
+            )
+        self.assertEqual(self.store.get_scan(scan_id).added, 1)
+
+    def test_checksums_stored(self):
+        """Tests whether files that gained or lost a checksum are stored as modified"""
+        date = self.results[-1].get_date()
+        hashed = CollectionResult(
+            {"/d": _info(5, b"\x03" * 16)},
+            ["/"],
+            date + timedelta(days=1),
+            directories={"/": {"modified_date": 4.0}},
+        )
+        hashed_id = self.store.add(hashed)
+        self.assertSnapshot(hashed_id, hashed)
+        self.assertEqual(self.store.get_scan(hashed_id).modified, 1)
+        plain_id = self.store.add(
+            CollectionResult({"/d": _info(5)}, ["/"], date + timedelta(days=2))
+        )
+        self.assertNotIn("checksum", self.store.load(plain_id).get_result()["/d"])
+        self.assertEqual(self.store.get_scan(plain_id).modified, 1)
+
+    def test_index_queries(self):
+        """Tests whether the latest scans and scans at a date are found"""
+        self.assertEqual(
+            [scan.scan_id for scan in self.store.latest(2)],
+            [self.scan_ids[3], self.scan_ids[2]],
+        )
+        self.assertEqual(
+            self.store.at(self.start + timedelta(days=1, hours=5)).scan_id,
+            self.scan_ids[1],
+        )
+        self.assertIsNone(self.store.at(self.start - timedelta(days=1)))
+
+    def test_retention(self):
+        """Tests whether removed scans are folded into their successors"""
+        removed = self.store.apply_retention(keep_last=2)
+        self.assertEqual(removed, self.scan_ids[:2])
+        self.assertEqual(
+            [scan.scan_id for scan in self.store.list_scans()], self.scan_ids[2:]
+        )
+        self.assertSnapshot(self.scan_ids[2], self.results[2])
+        self.assertSnapshot(self.scan_ids[3], self.results[3])
+        with self.assertRaises(ValueError):
+            self.store.load(self.scan_ids[0])
+
+    def test_remove_delta(self):
+        """Tests whether removing a delta keeps later snapshots intact"""
+        self.store.remove(self.scan_ids[1])
+        self.assertSnapshot(self.scan_ids[2], self.results[2])
+        self.assertEqual(
+            self.store.get_scan(self.scan_ids[2]).base_id, self.scan_ids[0]
+        )
+
+    def test_rules_stored(self):
+        """Tests whether the rules of a scan are kept, so incremental scans
+        and checks can compare them, and whether older stores get the column"""
+        rules = {"include": [], "exclude": ["scratch"], "max_depth": 2}
+        result = CollectionResult(
+            {"/d": _info(5)}, ["/"], self.start + timedelta(days=4), rules=rules
+        )
+        scan_id = self.store.add(result)
+        self.assertEqual(self.store.load(scan_id).get_rules(), rules)
+        self.assertEqual(self.store.load(self.scan_ids[0]).get_rules(), {})
+        file_path = os.path.join(self.directory.name, "old.db")
+        connection = sqlite3.connect(file_path)
+        connection.execute(
+            "CREATE TABLE scans (id INTEGER PRIMARY KEY, date TEXT NOT NULL,"
+            " directories_scanned TEXT NOT NULL, base_id INTEGER,"
+            " file_count INTEGER NOT NULL, added INTEGER, missing INTEGER,"
+            " modified INTEGER)"
+        )
+        connection.close()
+        with ScanStore(file_path) as store:
+            scan_id = store.add(result)
+            self.assertEqual(store.load(scan_id).get_rules(), rules)
+
+    def test_unreachable_stored(self):
+        """Tests whether directories that could not be listed are kept,
+        so their files are not reported as missing by checks on the store"""
+        old_result = CollectionResult(
+            {"/a/1": _info(1), "/b/2": _info(2)},
+            ["/"],
+            self.start + timedelta(days=4),
+        )
+        new_result = CollectionResult(
+            {"/b/2": _info(2)},
+            ["/"],
+            self.start + timedelta(days=5),
+            unreachable=["/a"],
+        )
+        self.store.add(old_result)
+        scan_id = self.store.add(new_result)
+        loaded = self.store.load(scan_id)
+        self.assertEqual(loaded.get_unreachable(), ["/a"])
+        self.assertEqual(self.store.load(self.scan_ids[0]).get_unreachable(), [])
+        changes = mark_not_scanned(
+            diff_scans(self.store.load(scan_id - 1), loaded),
+            self.store.load(scan_id - 1),
+            loaded,
+        )
+        self.assertEqual([change.kind for change in changes], [NOT_SCANNED])
+
+
+class TestHistory(unittest.TestCase):
+    """Test suite for the history of files and experiments"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = ScanStore(
+            os.path.join(self.directory.name, "scans.db"), full_interval=2
+        )
+        self.file = "/Experiments_000100/000123/a.tif"
+        other = "/Experiments_000100/000124/b.tif"
+        start = datetime(2021, 3, 1)
+        states = [
+            {self.file: _info(1), other: _info(5)},
+            {self.file: _info(2), other: _info(5)},
+            {other: _info(5)},
+            {other: _info(5)},
+            {self.file: _info(2), other: _info(5)},
+        ]
+        self.scan_ids = [
+            self.store.add(
+                CollectionResult(files, ["/"], start + timedelta(days=number))
+            )
+            for number, files in enumerate(states)
+        ]
+
+    def tearDown(self):
+        self.store.close()
+        self.directory.cleanup()
+
+    def test_file_history(self):
+        """Tests whether changes of a file are found across deltas and full scans"""
+        history = self.store.get_file_history(self.file)
+        self.assertEqual(history.first_seen.scan_id, self.scan_ids[0])
+        self.assertEqual(history.last_seen.scan_id, self.scan_ids[4])
+        self.assertEqual(
+            [(scan.scan_id, kind) for scan, kind, _ in history.events],
+            [
+                (self.scan_ids[0], ADDED),
+                (self.scan_ids[1], MODIFIED),
+                (self.scan_ids[2], MISSING),
+                (self.scan_ids[4], ADDED),
+            ],
+        )
+        self.assertEqual(history.events[1][2]["size"], 2)
+
+    def test_experiment_history(self):
+        """Tests whether file counts and sizes of experiments are recorded"""
+        history = self.store.get_experiment_history("000123")
+        self.assertEqual(
+            [(scan.scan_id, kind, state) for scan, kind, state in history.events],
+            [
+                (self.scan_ids[0], ADDED, (1, 1)),
+                (self.scan_ids[1], MODIFIED, (1, 2)),
+                (self.scan_ids[2], MISSING, None),
+                (self.scan_ids[4], ADDED, (1, 2)),
+            ],
+        )
+        self.assertIsNone(self.store.get_experiment_history("000999").first_seen)
+
+    def test_change_counts(self):
+        """Tests whether the changes of every scan are counted"""
+        scans = self.store.list_scans()
+        self.assertEqual(
+            [(scan.added, scan.missing, scan.modified) for scan in scans],
+            [(None, None, None), (0, 0, 1), (0, 1, 0), (0, 0, 0), (1, 0, 0)],
+        )
+
+
+if __name__ == "__main__":
+    res = unittest.main(verbosity=3, exit=False)
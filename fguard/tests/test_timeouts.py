@@ -0,0 +1,112 @@
+"""Tests for deadlines of directory listings"""
+import os
+import time
+import tempfile
+import threading
+import unittest
+from fguard.colllectors import CollectionResult, FlatCollector
+from fguard.diff import diff_scans, mark_not_scanned, NOT_SCANNED
+from fguard.triggers import ExperimentsMissingTrigger, FilesMissingTrigger
+
+
+class HangingCollector(FlatCollector):
+    """Collector whose listings of hung directories block until released"""
+
+    def __init__(self, *args, hung=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.hung = hung
+        self.released = threading.Event()
+
+    def _scan_directory(self, dirpath, root):
+        if dirpath in self.hung:
+            self.released.wait()
+        return super()._scan_directory(dirpath, root)
+
+
+class TestDirectoryTimeouts(unittest.TestCase):
+    """Test suite for listings that exceed their deadline"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.directory.name, "Experiments_004200")
+        for path in [
+            "004201/a/1.tif",
+            "004201/a/2.tif",
+            "004202/3.tif",
+            "004202/b/4.tif",
+            "5.txt",
+        ]:
+            file_path = os.path.join(self.root, path)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            open(file_path, "w").close()
+        self.hung = os.path.join(self.root, "004202")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _scan(self, hung=True, **options):
+        collector = HangingCollector(
+            [self.root], log_level="ERROR", hung=[self.hung] if hung else [], **options
+        )
+        try:
+            collector.collect_files()
+        finally:
+            collector.released.set()
+        return collector.get_file_stats()
+
+    def test_hung_directory_unreachable(self):
+        """Tests whether a hung listing is abandoned and its subtree recorded"""
+        for workers in [1, 4]:
+            started = time.monotonic()
+            result = self._scan(directory_timeout=0.2, workers=workers)
+            self.assertLess(time.monotonic() - started, 5)
+            self.assertEqual(result.get_unreachable(), [self.hung])
+            self.assertEqual(
+                sorted(os.path.relpath(file, self.root) for file in result.get_files()),
+                ["004201/a/1.tif", "004201/a/2.tif", "5.txt"],
+            )
+            self.assertNotIn(self.hung, result.get_directories())
+            self.assertTrue(result.is_unreachable(os.path.join(self.hung, "3.tif")))
+            self.assertFalse(result.is_unreachable(self.hung + "0/3.tif"))
+        file_path = os.path.join(self.directory.name, "new.scan")
+        result.to_file(file_path)
+        self.assertEqual(
+            CollectionResult.from_file(file_path).get_unreachable(), [self.hung]
+        )
+
+    def test_unreachable_rescanned_incrementally(self):
+        """Tests whether incremental scans descend into directories that
+        missed their deadline even if their parent did not change"""
+        full = self._scan(hung=False)
+        new = self._scan(directory_timeout=0.2, previous=full, incremental=True)
+        self.assertEqual(new.get_unreachable(), [self.hung])
+        newest = self._scan(hung=False, previous=new, incremental=True)
+        self.assertEqual(newest.get_unreachable(), [])
+        self.assertEqual(sorted(newest.get_files()), sorted(full.get_files()))
+        self.assertIn(self.hung, newest.get_directories())
+
+    def test_timeout_validated(self):
+        with self.assertRaises(ValueError):
+            FlatCollector([self.root], directory_timeout=0)
+
+    def test_not_scanned_not_missing(self):
+        """Tests whether triggers tell files that were not scanned apart from missing ones"""
+        old = self._scan(hung=False)
+        self.assertEqual(old.get_unreachable(), [])
+        new = self._scan(directory_timeout=0.2)
+        os.remove(os.path.join(self.root, "004201", "a", "1.tif"))
+        newest = self._scan(directory_timeout=0.2)
+        trigger = FilesMissingTrigger([], number_threshold=0)
+        self.assertEqual(trigger.inspect(old, new), {})
+        message = trigger.inspect(old, newest)
+        self.assertEqual(message["details"]["missing_file_number"], 1)
+        self.assertEqual(message["details"]["not_scanned_file_number"], 2)
+        self.assertEqual(message["details"]["unreachable_directories"], [self.hung])
+        self.assertEqual(ExperimentsMissingTrigger([]).inspect(old, new), {})
+        # files of a directory that was not scanned before are not added
+        changes = mark_not_scanned(diff_scans(new, old), new, old)
+        self.assertEqual({change.kind for change in changes}, {NOT_SCANNED})
+
+
+if __name__ == "__main__":
+    res = unittest.main(verbosity=3, exit=False)
@@ -1,10 +1,23 @@
 """Test triggers"""
 
+import os
+import gzip
+import tempfile
 import unittest
 from datetime import datetime
-from unittest.mock import MagicMock
-from fguard.triggers import FilesMissingTrigger, ExperimentsMissingTrigger
-from fguard.colllectors import CollectionResult
+from unittest.mock import MagicMock, patch
+from fguard.triggers import (
+    FilesMissingTrigger,
+    ExperimentsMissingTrigger,
+    FilesModifiedTrigger,
+    BytesLostTrigger,
+    BytesAddedTrigger,
+    FilesShrunkTrigger,
+    run_triggers,
+    diff_scans,
+)
+from fguard.colllectors import CollectionResult, FlatCollector
+from fguard.diff import get_partitions
 
 
 class TestFilesMissingTrigger(unittest.TestCase):
@@ -79,6 +92,56 @@ class TestFilesMissingTrigger(unittest.TestCase):
         message = trigger.inspect(old_result, new_result)
         self.assertEqual(message["details"]["experiments_affected"], {})
 
+    def test_summaries_bounded(self):
+        """Tests that only the top experiments and directories are listed"""
+        directory = "/groups/gerlich/experiments/Experiments_004200"
+        old_files = {
+            f"{directory}/{experiment:06d}/{number}": "asdf"
+            for experiment in range(4200, 4205)
+            for number in range(experiment - 4199)
+        }
+        new_result = CollectionResult(
+            {}, directories_scanned=["test"], date=datetime.now()
+        )
+        old_result = CollectionResult(
+            old_files, directories_scanned=["test"], date=datetime.now()
+        )
+        trigger = FilesMissingTrigger(
+            number_threshold=1, actions=[MagicMock()], top_number=2
+        )
+        message = trigger.inspect(old_result, new_result)
+        self.assertEqual(message["details"]["missing_file_number"], 15)
+        self.assertEqual(message["details"]["experiments_affected_number"], 5)
+        self.assertEqual(
+            message["details"]["experiments_affected"], {"004204": 5, "004203": 4}
+        )
+        self.assertEqual(
+            message["details"]["directories_affected"],
+            {f"{directory}/004204": 5, f"{directory}/004203": 4},
+        )
+
+    def test_missing_files_written(self):
+        """Tests that all missing files are streamed to a compressed file"""
+        new_result = CollectionResult(
+            {"test1": "asdf"}, directories_scanned=["test"], date=datetime.now()
+        )
+        old_result = CollectionResult(
+            {"test1": "asdf", "test2": "fdsa", "test3": "asdf"},
+            directories_scanned=["test"],
+            date=datetime.now(),
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            trigger = FilesMissingTrigger(
+                number_threshold=1, actions=[MagicMock()], output_directory=directory
+            )
+            message = trigger.inspect(old_result, new_result)
+            with gzip.open(message["details"]["missing_files_file"], "rt") as f:
+                self.assertEqual(f.read().splitlines(), ["test2", "test3"])
+            # no file is left behind if the trigger does not fire
+            trigger.number_threshold = 2
+            self.assertEqual(trigger.inspect(old_result, new_result), {})
+            self.assertEqual(os.listdir(directory), [])
+
 
 class TestExperimentsMissingTrigger(unittest.TestCase):
     """Test for experiments missing trigger"""
@@ -137,5 +200,257 @@ class TestExperimentsMissingTrigger(unittest.TestCase):
         self.assertEqual(message, {})
         perform_mock.assert_not_called()
 
+
+class TestFilesModifiedTrigger(unittest.TestCase):
+    """Test for files modified trigger"""
+
+    def test_content_changes_detected(self):
+        """Tests whether changed checksums are detected and silent changes reported"""
+        info = {
+            "size": 1,
+            "modified_date": 1.0,
+            "created_date": 1.0,
+            "user_id": 1,
+            "checksum": b"a" * 16,
+        }
+        old_files = {
+            "/groups/gerlich/experiments/Experiments_004200/004211/test1": info,
+            "/groups/gerlich/experiments/Experiments_004200/004211/test2": info,
+            "/groups/gerlich/experiments/Experiments_004200/004211/test3": info,
+        }
+        new_files = {
+            "/groups/gerlich/experiments/Experiments_004200/004211/test1": info,
+            "/groups/gerlich/experiments/Experiments_004200/004211/test2": dict(
+                info, checksum=b"b" * 16
+            ),
+            "/groups/gerlich/experiments/Experiments_004200/004211/test3": dict(
+                info, checksum=b"b" * 16, size=2, modified_date=2.0
+            ),
+        }
+        new_result = CollectionResult(
+            new_files, directories_scanned=["test"], date=datetime.now()
+        )
+        old_result = CollectionResult(
+            old_files, directories_scanned=["test"], date=datetime.now()
+        )
+        mock_action = MagicMock()
+        trigger = FilesModifiedTrigger(actions=[mock_action])
+        message = trigger.inspect(old_result, new_result)
+        self.assertEqual(message["details"]["modified_file_number"], 2)
+        self.assertEqual(
+            message["details"]["silently_modified_files"],
+            ["/groups/gerlich/experiments/Experiments_004200/004211/test2"],
+        )
+        self.assertEqual(message["details"]["experiments_affected"], {"004211": 2})
+        mock_action.perform.assert_called()
+
+    def test_not_triggered_without_checksums(self):
+        """Tests whether scans without checksums do not trigger"""
+        info = {"size": 1, "modified_date": 1.0, "created_date": 1.0, "user_id": 1}
+        old_result = CollectionResult(
+            {"/test1": info}, directories_scanned=["test"], date=datetime.now()
+        )
+        new_result = CollectionResult(
+            {"/test1": dict(info, size=2)},
+            directories_scanned=["test"],
+            date=datetime.now(),
+        )
+        mock_action = MagicMock()
+        trigger = FilesModifiedTrigger(actions=[mock_action])
+        self.assertEqual(trigger.inspect(old_result, new_result), {})
+        mock_action.perform.assert_not_called()
+
+
+def _info(size):
+    return {"size": size, "modified_date": 1.0, "created_date": 1.0, "user_id": 1}
+
+
+class TestBytesTriggers(unittest.TestCase):
+    """Test for triggers on the sizes of changed files"""
+
+    def setUp(self):
+        experiment = "/groups/gerlich/experiments/Experiments_004200/004211"
+        self.old_files = {
+            f"{experiment}/image.tif": _info(1000),
+            f"{experiment}/log.txt": _info(10),
+            "/groups/other/log.txt": _info(10),
+            "/groups/other/table.csv": _info(100),
+        }
+        self.new_files = {
+            f"{experiment}/log.txt": _info(20),
+            f"{experiment}/new.tif": _info(500),
+            "/groups/other/log.txt": _info(10),
+            "/groups/other/table.csv": dict(_info(40), modified_date=2.0),
+        }
+
+    def _inspect(self, trigger):
+        old_result = CollectionResult(
+            self.old_files, directories_scanned=["/groups/"], date=datetime(2024, 1, 1)
+        )
+        new_result = CollectionResult(
+            self.new_files, directories_scanned=["/groups/"], date=datetime(2024, 1, 2)
+        )
+        return trigger.inspect(old_result, new_result)
+
+    def test_bytes_lost(self):
+        """Tests whether the sizes of missing files are summed up"""
+        mock_action = MagicMock()
+        message = self._inspect(BytesLostTrigger([mock_action], bytes_threshold=999))
+        self.assertEqual(message["details"]["lost_bytes"], 1000)
+        self.assertEqual(message["details"]["experiments_affected"], {"004211": 1000})
+        mock_action.perform.assert_called()
+        self.assertEqual(
+            self._inspect(BytesLostTrigger([mock_action], bytes_threshold=1000)), {}
+        )
+
+    def test_bytes_added(self):
+        """Tests whether added files and grown files are counted per root"""
+        message = self._inspect(BytesAddedTrigger([MagicMock()], bytes_threshold=500))
+        self.assertEqual(message["details"]["added_bytes"], 510)
+        self.assertEqual(message["details"]["roots_affected"], {"/groups": 510})
+        self.assertEqual(message["details"]["experiments_affected"], {"004211": 510})
+        self.assertEqual(message["details"]["added_bytes_per_hour"], 21)
+        self.assertEqual(
+            self._inspect(BytesAddedTrigger([MagicMock()], bytes_threshold=510)), {}
+        )
+
+    def test_files_shrunk(self):
+        """Tests whether only files that lost more than the ratio are reported"""
+        message = self._inspect(FilesShrunkTrigger([MagicMock()], ratio_threshold=0.5))
+        self.assertEqual(message["details"]["shrunk_file_number"], 1)
+        self.assertEqual(
+            message["details"]["shrunk_files"], {"/groups/other/table.csv": 60}
+        )
+        self.assertEqual(message["details"]["modified_size_ratio"], 60 / 110)
+        self.assertEqual(
+            self._inspect(FilesShrunkTrigger([MagicMock()], ratio_threshold=0.7)), {}
+        )
+
+
+class TestRunTriggers(unittest.TestCase):
+    """Test for evaluating several triggers at once"""
+
+    def test_triggers_share_single_pass(self):
+        """Tests whether all triggers are evaluated in a single pass over the scans"""
+        new_files = {"test1": "asdf"}
+        old_files = {
+            "test1": "asdf",
+            "/groups/gerlich/experiments/Experiments_004200/004211/test3": "asdf",
+            "/groups/gerlich/experiments/Experiments_004200/004212/test4": "fdsa",
+        }
+        new_result = CollectionResult(
+            new_files, directories_scanned=["test"], date=datetime.now()
+        )
+        old_result = CollectionResult(
+            old_files, directories_scanned=["test"], date=datetime.now()
+        )
+        mock_action = MagicMock()
+        triggers = [
+            FilesMissingTrigger(number_threshold=1, actions=[mock_action]),
+            ExperimentsMissingTrigger(actions=[mock_action]),
+        ]
+        with patch("fguard.triggers.diff_scans", wraps=diff_scans) as diff_mock:
+            messages = run_triggers(triggers, old_result, new_result)
+        diff_mock.assert_called_once()
+        self.assertEqual(
+            messages[0]["details"]["experiments_affected"], {"004211": 1, "004212": 1}
+        )
+        self.assertEqual(
+            messages[1]["details"]["experiments_missing"], ["004211", "004212"]
+        )
+        self.assertEqual(mock_action.perform.call_count, 2)
+
+
+class TestParallelTriggers(unittest.TestCase):
+    """Test for evaluating triggers on partitions in worker processes"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.directory.name, "Experiments_004200")
+        paths = [
+            os.path.join(self.root, f"{4201 + number % 5:06d}", f"d{number % 3}")
+            + f"/{number}.tif"
+            for number in range(120)
+        ]
+        for path in paths:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write("x" * (len(path) % 7 + 10))
+        self.old_result = self._scan()
+        for number, path in enumerate(paths):
+            if number % 7 == 0:
+                os.remove(path)
+            elif number % 9 == 1:
+                with open(path, "w") as f:
+                    f.write("y")
+            elif number % 11 == 2:
+                # same size and modification date, different content
+                stat = os.stat(path)
+                with open(path, "r+") as f:
+                    f.write("z")
+                os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        for number in range(20):
+            with open(os.path.join(self.root, "004201", f"new{number}.tif"), "w") as f:
+                f.write("n" * number)
+        self.new_result = self._scan()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _scan(self):
+        collector = FlatCollector([self.root], log_level="WARNING", checksum=True)
+        collector.collect_files()
+        return collector.get_file_stats()
+
+    def _load(self, result, name):
+        file_path = os.path.join(self.directory.name, name)
+        result.to_file(file_path)
+        return CollectionResult.from_file(file_path, memory_map=True)
+
+    def _run(self, old_result, new_result, workers):
+        triggers = [
+            FilesMissingTrigger([], number_threshold=0, top_number=3),
+            ExperimentsMissingTrigger([]),
+            FilesModifiedTrigger([], top_number=3),
+            BytesLostTrigger([], bytes_threshold=0, top_number=3),
+            BytesAddedTrigger([], bytes_threshold=0, top_number=3),
+            FilesShrunkTrigger([], top_number=3),
+        ]
+        return run_triggers(triggers, old_result, new_result, workers=workers)
+
+    def test_partitions_equal_serial(self):
+        """Tests whether partitioned evaluation gives the messages of a serial one"""
+        old_loaded = self._load(self.old_result, "old.scan")
+        new_loaded = self._load(self.new_result, "new.scan")
+        unpruned_old = self._load(self.old_result, "old.scan")
+        unpruned_new = self._load(self.new_result, "new.scan")
+        # scans without aggregates are split into ranges of paths
+        unpruned_old.directories = {}
+        unpruned_new.directories = {}
+        for old_result, new_result, kind in [
+            (self.old_result, self.new_result, "directories"),
+            (old_loaded, new_loaded, "directories"),
+            (unpruned_old, unpruned_new, "range"),
+        ]:
+            partitions = get_partitions(old_result, new_result, 8)
+            self.assertGreater(len(partitions), 1)
+            self.assertEqual({partition[0] for partition in partitions}, {kind})
+            serial = self._run(old_result, new_result, 1)
+            self.assertTrue(all(serial[index] for index in [0, 2, 3, 4, 5]))
+            with patch("fguard.triggers.diff_scans", wraps=diff_scans) as diff_mock:
+                self.assertEqual(self._run(old_result, new_result, 3), serial)
+            diff_mock.assert_not_called()
+
+    def test_in_memory_scans_not_partitioned(self):
+        """Tests whether scans without aggregates and scan files are compared serially"""
+        self.old_result.directories = {}
+        self.new_result.directories = {}
+        self.assertIsNone(get_partitions(self.old_result, self.new_result, 8))
+        serial = self._run(self.old_result, self.new_result, 1)
+        with patch("fguard.triggers.diff_scans", wraps=diff_scans) as diff_mock:
+            self.assertEqual(self._run(self.old_result, self.new_result, 3), serial)
+        diff_mock.assert_called_once()
+
+
 if __name__ == "__main__":
     res = unittest.main(verbosity=3, exit=False)
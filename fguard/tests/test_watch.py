@@ -0,0 +1,129 @@
+"""Tests for the watcher"""
+import os
+import time
+import threading
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+from fguard.triggers import FilesMissingTrigger, ExperimentsMissingTrigger
+from fguard.watch import Watcher
+
+
+class TestWatcher(unittest.TestCase):
+    """Test suite for keeping a scan current"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.directory.name, "experiments")
+        self.experiment = os.path.join(self.root, "Experiments_004200", "004211")
+        os.makedirs(self.experiment)
+        self.files = []
+        for number in range(3):
+            filename = os.path.join(self.experiment, f"test{number}")
+            open(filename, "w").close()
+            self.files.append(filename)
+        self.action = MagicMock()
+        self.triggers = [
+            FilesMissingTrigger(actions=[self.action], number_threshold=1),
+            ExperimentsMissingTrigger(actions=[self.action]),
+        ]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _flush_events(self, watcher):
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            events = watcher.read_events(0.1)
+            if not events:
+                break
+            watcher.add_events(events)
+        return watcher.flush()
+
+    def test_initial_state(self):
+        """Tests whether the initial scan finds all files"""
+        watcher = Watcher([self.root], self.triggers, use_inotify=False)
+        watcher.start()
+        self.assertEqual(set(watcher.get_state().get_files()), set(self.files))
+        watcher.close()
+
+    def test_deletions_detected_from_events(self):
+        """Tests whether deleted files and experiments are reported from events"""
+        watcher = Watcher([self.root], self.triggers)
+        if watcher._inotify is None:
+            self.skipTest("inotify not available")
+        watcher.start()
+        for filename in self.files:
+            os.remove(filename)
+        os.rmdir(self.experiment)
+        messages = self._flush_events(watcher)
+        watcher.close()
+        self.assertEqual(messages[0]["details"]["missing_file_number"], 3)
+        self.assertEqual(messages[1]["details"]["experiments_missing"], ["004211"])
+        self.assertEqual(len(watcher.get_state().get_result()), 0)
+
+    def test_new_directories_watched(self):
+        """Tests whether files in newly created directories are picked up"""
+        watcher = Watcher([self.root], self.triggers)
+        if watcher._inotify is None:
+            self.skipTest("inotify not available")
+        watcher.start()
+        new_directory = os.path.join(self.root, "new")
+        os.makedirs(new_directory)
+        self._flush_events(watcher)
+        filename = os.path.join(new_directory, "file")
+        open(filename, "w").close()
+        messages = self._flush_events(watcher)
+        watcher.close()
+        self.assertIn(filename, watcher.get_state())
+        self.assertEqual(messages, [{}, {}])
+        self.action.perform.assert_not_called()
+
+    def test_reconcile_without_inotify(self):
+        """Tests whether periodic rescans detect deletions"""
+        watcher = Watcher([self.root], self.triggers, use_inotify=False)
+        watcher.start()
+        os.remove(self.files[0])
+        os.remove(self.files[1])
+        # make modification dates differ on filesystems with coarse timestamps
+        os.utime(self.experiment, (0, os.stat(self.experiment).st_mtime + 10))
+        messages = watcher.reconcile()
+        self.assertEqual(messages[0]["details"]["missing_file_number"], 2)
+        self.assertEqual(messages[1], {})
+        self.assertNotIn(self.files[0], watcher.get_state())
+
+    def test_checkpoint_written(self):
+        """Tests whether the state is written to a scan file"""
+        watcher = Watcher(
+            [self.root],
+            self.triggers,
+            output_directory=self.directory.name,
+            use_inotify=False,
+        )
+        watcher.start()
+        file_path = watcher.checkpoint()
+        self.assertTrue(file_path.endswith(".scan"))
+        self.assertTrue(os.path.exists(file_path))
+
+    def test_single_checkpoint_kept(self):
+        """Tests whether earlier checkpoints are removed when a new one is written"""
+        output_directory = os.path.join(self.directory.name, "checkpoints")
+        os.makedirs(output_directory)
+        watcher = Watcher(
+            [self.root],
+            self.triggers,
+            output_directory=output_directory,
+            checkpoint_interval=1.1,
+            use_inotify=False,
+        )
+        stop = threading.Event()
+        threading.Timer(2.5, stop.set).start()
+        watcher.run(stop)
+        watcher.close()
+        checkpoints = os.listdir(output_directory)
+        self.assertEqual(len(checkpoints), 1)
+        self.assertTrue(checkpoints[0].endswith(".scan"))
+
+
+if __name__ == "__main__":
+    res = unittest.main(verbosity=3, exit=False)
@@ -1,96 +1,328 @@
 """Classes for triggering actions"""
-import re
+import os
+import gzip
+import heapq
+import multiprocessing
 from abc import ABC, abstractmethod
-from typing import List, Set
+from collections import Counter
+from typing import List, Optional
 from fguard.actions import BaseAction
-from fguard.colllectors import CollectionResult
+from fguard.aggregates import normalize_directory
+from fguard.colllectors import CollectionResult, DATEFORMAT
+from fguard.diff import (
+    diff_scans,
+    diff_partition,
+    get_partitions,
+    mark_not_scanned,
+    FileChange,
+    ADDED,
+    MISSING,
+    MODIFIED,
+    NOT_SCANNED,
+)
+from fguard.experiments import EXPERIMENT_NUMBER, get_experiment_number
+from fguard.registry import TRIGGERMAP
 
-EXPERIMENT_NUMBER = r"Experiments_(\d{6})/(\d{6})/"
+# partitions per worker process, so workers that finish early take over more
+PARTITIONS_PER_WORKER = 4
+# triggers and scans of the parallel evaluation, inherited by forked workers
+_PARTITIONED = None
+
+
+def _combine(current, partial):
+    """Merges the partial state of a later partition into the current one.
+    Counts of dicts are added in the order of the partial state, so
+    dicts keep the order in which a serial pass would have filled them."""
+    if isinstance(current, dict):
+        for key, value in partial.items():
+            current[key] = current.get(key, 0) + value
+        return current
+    if isinstance(current, set):
+        return current | partial
+    # numbers and lists
+    return current + partial
 
 
 class BaseTrigger(ABC):
     """Base trigger class that defines
-    its interface"""
+    its interface. Triggers are fed the changes between two
+    scans one after another, so several triggers can share a single
+    pass over the scans (see run_triggers)."""
+
+    # whether observe should be called with the changes between the scans
+    needs_changes = True
+    # whether observe should also be called for unchanged files
+    include_unchanged = False
+    # attributes accumulated by observe, which reduce merges across partitions
+    partial_attributes = ()
+
+    def start(self, old_state: CollectionResult, new_state: CollectionResult):
+        """Prepares the trigger for a comparison of two scans"""
+        self.old_state = old_state
+        self.new_state = new_state
 
     @abstractmethod
-    def inspect(self, old_state: CollectionResult, new_state: CollectionResult):
+    def observe(self, change: FileChange, experiment_number: Optional[str]):
         pass
 
+    @abstractmethod
+    def finish(self) -> dict:
+        """Performs actions if the trigger fires and returns the message"""
+        pass
+
+    def can_partition(self) -> bool:
+        """Whether the changes can be observed in partitions by copies
+        of the trigger and reduced afterwards. Triggers that do not declare
+        the state they accumulate are evaluated in a single pass."""
+        return bool(self.partial_attributes)
+
+    def get_partial(self) -> dict:
+        """Returns the state accumulated by observe"""
+        return {name: getattr(self, name) for name in self.partial_attributes}
+
+    def reduce(self, partials: List[dict]):
+        """Merges the partial states of copies of the started trigger
+        that observed consecutive partitions of the changes, in order"""
+        for partial in partials:
+            for name in self.partial_attributes:
+                setattr(self, name, _combine(getattr(self, name), partial[name]))
+
+    def _perform_actions(self, message):
+        for action in self.actions:
+            action.perform(message)
+
+    def inspect(
+        self,
+        old_state: CollectionResult,
+        new_state: CollectionResult,
+        workers: int = 1,
+    ):
+        return run_triggers([self], old_state, new_state, workers)[0]
+
+
+def _observe(triggers, changes, old_state, new_state):
+    for change in mark_not_scanned(changes, old_state, new_state):
+        experiment_number = get_experiment_number(change.path)
+        for trigger in triggers:
+            trigger.observe(change, experiment_number)
+
+
+def _observe_partition(partition):
+    """Observes the changes of a partition in a worker process
+    and returns the partial states of the triggers"""
+    triggers, old_state, new_state, include_unchanged = _PARTITIONED
+    for trigger in triggers:
+        trigger.start(old_state, new_state)
+    changes = diff_partition(old_state, new_state, partition, include_unchanged)
+    _observe(triggers, changes, old_state, new_state)
+    return [trigger.get_partial() for trigger in triggers]
+
+
+def _observe_parallel(triggers, old_state, new_state, include_unchanged, workers):
+    """Observes the changes in partitions evaluated by forked worker
+    processes, which inherit the scans instead of receiving them, and
+    reduces the partial states in partition order. Returns False if the
+    changes cannot be partitioned."""
+    if "fork" not in multiprocessing.get_all_start_methods():
+        return False
+    if not all(trigger.can_partition() for trigger in triggers):
+        return False
+    partitions = get_partitions(
+        old_state, new_state, workers * PARTITIONS_PER_WORKER, include_unchanged
+    )
+    if partitions is None or len(partitions) < 2:
+        return False
+    global _PARTITIONED
+    _PARTITIONED = (triggers, old_state, new_state, include_unchanged)
+    try:
+        context = multiprocessing.get_context("fork")
+        with context.Pool(min(workers, len(partitions))) as pool:
+            partials = list(pool.imap(_observe_partition, partitions))
+    finally:
+        _PARTITIONED = None
+    for index, trigger in enumerate(triggers):
+        trigger.reduce([partial[index] for partial in partials])
+    return True
+
+
+def run_triggers(
+    triggers: List[BaseTrigger],
+    old_state: CollectionResult,
+    new_state: CollectionResult,
+    workers: int = 1,
+) -> List[dict]:
+    """Compares two scans in a single pass and feeds every change,
+    together with its experiment number, to all triggers. Files below
+    directories that could not be listed are fed as not scanned.
+    With several workers, partitions of the changes are observed in
+    worker processes and reduced, which gives the same messages."""
+    if old_state.get_rules() != new_state.get_rules():
+        raise ValueError(
+            f"Scans were taken with different rules {old_state.get_rules()} and "
+            f"{new_state.get_rules()}!"
+        )
+    for trigger in triggers:
+        trigger.start(old_state, new_state)
+    observers = [trigger for trigger in triggers if trigger.needs_changes]
+    if observers:
+        include_unchanged = any(trigger.include_unchanged for trigger in observers)
+        if workers <= 1 or not _observe_parallel(
+            observers, old_state, new_state, include_unchanged, workers
+        ):
+            changes = diff_scans(old_state, new_state, include_unchanged)
+            _observe(observers, changes, old_state, new_state)
+    messages = [trigger.finish() for trigger in triggers]
+    # actions shared by several triggers are flushed once
+    actions = {id(action): action for trigger in triggers for action in trigger.actions}
+    for action in actions.values():
+        action.flush()
+    return messages
+
+
+def _get_top(counts, top_number):
+    """Returns the top_number entries with the highest counts"""
+    return dict(heapq.nlargest(top_number, counts.items(), key=lambda item: item[1]))
+
 
 class FilesMissingTrigger(BaseTrigger):
     """Will trigger an actions when
-    more than a specified number of files are missing"""
+    more than a specified number of files are missing.
+    Files below directories that the new scan could not list are
+    counted as not scanned instead of missing. Messages only list
+    the top_number experiments and directories with the most missing
+    files. If an output_directory is given, all missing files are
+    streamed to a compressed file there instead of being kept."""
 
-    def __init__(self, actions: List[BaseAction], number_threshold: int = 100):
+    partial_attributes = (
+        "missing_files_number",
+        "not_scanned_files_number",
+        "experiments_affected",
+        "directories_affected",
+    )
+
+    def __init__(
+        self,
+        actions: List[BaseAction],
+        number_threshold: int = 100,
+        top_number: int = 10,
+        output_directory: Optional[str] = None,
+    ):
         self.number_threshold = number_threshold
+        self.top_number = top_number
+        self.output_directory = output_directory
         self.actions = actions
 
     def _construct_message(
-        self, missing_files_number, old_state, new_state, experiments_affected
+        self,
+        missing_files_number,
+        old_state,
+        new_state,
+        experiments_affected,
+        directories_affected,
+        missing_files_path,
     ):
-        return {
+        message = {
             "title": "Missing files detected!",
             "description": f"There where {missing_files_number} missing files detected between a scan performed at {new_state.get_date()} and {old_state.get_date()}. There were {len(experiments_affected.keys())} experiments affected.",
             "subject": "Missing files detected",
+            "experiments": sorted(experiments_affected),
             "details": {
                 "missing_file_number": missing_files_number,
-                "experiments_affected": experiments_affected,
+                "experiments_affected_number": len(experiments_affected),
+                "experiments_affected": _get_top(experiments_affected, self.top_number),
+                "directories_affected_number": len(directories_affected),
+                "directories_affected": _get_top(directories_affected, self.top_number),
                 "new_directories_scanned": new_state.get_directories_scanned(),
                 "old_directories_scanned": old_state.get_directories_scanned(),
                 "new_date[utc]": str(new_state.get_date()),
                 "old_date[utc": str(old_state.get_date()),
             },
         }
+        if missing_files_path is not None:
+            message["details"]["missing_files_file"] = missing_files_path
+        unreachable = new_state.get_unreachable()
+        if unreachable:
+            message["description"] += f" {self.not_scanned_files_number} files were not scanned, as {len(unreachable)} directories could not be listed."
+            details = message["details"]
+            details["not_scanned_file_number"] = self.not_scanned_files_number
+            details["unreachable_directories"] = unreachable[: self.top_number]
+        return message
+
+    def start(self, old_state: CollectionResult, new_state: CollectionResult):
+        super().start(old_state, new_state)
+        self.missing_files_number = 0
+        self.not_scanned_files_number = 0
+        self.experiments_affected = {}
+        self.directories_affected = Counter()
+        self.missing_files_path = None
+        self._missing_files_output = None
+        if self.output_directory is not None:
+            self.missing_files_path = os.path.join(
+                self.output_directory,
+                f"{new_state.get_date().strftime(DATEFORMAT)}_missing_files.txt.gz",
+            )
+            self._missing_files_output = gzip.open(self.missing_files_path, "wt")
+
+    def can_partition(self):
+        # missing files are streamed to a single file in the order they are found
+        return self.output_directory is None
 
-    def inspect(self, old_state: CollectionResult, new_state: CollectionResult):
-        missing_files_number = 0
-        missing_files = []
-        experiments_affected = {}
-        for file in old_state.get_files():
-            if file not in new_state:
-                missing_files_number += 1
-                missing_files.append(file)
-                matched_experiment = re.findall(EXPERIMENT_NUMBER, file)
-                if len(matched_experiment) > 0 and len(matched_experiment[0]) > 1:
-                    experiment_number = matched_experiment[0][1]
-                    if experiment_number in experiments_affected:
-                        experiments_affected[experiment_number] += 1
-                    else:
-                        experiments_affected[experiment_number] = 1
+    def observe(self, change: FileChange, experiment_number: Optional[str]):
+        if change.kind == NOT_SCANNED and change.new is None:
+            self.not_scanned_files_number += 1
+        if change.kind != MISSING:
+            return
+        self.missing_files_number += 1
+        self.directories_affected[os.path.dirname(change.path)] += 1
+        if self._missing_files_output is not None:
+            self._missing_files_output.write(f"{change.path}\n")
+        if experiment_number is not None:
+            if experiment_number in self.experiments_affected:
+                self.experiments_affected[experiment_number] += 1
+            else:
+                self.experiments_affected[experiment_number] = 1
+
+    def finish(self):
+        if self._missing_files_output is not None:
+            self._missing_files_output.close()
         # check whether actions should be performed
-        if missing_files_number > self.number_threshold:
+        if self.missing_files_number > self.number_threshold:
             message = self._construct_message(
-                missing_files_number,
-                old_state,
-                new_state,
-                experiments_affected,
+                self.missing_files_number,
+                self.old_state,
+                self.new_state,
+                self.experiments_affected,
+                self.directories_affected,
+                self.missing_files_path,
             )
-            for action in self.actions:
-                action.perform(message)
+            self._perform_actions(message)
             return message
+        if self.missing_files_path is not None:
+            os.remove(self.missing_files_path)
         return {}
 
+
 class ExperimentsMissingTrigger(BaseTrigger):
-    """Will trigger actions when an experiment is missing"""
+    """Will trigger actions when an experiment is missing.
+    Experiments are compared using the experiment index of the scans,
+    so no pass over the files is needed. Only if the new scan could not
+    list some directories, the changes are observed to tell experiments
+    that were not scanned apart from missing ones."""
+
+    needs_changes = False
+    partial_attributes = ("experiments_not_scanned",)
+
     def __init__(self, actions: List[BaseAction]):
         self.actions = actions
 
-    def _get_experiments(self, state: CollectionResult) -> Set[int]:
-        experiments = set()
-        for file in state.get_files():
-            matched_experiment = re.findall(EXPERIMENT_NUMBER, file)
-            if len(matched_experiment) > 0 and len(matched_experiment[0]) > 1:
-                experiment_number = matched_experiment[0][1]
-                experiments.add(experiment_number)
-        return experiments
-
     def _construct_message(
         self, missing_experiments, old_state, new_state
     ):
-        return {
+        message = {
             "title": "Missing experiments detected!",
             "description": f"There where {len(missing_experiments)} missing experiments detected between a scan performed at {new_state.get_date()} and {old_state.get_date()}.",
             "subject": "Missing experiments detected",
+            "experiments": missing_experiments,
             "details": {
                 "missing_experiment_number": len(missing_experiments),
                 "experiments_missing": missing_experiments,
@@ -100,26 +332,411 @@ class ExperimentsMissingTrigger(BaseTrigger):
                 "old_date[utc": str(old_state.get_date()),
             },
         }
+        if self.experiments_not_scanned:
+            message["details"]["experiments_not_scanned"] = sorted(
+                self.experiments_not_scanned
+            )
+        return message
+
+    def start(self, old_state: CollectionResult, new_state: CollectionResult):
+        super().start(old_state, new_state)
+        self.needs_changes = bool(new_state.get_unreachable())
+        self.experiments_not_scanned = set()
+
+    def observe(self, change: FileChange, experiment_number: Optional[str]):
+        if change.kind == NOT_SCANNED and experiment_number is not None:
+            self.experiments_not_scanned.add(experiment_number)
 
-    def inspect(self, old_state: CollectionResult, new_state: CollectionResult):
-        old_experiments = self._get_experiments(old_state)
-        new_experiments = self._get_experiments(new_state)
+    def finish(self):
         # go through experiments and check missing ones
-        missing_experiments = []
-        for experiment in old_experiments:
-            if experiment not in new_experiments:
-                missing_experiments.append(experiment)
+        old_experiments = set(self.old_state.get_experiments())
+        new_experiments = set(self.new_state.get_experiments())
+        missing_experiments = sorted(
+            old_experiments - new_experiments - self.experiments_not_scanned
+        )
         if len(missing_experiments) > 0:
             message = self._construct_message(
                 missing_experiments,
-                old_state,
-                new_state,
+                self.old_state,
+                self.new_state,
             )
-            for action in self.actions:
-                action.perform(message)
+            self._perform_actions(message)
             return message
         return {}
 
 
+class FilesModifiedTrigger(BaseTrigger):
+    """Will trigger actions when the content of more than
+    a specified number of files changed. Needs scans with checksums.
+    Content changes without a change in size and modification date
+    are reported separately as they point to silent corruption.
+    Messages list at most top_number of them and the top_number
+    experiments with the most modified files."""
+
+    partial_attributes = (
+        "modified_files_number",
+        "silently_modified_files_number",
+        "silently_modified_files",
+        "experiments_affected",
+    )
+
+    def __init__(
+        self,
+        actions: List[BaseAction],
+        number_threshold: int = 0,
+        top_number: int = 10,
+    ):
+        self.number_threshold = number_threshold
+        self.top_number = top_number
+        self.actions = actions
+
+    def _construct_message(
+        self,
+        modified_files_number,
+        silently_modified_files_number,
+        silently_modified_files,
+        old_state,
+        new_state,
+        experiments_affected,
+    ):
+        return {
+            "title": "Modified files detected!",
+            "description": f"There where {modified_files_number} files with changed content detected between a scan performed at {new_state.get_date()} and {old_state.get_date()}. {silently_modified_files_number} of them kept their size and modification date. There were {len(experiments_affected.keys())} experiments affected.",
+            "subject": "Modified files detected",
+            "experiments": sorted(experiments_affected),
+            "details": {
+                "modified_file_number": modified_files_number,
+                "silently_modified_file_number": silently_modified_files_number,
+                "silently_modified_files": silently_modified_files,
+                "experiments_affected_number": len(experiments_affected),
+                "experiments_affected": _get_top(experiments_affected, self.top_number),
+                "new_directories_scanned": new_state.get_directories_scanned(),
+                "old_directories_scanned": old_state.get_directories_scanned(),
+                "new_date[utc]": str(new_state.get_date()),
+                "old_date[utc": str(old_state.get_date()),
+            },
+        }
+
+    def start(self, old_state: CollectionResult, new_state: CollectionResult):
+        super().start(old_state, new_state)
+        self.modified_files_number = 0
+        self.silently_modified_files_number = 0
+        self.silently_modified_files = []
+        self.experiments_affected = {}
+
+    def observe(self, change: FileChange, experiment_number: Optional[str]):
+        if change.kind != MODIFIED:
+            return
+        old_checksum = change.old.get("checksum")
+        new_checksum = change.new.get("checksum")
+        if old_checksum is None or new_checksum is None or old_checksum == new_checksum:
+            return
+        self.modified_files_number += 1
+        if (
+            change.old["size"] == change.new["size"]
+            and change.old["modified_date"] == change.new["modified_date"]
+        ):
+            self.silently_modified_files_number += 1
+            if len(self.silently_modified_files) < self.top_number:
+                self.silently_modified_files.append(change.path)
+        if experiment_number is not None:
+            if experiment_number in self.experiments_affected:
+                self.experiments_affected[experiment_number] += 1
+            else:
+                self.experiments_affected[experiment_number] = 1
+
+    def reduce(self, partials: List[dict]):
+        super().reduce(partials)
+        # a serial pass keeps the first top_number files
+        del self.silently_modified_files[self.top_number :]
+
+    def finish(self):
+        if self.modified_files_number > self.number_threshold:
+            message = self._construct_message(
+                self.modified_files_number,
+                self.silently_modified_files_number,
+                self.silently_modified_files,
+                self.old_state,
+                self.new_state,
+                self.experiments_affected,
+            )
+            self._perform_actions(message)
+            return message
+        return {}
+
+
+def _format_bytes(number_bytes):
+    size = float(number_bytes)
+    for unit in ["B", "KiB", "MiB", "GiB"]:
+        if abs(size) < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TiB"
+
+
+def _get_root(path, roots):
+    """Returns the root directory a path lies in, roots sorted longest first"""
+    for root in roots:
+        if path.startswith(root.rstrip("/") + "/"):
+            return root
+    return None
 
-TRIGGERMAP = {"files_missing": FilesMissingTrigger}
+
+class BytesLostTrigger(BaseTrigger):
+    """Will trigger actions when the files that are missing
+    add up to more than a specified number of bytes. Messages list
+    the top_number experiments and directories that lost the most bytes."""
+
+    partial_attributes = (
+        "lost_bytes",
+        "missing_files_number",
+        "experiments_affected",
+        "directories_affected",
+    )
+
+    def __init__(
+        self,
+        actions: List[BaseAction],
+        bytes_threshold: int = 100 * 1024**3,
+        top_number: int = 10,
+    ):
+        self.bytes_threshold = bytes_threshold
+        self.top_number = top_number
+        self.actions = actions
+
+    def _construct_message(self, old_state, new_state):
+        return {
+            "title": "Lost bytes detected!",
+            "description": f"There where {self.missing_files_number} missing files with {_format_bytes(self.lost_bytes)} detected between a scan performed at {new_state.get_date()} and {old_state.get_date()}. There were {len(self.experiments_affected)} experiments affected.",
+            "subject": "Lost bytes detected",
+            "experiments": sorted(self.experiments_affected),
+            "details": {
+                "lost_bytes": self.lost_bytes,
+                "missing_file_number": self.missing_files_number,
+                "experiments_affected_number": len(self.experiments_affected),
+                "experiments_affected": _get_top(
+                    self.experiments_affected, self.top_number
+                ),
+                "directories_affected_number": len(self.directories_affected),
+                "directories_affected": _get_top(
+                    self.directories_affected, self.top_number
+                ),
+                "new_directories_scanned": new_state.get_directories_scanned(),
+                "old_directories_scanned": old_state.get_directories_scanned(),
+                "new_date[utc]": str(new_state.get_date()),
+                "old_date[utc": str(old_state.get_date()),
+            },
+        }
+
+    def start(self, old_state: CollectionResult, new_state: CollectionResult):
+        super().start(old_state, new_state)
+        self.lost_bytes = 0
+        self.missing_files_number = 0
+        self.experiments_affected = Counter()
+        self.directories_affected = Counter()
+
+    def observe(self, change: FileChange, experiment_number: Optional[str]):
+        if change.kind != MISSING:
+            return
+        size = change.old["size"]
+        self.lost_bytes += size
+        self.missing_files_number += 1
+        self.directories_affected[os.path.dirname(change.path)] += size
+        if experiment_number is not None:
+            self.experiments_affected[experiment_number] += size
+
+    def finish(self):
+        if self.lost_bytes > self.bytes_threshold:
+            message = self._construct_message(self.old_state, self.new_state)
+            self._perform_actions(message)
+            return message
+        return {}
+
+
+class BytesAddedTrigger(BaseTrigger):
+    """Will trigger actions when more than a specified number of
+    bytes were added to a root directory or an experiment, counting
+    new files and the growth of modified files. Catches runaway
+    writers before they fill up the filesystem."""
+
+    partial_attributes = ("added_bytes", "roots_added", "experiments_added")
+
+    def __init__(
+        self,
+        actions: List[BaseAction],
+        bytes_threshold: int = 1024**4,
+        top_number: int = 10,
+    ):
+        self.bytes_threshold = bytes_threshold
+        self.top_number = top_number
+        self.actions = actions
+
+    def _construct_message(self, old_state, new_state, roots, experiments):
+        hours = (new_state.get_date() - old_state.get_date()).total_seconds() / 3600
+        return {
+            "title": "Added bytes detected!",
+            "description": f"There were {_format_bytes(self.added_bytes)} added between a scan performed at {new_state.get_date()} and {old_state.get_date()}. {len(roots)} root directories and {len(experiments)} experiments grew by more than {_format_bytes(self.bytes_threshold)}.",
+            "subject": "Added bytes detected",
+            "experiments": sorted(experiments),
+            "details": {
+                "added_bytes": self.added_bytes,
+                "added_bytes_per_hour": (
+                    round(self.added_bytes / hours) if hours > 0 else None
+                ),
+                "roots_affected": roots,
+                "experiments_affected_number": len(experiments),
+                "experiments_affected": _get_top(experiments, self.top_number),
+                "new_directories_scanned": new_state.get_directories_scanned(),
+                "old_directories_scanned": old_state.get_directories_scanned(),
+                "new_date[utc]": str(new_state.get_date()),
+                "old_date[utc": str(old_state.get_date()),
+            },
+        }
+
+    def start(self, old_state: CollectionResult, new_state: CollectionResult):
+        super().start(old_state, new_state)
+        self.added_bytes = 0
+        self.roots_added = Counter()
+        self.experiments_added = Counter()
+        self._roots = sorted(
+            (
+                normalize_directory(directory)
+                for directory in new_state.get_directories_scanned()
+            ),
+            key=len,
+            reverse=True,
+        )
+
+    def observe(self, change: FileChange, experiment_number: Optional[str]):
+        if change.kind == ADDED:
+            size = change.new["size"]
+        elif change.kind == MODIFIED:
+            size = change.new["size"] - change.old["size"]
+        else:
+            return
+        if size <= 0:
+            return
+        self.added_bytes += size
+        root = _get_root(change.path, self._roots)
+        if root is not None:
+            self.roots_added[root] += size
+        if experiment_number is not None:
+            self.experiments_added[experiment_number] += size
+
+    def finish(self):
+        roots = {
+            root: added
+            for root, added in sorted(self.roots_added.items())
+            if added > self.bytes_threshold
+        }
+        experiments = {
+            experiment: added
+            for experiment, added in self.experiments_added.items()
+            if added > self.bytes_threshold
+        }
+        if roots or experiments:
+            message = self._construct_message(
+                self.old_state, self.new_state, roots, experiments
+            )
+            self._perform_actions(message)
+            return message
+        return {}
+
+
+class FilesShrunkTrigger(BaseTrigger):
+    """Will trigger actions when more than a specified number of
+    modified files lost at least ratio_threshold of their size, which
+    points to truncated files. Messages list the top_number files
+    that lost the most bytes."""
+
+    partial_attributes = (
+        "shrunk_files_number",
+        "shrunk_bytes",
+        "old_modified_bytes",
+        "new_modified_bytes",
+        "experiments_affected",
+        "_largest",
+    )
+
+    def __init__(
+        self,
+        actions: List[BaseAction],
+        ratio_threshold: float = 0.5,
+        number_threshold: int = 0,
+        top_number: int = 10,
+    ):
+        if not 0 < ratio_threshold <= 1:
+            raise ValueError("Shrink ratio threshold needs to be between 0 and 1!")
+        self.ratio_threshold = ratio_threshold
+        self.number_threshold = number_threshold
+        self.top_number = top_number
+        self.actions = actions
+
+    def _construct_message(self, old_state, new_state):
+        return {
+            "title": "Shrunk files detected!",
+            "description": f"There where {self.shrunk_files_number} files that lost at least {self.ratio_threshold:.0%} of their size detected between a scan performed at {new_state.get_date()} and {old_state.get_date()}. There were {len(self.experiments_affected)} experiments affected.",
+            "subject": "Shrunk files detected",
+            "experiments": sorted(self.experiments_affected),
+            "details": {
+                "shrunk_file_number": self.shrunk_files_number,
+                "shrunk_bytes": self.shrunk_bytes,
+                "modified_size_ratio": (
+                    self.new_modified_bytes / self.old_modified_bytes
+                    if self.old_modified_bytes > 0
+                    else None
+                ),
+                "shrunk_files": {
+                    path: lost for lost, path in sorted(self._largest, reverse=True)
+                },
+                "experiments_affected_number": len(self.experiments_affected),
+                "experiments_affected": _get_top(
+                    self.experiments_affected, self.top_number
+                ),
+                "new_directories_scanned": new_state.get_directories_scanned(),
+                "old_directories_scanned": old_state.get_directories_scanned(),
+                "new_date[utc]": str(new_state.get_date()),
+                "old_date[utc": str(old_state.get_date()),
+            },
+        }
+
+    def start(self, old_state: CollectionResult, new_state: CollectionResult):
+        super().start(old_state, new_state)
+        self.shrunk_files_number = 0
+        self.shrunk_bytes = 0
+        self.old_modified_bytes = 0
+        self.new_modified_bytes = 0
+        self.experiments_affected = Counter()
+        # min-heap of the (lost bytes, path) of the files that lost the most
+        self._largest = []
+
+    def observe(self, change: FileChange, experiment_number: Optional[str]):
+        if change.kind != MODIFIED:
+            return
+        old_size = change.old["size"]
+        new_size = change.new["size"]
+        self.old_modified_bytes += old_size
+        self.new_modified_bytes += new_size
+        if old_size == 0 or 1 - new_size / old_size < self.ratio_threshold:
+            return
+        lost = old_size - new_size
+        self.shrunk_files_number += 1
+        self.shrunk_bytes += lost
+        if len(self._largest) < self.top_number:
+            heapq.heappush(self._largest, (lost, change.path))
+        elif self.top_number > 0:
+            heapq.heappushpop(self._largest, (lost, change.path))
+        if experiment_number is not None:
+            self.experiments_affected[experiment_number] += 1
+
+    def reduce(self, partials: List[dict]):
+        super().reduce(partials)
+        self._largest = heapq.nlargest(self.top_number, self._largest)
+        heapq.heapify(self._largest)
+
+    def finish(self):
+        if self.shrunk_files_number > self.number_threshold:
+            message = self._construct_message(self.old_state, self.new_state)
+            self._perform_actions(message)
+            return message
+        return {}
@@ -0,0 +1,442 @@
+"""Long-running watcher that keeps a scan current from inotify events"""
+import os
+import time
+import struct
+import select
+import ctypes
+import ctypes.util
+import logging
+from collections import Counter
+from datetime import datetime
+from typing import List
+from fguard.colllectors import CollectionResult, FlatCollector
+from fguard.experiments import get_experiment_number
+from fguard.aggregates import compute_aggregates
+from fguard.triggers import BaseTrigger, run_triggers
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+    | IN_DONT_FOLLOW
+)
+EVENT = struct.Struct("iIII")
+
+
+class Inotify:
+    """Minimal wrapper of the Linux inotify API"""
+
+    def __init__(self) -> None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not supported on this platform")
+        self._libc = libc
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self._paths = {}
+        self._descriptors = {}
+
+    def add_watch(self, path: str) -> None:
+        descriptor = self._libc.inotify_add_watch(
+            self.fd, os.fsencode(path), WATCH_MASK
+        )
+        if descriptor < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        self._paths[descriptor] = path
+        self._descriptors[path] = descriptor
+
+    def remove_watch(self, path: str) -> None:
+        descriptor = self._descriptors.pop(path, None)
+        if descriptor is not None:
+            self._paths.pop(descriptor, None)
+            # fails harmlessly if the kernel already removed the watch
+            self._libc.inotify_rm_watch(self.fd, descriptor)
+
+    def get_watched(self):
+        return self._descriptors.keys()
+
+    def read_events(self, timeout: float):
+        """Returns (directory, name, mask) of events that arrive within timeout"""
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            descriptor, mask, _, length = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & IN_IGNORED:
+                path = self._paths.pop(descriptor, None)
+                if self._descriptors.get(path) == descriptor:
+                    del self._descriptors[path]
+                continue
+            events.append((self._paths.get(descriptor), name, mask))
+        return events
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class _LiveExperiments:
+    """Experiments of the watched state, maintained from file counts"""
+
+    def __init__(self, counts: Counter) -> None:
+        self.counts = counts
+
+    def get_experiments(self):
+        return self.counts.keys()
+
+    def get_file_counts(self):
+        return dict(self.counts)
+
+
+class Watcher:
+    """Builds an initial scan of the root directories and keeps it current.
+
+    Directories that receive inotify events are marked dirty and rescanned
+    once no event arrived for a debounce period. Triggers are then evaluated
+    on the files that changed in that window. Where inotify cannot be used,
+    e.g. because the watch limit is reached, changes are picked up by periodic
+    incremental rescans, which also repair missed events. The state is
+    periodically written to a scan file."""
+
+    def __init__(
+        self,
+        rootDirectories: List[str],
+        triggers: List[BaseTrigger],
+        output_directory: str = "./",
+        debounce: float = 5.0,
+        max_window: float = 60.0,
+        reconcile_interval: float = 3600.0,
+        checkpoint_interval: float = 3600.0,
+        use_inotify: bool = True,
+        log_level: str = "INFO",
+        workers: int = 1,
+    ) -> None:
+        self.rootDirectories = rootDirectories
+        self.triggers = triggers
+        self.output_directory = output_directory
+        self.debounce = debounce
+        self.max_window = max_window
+        self.reconcile_interval = reconcile_interval
+        self.checkpoint_interval = checkpoint_interval
+        self.workers = workers
+        self.log_level = log_level
+        self.logger = logging.getLogger()
+        # used to rescan single directories
+        self._collector = FlatCollector(rootDirectories, log_level=log_level)
+        self._collector.metrics.start()
+        self._inotify = None
+        if use_inotify:
+            try:
+                self._inotify = Inotify()
+            except OSError as error:
+                self.logger.warning(f" inotify not available, only rescanning: {error}")
+        self._inotify_complete = self._inotify is not None
+        self._files = {}
+        self._directories = {}
+        self._directory_files = {}
+        self._subdirectories = {}
+        self._roots = {}
+        self._experiment_counts = Counter()
+        self._dirty = set()
+        self._before = {}
+        self._needs_reconcile = False
+        # only the newest checkpoint is kept
+        self._checkpoint_path = None
+
+    def _add_watch(self, dirpath):
+        if self._inotify is None:
+            return
+        try:
+            self._inotify.add_watch(dirpath)
+        except OSError as error:
+            if self._inotify_complete:
+                self.logger.warning(
+                    f" Could not watch {dirpath}, relying on rescans: {error}"
+                )
+            self._inotify_complete = False
+
+    def _load_state(self, result: CollectionResult):
+        """Replaces the watched state by a collection result"""
+        self._files = dict(result.get_result())
+        # aggregates are not maintained while watching
+        self._directories = {
+            directory: {"modified_date": directory_info["modified_date"]}
+            for directory, directory_info in result.get_directories().items()
+        }
+        self._directory_files = {directory: set() for directory in self._directories}
+        self._subdirectories = {directory: set() for directory in self._directories}
+        self._experiment_counts = Counter()
+        for filename in self._files:
+            self._directory_files.setdefault(os.path.dirname(filename), set()).add(
+                filename
+            )
+            experiment_number = get_experiment_number(filename)
+            if experiment_number is not None:
+                self._experiment_counts[experiment_number] += 1
+        self._roots = {}
+        for root in self.rootDirectories:
+            self._roots[root] = root
+        for directory in sorted(self._directories):
+            parent = os.path.dirname(directory)
+            if directory not in self._roots:
+                self._subdirectories.setdefault(parent, set()).add(directory)
+                self._roots[directory] = self._roots.get(parent, parent)
+        # synchronize watches
+        if self._inotify is not None:
+            for directory in list(self._inotify.get_watched()):
+                if directory not in self._directories:
+                    self._inotify.remove_watch(directory)
+            for directory in self._directories:
+                if directory not in self._inotify.get_watched():
+                    self._add_watch(directory)
+
+    def get_state(self) -> CollectionResult:
+        """Returns the current state as collection result"""
+        return CollectionResult(
+            self._files,
+            self.rootDirectories,
+            datetime.utcnow(),
+            directories=self._directories,
+        )
+
+    def start(self):
+        """Builds the initial state with a full scan"""
+        collector = FlatCollector(
+            self.rootDirectories, log_level=self.log_level, workers=self.workers
+        )
+        collector.collect_files()
+        self._load_state(collector.get_file_stats())
+        self.logger.info(
+            f" Watching {len(self._directories)} directories with {len(self._files)} files"
+        )
+
+    def _touch(self, filename):
+        """Remembers the state of a file before the current window"""
+        if filename not in self._before:
+            self._before[filename] = self._files.get(filename)
+
+    def _set_file(self, filename, file_info):
+        self._touch(filename)
+        if filename not in self._files:
+            experiment_number = get_experiment_number(filename)
+            if experiment_number is not None:
+                self._experiment_counts[experiment_number] += 1
+        self._files[filename] = file_info
+
+    def _remove_file(self, filename):
+        self._touch(filename)
+        if self._files.pop(filename, None) is not None:
+            experiment_number = get_experiment_number(filename)
+            if experiment_number is not None:
+                self._experiment_counts[experiment_number] -= 1
+                if self._experiment_counts[experiment_number] <= 0:
+                    del self._experiment_counts[experiment_number]
+
+    def _remove_subtree(self, dirpath):
+        for filename in self._directory_files.pop(dirpath, ()):
+            self._remove_file(filename)
+        for subdirectory in self._subdirectories.pop(dirpath, ()):
+            self._remove_subtree(subdirectory)
+        self._directories.pop(dirpath, None)
+        self._roots.pop(dirpath, None)
+        if self._inotify is not None:
+            self._inotify.remove_watch(dirpath)
+
+    def _rescan_directory(self, dirpath):
+        """Lists a directory again and updates the state of its files.
+        New subdirectories are scanned recursively, removed ones are dropped."""
+        root = self._roots.get(dirpath, dirpath)
+        files, subdirectories, directory_info = self._collector._scan_directory(
+            dirpath, root
+        )
+        if directory_info is None:
+            if not os.path.lexists(dirpath):
+                self._remove_subtree(dirpath)
+            return
+        self._directories[dirpath] = directory_info
+        known_files = self._directory_files.setdefault(dirpath, set())
+        for filename in known_files - files.keys():
+            self._remove_file(filename)
+        for filename, file_info in files.items():
+            if self._files.get(filename) != file_info:
+                self._set_file(filename, file_info)
+        self._directory_files[dirpath] = set(files.keys())
+        known_subdirectories = self._subdirectories.setdefault(dirpath, set())
+        for subdirectory in known_subdirectories - set(subdirectories):
+            self._remove_subtree(subdirectory)
+        for subdirectory in subdirectories:
+            if subdirectory not in known_subdirectories:
+                self._roots[subdirectory] = root
+                self._add_watch(subdirectory)
+                self._rescan_directory(subdirectory)
+        self._subdirectories[dirpath] = set(subdirectories)
+
+    def add_events(self, events):
+        """Marks directories that received events as dirty"""
+        for directory, name, mask in events:
+            if mask & IN_Q_OVERFLOW:
+                self._needs_reconcile = True
+            elif directory is not None:
+                if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                    directory = os.path.dirname(directory)
+                self._dirty.add(directory)
+
+    def flush(self) -> List[dict]:
+        """Rescans dirty directories and evaluates triggers on the changes"""
+        started = time.perf_counter()
+        dirty = sorted(self._dirty)
+        self._dirty = set()
+        for dirpath in dirty:
+            if dirpath in self._directories or dirpath in self.rootDirectories:
+                self._rescan_directory(dirpath)
+        old_files = {
+            filename: file_info
+            for filename, file_info in self._before.items()
+            if file_info is not None
+        }
+        new_files = {
+            filename: self._files[filename]
+            for filename in self._before
+            if filename in self._files
+        }
+        self._before = {}
+        self.logger.debug(
+            f" Rescanned {len(dirty)} directories in {time.perf_counter() - started:.2f}s"
+        )
+        if old_files == new_files:
+            return []
+        return self._evaluate(old_files, new_files)
+
+    def _evaluate(self, old_files, new_files, old_date=None):
+        old_state = CollectionResult(
+            old_files, self.rootDirectories, old_date or datetime.utcnow()
+        )
+        new_state = CollectionResult(
+            new_files,
+            self.rootDirectories,
+            datetime.utcnow(),
+            experiments=_LiveExperiments(self._experiment_counts),
+        )
+        return run_triggers(self.triggers, old_state, new_state)
+
+    def reconcile(self) -> List[dict]:
+        """Performs an incremental rescan of all root directories
+        and evaluates triggers on the differences to the watched state"""
+        self._needs_reconcile = False
+        self._dirty = set()
+        self._before = {}
+        old_state = self.get_state()
+        collector = FlatCollector(
+            self.rootDirectories,
+            log_level=self.log_level,
+            workers=self.workers,
+            previous=old_state,
+            incremental=True,
+        )
+        collector.collect_files()
+        new_state = collector.get_file_stats()
+        self._load_state(new_state)
+        return run_triggers(self.triggers, old_state, new_state)
+
+    def checkpoint(self) -> str:
+        """Writes the current state to a scan file, together with
+        the directory aggregates that speed up later checks. The file is
+        written under a temporary name and renamed, the previous checkpoint
+        is removed afterwards, so a single complete checkpoint is kept."""
+        state = self.get_state()
+        directories = compute_aggregates(self._files, self._directories)
+        if directories is not None:
+            state.directories = directories
+        file_path = os.path.join(self.output_directory, state.get_filename())
+        temporary_path = f"{file_path}.tmp"
+        state.to_file(temporary_path)
+        os.replace(temporary_path, file_path)
+        if self._checkpoint_path is not None and self._checkpoint_path != file_path:
+            try:
+                os.remove(self._checkpoint_path)
+            except FileNotFoundError:
+                pass
+        self._checkpoint_path = file_path
+        self.logger.info(f" Wrote checkpoint {file_path}")
+        return file_path
+
+    def read_events(self, timeout: float, stop=None):
+        if self._inotify is not None:
+            return self._inotify.read_events(timeout)
+        if stop is not None:
+            stop.wait(timeout)
+        else:
+            time.sleep(timeout)
+        return []
+
+    def run(self, stop=None):
+        """Watches until stop, a threading.Event, is set"""
+        self.start()
+        now = time.monotonic()
+        next_reconcile = now + self.reconcile_interval
+        next_checkpoint = now + self.checkpoint_interval
+        window_started = None
+        last_event = None
+        while stop is None or not stop.is_set():
+            now = time.monotonic()
+            deadlines = [next_reconcile, next_checkpoint]
+            if window_started is not None:
+                deadlines.append(
+                    min(last_event + self.debounce, window_started + self.max_window)
+                )
+            events = self.read_events(max(0.0, min(deadlines) - now), stop)
+            now = time.monotonic()
+            if events:
+                self.add_events(events)
+                last_event = now
+                if window_started is None:
+                    window_started = now
+            if window_started is not None and (
+                now - last_event >= self.debounce
+                or now - window_started >= self.max_window
+            ):
+                self.flush()
+                window_started = None
+            if self._needs_reconcile or now >= next_reconcile:
+                self.reconcile()
+                next_reconcile = time.monotonic() + self.reconcile_interval
+            if now >= next_checkpoint:
+                self.checkpoint()
+                next_checkpoint = time.monotonic() + self.checkpoint_interval
+        self.checkpoint()
+
+    def close(self):
+        if self._inotify is not None:
+            self._inotify.close()
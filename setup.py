@@ -5,6 +5,7 @@ setup(
     version="0.1",
     py_modules=["fguard"],
     install_requires=["Click", "jinja2"],
+    extras_require={"zstd": ["zstandard"]},
     entry_points="""
         [console_scripts]
         fguard=fguard.cli:cli